@@ -1,3 +1,7 @@
+import os
+import pandas as pd
+
+
 def find_saturation_point(df, wait_epochs, display=True):
     max_ndcg = -1
     max_epoch = -1
@@ -19,3 +23,74 @@ def find_saturation_point(df, wait_epochs, display=True):
     if display:
         print('Saturation epoch={} ndcg@10={}'.format(max_epoch, max_ndcg))
     return df[df['epoch'] == max_epoch], reached_end
+
+
+TABLE_FORMATS = ['csv', 'jsonl']
+
+
+def table_path(export_root, table_name):
+    """
+    path of export_root/tables/<table_name> in whichever format TableLogger wrote it, None if there is none
+    """
+    for table_format in TABLE_FORMATS:
+        path = os.path.join(export_root, 'tables', table_name + '.' + table_format)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def iter_table(path, chunksize=10000):
+    """
+    reads a table written by TableLogger chunk by chunk, yielding DataFrames of at most chunksize rows
+    """
+    if str(path).endswith('.jsonl'):
+        reader = pd.read_json(path, lines=True, chunksize=chunksize, precise_float=True)
+    else:
+        reader = pd.read_csv(path, chunksize=chunksize, float_precision='round_trip')
+    for chunk in reader:
+        yield chunk
+
+
+def read_table(path, chunksize=10000):
+    chunks = list(iter_table(path, chunksize))
+    if not chunks:
+        return pd.read_csv(path, float_precision='round_trip') if not str(path).endswith('.jsonl') else pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
+
+
+def tail_table(path, n=2, chunksize=10000):
+    last = None
+    for chunk in iter_table(path, chunksize):
+        last = chunk if last is None else pd.concat([last, chunk]).iloc[-n:]
+    return last.iloc[-n:] if last is not None else None
+
+
+def find_saturation_point_streaming(path, wait_epochs, display=True, metric_key='NDCG@10', chunksize=10000):
+    """
+    find_saturation_point over a table file, reading it chunk by chunk and stopping at the saturation point
+    """
+    max_ndcg = -1
+    max_epoch = -1
+    saturated = False
+    if display:
+        print('Finding saturation point')
+    for chunk in iter_table(path, chunksize):
+        for epoch, ndcg in zip(chunk['epoch'], chunk[metric_key]):
+            if ndcg > max_ndcg:
+                max_ndcg = ndcg
+                max_epoch = epoch
+            elif epoch - max_epoch >= wait_epochs:
+                saturated = True
+                break
+        if saturated:
+            break
+    if saturated:
+        if display:
+            print('Breaking because there was no improvement for the last {} epochs'.format(wait_epochs))
+    elif display:
+        print('Reached the end of experiment without saturation')
+    if display:
+        print('Saturation epoch={} ndcg@10={}'.format(max_epoch, max_ndcg))
+    #与find_saturation_point一致, 返回整张表中该epoch的所有行, 再过一遍文件;
+    rows = [chunk[chunk['epoch'] == max_epoch] for chunk in iter_table(path, chunksize)]
+    return pd.concat(rows) if rows else None, not saturated
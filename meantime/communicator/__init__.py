@@ -1 +1,2 @@
 from .communicator import Communicator
+from .sync import ExperimentSync, SyncBackend, LocalBackend, SFTPBackend, SYNC_BACKENDS, sync_factory
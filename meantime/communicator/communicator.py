@@ -1,12 +1,12 @@
-import paramiko
+from meantime.config import SYNC_CHANNELS
+from .sync import sync_factory
 
-import os
-from stat import S_ISDIR
-import time
+import paramiko
 
 
 class Communicator:
     def __init__(self, host, port, username, password):
+        self.host, self.port, self.username, self.password = host, port, username, password
         try:
             self.transport = paramiko.Transport((host, port))
             self.transport.connect(None, username, password)
@@ -53,52 +53,21 @@ class Communicator:
             self.ssh.exec_command('mkdir -p ' + remote_dir_path)
             return True
 
+    def sync(self):
+        """
+        delta synchronization over SYNC_CHANNELS separate SFTP sessions, see ExperimentSync
+        """
+        return sync_factory('sftp', SYNC_CHANNELS, host=self.host, port=self.port, username=self.username, password=self.password)
+
     def upload_dir(self, local_dir_path, remote_dir_path):
         assert self._valid()
-        self.create_dir(remote_dir_path)
-        for item in os.listdir(local_dir_path):
-            local_path = os.path.join(local_dir_path, item)
-            remote_path = os.path.join(remote_dir_path, item)
-            if os.path.isfile(local_path):
-                print('UPLOADING {} to {}'.format(local_path, remote_path))
-                while True:
-                    try:
-                        self.sftp.put(local_path, remote_path)
-                        print('UPLOADING SUCESSS')
-                        break
-                    except Exception as e:
-                        print('UPLOADING FAIL:', e)
-                        print('RETRY UPLOADING {} to {}'.format(local_path, remote_path))
-                        time.sleep(3)
-            else:
-                self.upload_dir(local_path, remote_path)
+        with self.sync() as sync:
+            sync.upload_dir(local_dir_path, remote_dir_path)
 
     def download_dir(self, remote_dir_path, local_dir_path):
         assert self._valid()
-        if not os.path.isdir(local_dir_path):
-            os.makedirs(local_dir_path)
-        for item in self.sftp.listdir(remote_dir_path):
-            # print(item, S_ISDIR(item.st_mode))
-            local_path = os.path.join(local_dir_path, item)
-            remote_path = os.path.join(remote_dir_path, item)
-            st_mode = self.sftp.stat(remote_path).st_mode
-            if S_ISDIR(st_mode):
-                self.download_dir(remote_path, local_path)
-            else:
-                if self.different(remote_path, local_path):
-                    print('Downloading {} to {}'.format(remote_path, local_path))
-                    self.sftp.get(remote_path, local_path)
-                    mtime = self.sftp.lstat(remote_path).st_mtime
-                    os.utime(local_path, (mtime, mtime))
-
-    def different(self, remote_path, local_path):
-        if not os.path.isfile(local_path):
-            return True
-        remote_attr = self.sftp.lstat(remote_path)
-        local_stat = os.stat(local_path)
-        # print('Different? {} {} {}=?{} {}=?{}'.format(remote_path, local_path, remote_attr.st_size, local_stat.st_size, remote_attr.st_mtime, local_stat.st_mtime))
-        return remote_attr.st_size != local_stat.st_size or \
-               remote_attr.st_mtime != local_stat.st_mtime
+        with self.sync() as sync:
+            sync.download_dir(remote_dir_path, local_dir_path)
 
     def close(self):
         if self._valid():
@@ -0,0 +1,376 @@
+from abc import *
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from queue import Queue
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+
+
+MANIFEST_FILENAME = '.sync_manifest.json'
+
+
+class SyncBackend(metaclass=ABCMeta):
+    """
+    One channel to the remote side. ExperimentSync opens several of them (one per concurrent transfer), so a
+    backend instance is never used by two threads at once. Remote paths are '/'-separated.
+    """
+
+    @classmethod
+    @abstractmethod
+    def code(cls):
+        pass
+
+    @abstractmethod
+    def put(self, local_path, remote_path):
+        pass
+
+    @abstractmethod
+    def get(self, remote_path, local_path):
+        pass
+
+    @abstractmethod
+    def makedirs(self, remote_dir):
+        pass
+
+    @abstractmethod
+    def read_bytes(self, remote_path):
+        """
+        :return: the content of remote_path, None if it does not exist
+        """
+        pass
+
+    @abstractmethod
+    def write_bytes(self, remote_path, data):
+        pass
+
+    @abstractmethod
+    def walk(self, remote_dir):
+        """
+        :return: [(relative path, size, mtime)] of the files under remote_dir
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class LocalBackend(SyncBackend):
+    """
+    'remote' paths are paths of the local filesystem: a mounted shared folder, or a temporary folder in tests
+    """
+
+    @classmethod
+    def code(cls):
+        return 'local'
+
+    def put(self, local_path, remote_path):
+        self.makedirs(os.path.dirname(remote_path))
+        tmp = remote_path + '.part'
+        shutil.copy2(local_path, tmp)
+        os.replace(tmp, remote_path)
+
+    def get(self, remote_path, local_path):
+        shutil.copy2(remote_path, local_path)
+
+    def makedirs(self, remote_dir):
+        os.makedirs(remote_dir, exist_ok=True)
+
+    def read_bytes(self, remote_path):
+        if not os.path.isfile(remote_path):
+            return None
+        with open(remote_path, 'rb') as f:
+            return f.read()
+
+    def write_bytes(self, remote_path, data):
+        self.makedirs(os.path.dirname(remote_path))
+        tmp = remote_path + '.part'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, remote_path)
+
+    def walk(self, remote_dir):
+        files = []
+        for root, dirs, names in os.walk(remote_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                files.append((os.path.relpath(path, remote_dir).replace(os.sep, '/'), st.st_size, st.st_mtime))
+        return files
+
+
+class SFTPBackend(SyncBackend):
+    """
+    one SSH transport and SFTP session per channel, so concurrent transfers do not share a window
+    """
+
+    @classmethod
+    def code(cls):
+        return 'sftp'
+
+    def __init__(self, host, port, username, password):
+        import paramiko
+        self.transport = paramiko.Transport((host, port))
+        self.transport.connect(None, username, password)
+        self.sftp = paramiko.SFTPClient.from_transport(self.transport)
+
+    def put(self, local_path, remote_path):
+        tmp = remote_path + '.part'
+        self.sftp.put(local_path, tmp)
+        self.sftp.posix_rename(tmp, remote_path)
+        st = os.stat(local_path)
+        self.sftp.utime(remote_path, (st.st_atime, st.st_mtime))
+
+    def get(self, remote_path, local_path):
+        self.sftp.get(remote_path, local_path)
+        mtime = self.sftp.lstat(remote_path).st_mtime
+        os.utime(local_path, (mtime, mtime))
+
+    def makedirs(self, remote_dir):
+        parts = remote_dir.rstrip('/').split('/')
+        for i in range(1, len(parts) + 1):
+            path = '/'.join(parts[:i])
+            if not path:
+                continue
+            try:
+                self.sftp.stat(path)
+            except IOError:
+                self.sftp.mkdir(path)
+
+    def read_bytes(self, remote_path):
+        try:
+            with self.sftp.open(remote_path, 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def write_bytes(self, remote_path, data):
+        tmp = remote_path + '.part'
+        with self.sftp.open(tmp, 'wb') as f:
+            f.write(data)
+        self.sftp.posix_rename(tmp, remote_path)
+
+    def walk(self, remote_dir, prefix=''):
+        files = []
+        for attr in self.sftp.listdir_attr(remote_dir):
+            relpath = prefix + attr.filename
+            if stat.S_ISDIR(attr.st_mode):
+                files.extend(self.walk(remote_dir + '/' + attr.filename, relpath + '/'))
+            else:
+                files.append((relpath, attr.st_size, attr.st_mtime))
+        return files
+
+    def close(self):
+        self.sftp.close()
+        self.transport.close()
+
+
+SYNC_BACKENDS = {c.code(): c for c in [LocalBackend, SFTPBackend]}
+
+
+def sync_factory(code, channels=4, **connection):
+    """
+    sync_factory('sftp', 4, host=HOST, port=PORT, username=USERNAME, password=PASSWORD), sync_factory('local')
+    """
+    return ExperimentSync(partial(SYNC_BACKENDS[code], **connection), channels)
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ExperimentSync():
+    """
+    Delta synchronization of an experiment folder with a remote copy, over `channels` concurrent channels
+    created by create_channel() (a SyncBackend class, or a partial of one with its connection args).
+
+    Both sides keep MANIFEST_FILENAME at their root: relative path -> size, mtime_ns and sha1 of each file.
+    Locally it caches the hashes, so a file whose size and mtime did not change is not read again. Only the files
+    whose hash differs from the remote manifest are transferred, and the remote manifest is written last, so an
+    interrupted upload is resumed by the next one. A failed transfer is retried `retries` times on a new channel
+    with exponential backoff, then the error is raised.
+    """
+
+    def __init__(self, create_channel, channels=4, retries=3, backoff=1.):
+        self.create_channel = create_channel
+        self.channels = max(channels or 1, 1)
+        self.retries = retries
+        self.backoff = backoff
+        self.idle = Queue()
+        self.opened = []
+        self.lock = threading.Lock()
+
+    def upload_dir(self, local_dir, remote_dir):
+        """
+        :return: relative paths of the transferred files
+        """
+        local = self.local_manifest(local_dir)
+        remote = self.remote_manifest(remote_dir)
+        changed = [relpath for relpath, entry in local.items()
+                   if relpath not in remote or remote[relpath].get('sha1') != entry['sha1']]
+        changed.sort(key=lambda p: -local[p]['size']) #大文件先传, 避免最后只剩一个通道在传checkpoint;
+        print('SYNC {} -> {}: {} of {} files changed'.format(local_dir, remote_dir, len(changed), len(local)))
+        self._with_channel(lambda channel: channel.makedirs(remote_dir))
+        self._transfer(changed, lambda channel, relpath: self._upload(channel, local_dir, remote_dir, relpath))
+        data = json.dumps(local, indent=1, sort_keys=True).encode()
+        self._with_channel(lambda channel: channel.write_bytes(self._remote_path(remote_dir, MANIFEST_FILENAME), data))
+        return changed
+
+    def download_dir(self, remote_dir, local_dir):
+        """
+        without a remote manifest (folders uploaded file by file), files are compared by size and mtime
+
+        :return: relative paths of the transferred files
+        """
+        os.makedirs(local_dir, exist_ok=True)
+        local = self.local_manifest(local_dir)
+        remote = self.remote_manifest(remote_dir)
+        if remote:
+            changed = [relpath for relpath, entry in remote.items()
+                       if relpath not in local or local[relpath]['sha1'] != entry['sha1']]
+            changed.sort(key=lambda p: -remote[p]['size'])
+        else:
+            listed = self._with_channel(lambda channel: channel.walk(remote_dir))
+            changed = []
+            for relpath, size, mtime in listed:
+                path = os.path.join(local_dir, relpath)
+                if relpath == MANIFEST_FILENAME or relpath.endswith('.part'):
+                    continue
+                if not os.path.isfile(path) or os.path.getsize(path) != size or os.path.getmtime(path) != mtime:
+                    changed.append(relpath)
+        print('SYNC {} -> {}: {} files changed'.format(remote_dir, local_dir, len(changed)))
+        self._transfer(changed, lambda channel, relpath: self._download(channel, remote_dir, local_dir, relpath))
+        if remote:
+            for relpath in changed: #下载的文件直接记录远端的hash, 不再重新读取;
+                st = os.stat(os.path.join(local_dir, relpath))
+                local[relpath] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': remote[relpath]['sha1']}
+            with open(os.path.join(local_dir, MANIFEST_FILENAME), 'w') as f:
+                json.dump(local, f, indent=1, sort_keys=True)
+        else:
+            self.local_manifest(local_dir)
+        return changed
+
+    def local_manifest(self, local_dir):
+        """
+        hashes the files of local_dir that are new or changed since the last sync and rewrites the local manifest
+        """
+        path = os.path.join(local_dir, MANIFEST_FILENAME)
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+        manifest, stale = {}, []
+        for root, dirs, names in os.walk(local_dir):
+            dirs.sort()
+            for name in sorted(names):
+                file_path = os.path.join(root, name)
+                relpath = os.path.relpath(file_path, local_dir).replace(os.sep, '/')
+                if relpath == MANIFEST_FILENAME or name.endswith('.part'):
+                    continue
+                st = os.stat(file_path)
+                entry = cached.get(relpath)
+                if entry is not None and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+                    manifest[relpath] = entry
+                else:
+                    manifest[relpath] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+                    stale.append(relpath)
+        with ThreadPoolExecutor(self.channels) as pool:  # hashlib释放GIL, 大文件可并行计算;
+            for relpath, sha1 in zip(stale, pool.map(lambda p: file_sha1(os.path.join(local_dir, p)), stale)):
+                manifest[relpath]['sha1'] = sha1
+        if stale or len(manifest) != len(cached):
+            with open(path, 'w') as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+        return manifest
+
+    def remote_manifest(self, remote_dir):
+        data = self._with_channel(lambda channel: channel.read_bytes(self._remote_path(remote_dir, MANIFEST_FILENAME)))
+        if data is None:
+            return {}
+        try:
+            return json.loads(data.decode())
+        except ValueError:
+            return {}
+
+    def close(self):
+        with self.lock:
+            opened, self.opened = self.opened, []
+        for channel in opened:
+            try:
+                channel.close()
+            except Exception:
+                pass
+        self.idle = Queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _remote_path(remote_dir, relpath):
+        return remote_dir.rstrip('/') + '/' + relpath
+
+    def _upload(self, channel, local_dir, remote_dir, relpath):
+        remote_path = self._remote_path(remote_dir, relpath)
+        if '/' in relpath:
+            channel.makedirs(remote_path.rsplit('/', 1)[0])
+        channel.put(os.path.join(local_dir, relpath), remote_path)
+
+    def _download(self, channel, remote_dir, local_dir, relpath):
+        local_path = os.path.join(local_dir, relpath)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        channel.get(self._remote_path(remote_dir, relpath), local_path)
+
+    def _transfer(self, relpaths, func):
+        if not relpaths:
+            return
+        with ThreadPoolExecutor(min(self.channels, len(relpaths))) as pool:
+            jobs = [pool.submit(self._with_channel, lambda channel, p=p: func(channel, p)) for p in relpaths]
+            for job in jobs:
+                job.result()
+
+    def _acquire(self):
+        with self.lock:
+            if self.idle.empty() and len(self.opened) < self.channels:
+                channel = self.create_channel()
+                self.opened.append(channel)
+                return channel
+        return self.idle.get()
+
+    def _discard(self, channel):
+        with self.lock:
+            if channel in self.opened:
+                self.opened.remove(channel)
+        try:
+            channel.close()
+        except Exception:
+            pass
+
+    def _with_channel(self, func):
+        attempt = 0
+        while True:
+            channel = None
+            try:
+                channel = self._acquire()
+                result = func(channel)
+                self.idle.put(channel)
+                return result
+            except Exception as e:
+                if channel is not None:
+                    self._discard(channel)  # 连接可能已断开, 重试时新建通道;
+                if attempt >= self.retries:
+                    raise
+                delay = min(self.backoff * 2 ** attempt, 30)
+                print('SYNC FAIL: {}, retrying in {:.0f}s'.format(e, delay))
+                time.sleep(delay)
+                attempt += 1
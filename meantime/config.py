@@ -25,6 +25,7 @@ USE_WANDB = False
 MACHINE_IS_HOST = True
 HOST, PORT, USERNAME, PASSWORD = None, None, None, None
 REMOTE_ROOT = None
+SYNC_CHANNELS = 4  # concurrent SFTP sessions of an experiment upload/download
 
 # DATA FOLDER
 LOCAL_DATA_FOLDER = './Data'
@@ -1,13 +1,10 @@
 from .base import AbstractDataloader
 from meantime.datasets import dataset_factory
-from meantime.utils import all_subclasses
-from meantime.utils import import_all_subclasses
+from meantime.registry import LazyRegistry
 import pdb
-import_all_subclasses(__file__, __name__, AbstractDataloader)
 
-DATALOADERS = {c.code():c
-               for c in all_subclasses(AbstractDataloader)
-               if c.code() is not None}
+#只导入被选中的类所在的模块, 见registry_index.json;
+DATALOADERS = LazyRegistry(__file__, __name__, AbstractDataloader, 'dataloader')
 
 
 def dataloader_factory(args):
@@ -1,4 +1,5 @@
 from .negative_samplers import negative_sampler_factory
+from meantime.distributed import get_rank, get_world_size
 
 import torch.utils.data as data_utils
 
@@ -84,6 +85,14 @@ class AbstractDataloader(metaclass=ABCMeta):
         shuffle = False
         sampler = CustomRandomSampler(len(dataset), self.sampler_rng) if mode == 'train' else None
         drop_last = True if mode == 'train' else False
+        #多进程训练时每个进程只读取自己的分片, train_batch_size仍是所有进程合计的batch大小;
+        world_size = get_world_size()
+        if world_size > 1:
+            if mode == 'train':
+                sampler = DistributedRandomSampler(len(dataset), self.sampler_rng, get_rank(), world_size)
+                batch_size = max(batch_size // world_size, 1)
+            else:
+                sampler = ShardSampler(len(dataset), get_rank(), world_size)
         # pdb.set_trace()
         dataloader = data_utils.DataLoader(dataset,
                                            batch_size=batch_size,
@@ -101,7 +110,7 @@ class AbstractDataloader(metaclass=ABCMeta):
 
 class CustomRandomSampler(data_utils.Sampler):
     def __init__(self, n, rng):
-        super().__init__(data_source=[]) # dummy
+        #Sampler.__init__不做任何事; torch 1.x要求data_source参数, 新版本不再接受该参数, 因此不调用;
         self.n = n
         self.rng = rng
 
@@ -118,3 +127,46 @@ class CustomRandomSampler(data_utils.Sampler):
 
     def set_rng_state(self, state):
         return self.rng.setstate(state)
+
+
+class DistributedRandomSampler(CustomRandomSampler):
+    """
+    CustomRandomSampler of one of world_size processes: every rank shuffles all indices with its copy of the
+    seeded rng, so the copies stay identical (and the checkpointed rng state is the same on all ranks), drops the
+    last n % world_size of them and takes every world_size-th index starting at its rank. With a per-rank batch
+    size of batch_size // world_size and drop_last, the k-th batches of all ranks together are the k-th batch of
+    CustomRandomSampler; padding instead of dropping could add a last batch that a single process drops.
+    """
+
+    def __init__(self, n, rng, rank, world_size):
+        super().__init__(n, rng)
+        self.rank = rank
+        self.world_size = world_size
+
+    def __len__(self):
+        return self.n // self.world_size
+
+    def __iter__(self):
+        indices = list(range(self.n))
+        self.rng.shuffle(indices)
+        return iter(indices[self.rank:len(self) * self.world_size:self.world_size])
+
+
+class ShardSampler(data_utils.Sampler):
+    """
+    in-order shard of one of world_size processes for evaluation, padded like DistributedRandomSampler so that
+    every rank gets at least one instance; at most world_size - 1 instances are counted twice
+    """
+
+    def __init__(self, n, rank, world_size):
+        self.n = n
+        self.rank = rank
+        self.world_size = world_size
+
+    def __len__(self):
+        return (self.n + self.world_size - 1) // self.world_size
+
+    def __iter__(self):
+        indices = list(range(self.n))
+        indices += indices[:len(self) * self.world_size - self.n]
+        return iter(indices[self.rank::self.world_size])
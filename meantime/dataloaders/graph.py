@@ -9,6 +9,8 @@ from scipy.sparse import csr_matrix
 import scipy.sparse as sp
 from time import time
 import pdb
+from .graph_update import adj_cache_prefix, load_adj, update_adj_cache, save_npz_atomic, clear_adj_versions, load_delta_edges, add_graph_edges, graph_degree
+from meantime.utils import FileLock
 
 class GraphLoader():
     """
@@ -52,6 +54,7 @@ class GraphLoader():
         # train_file = path
         # test_file = path + '/test.txt' #不需要测试集, 在整个数据集中pretrain来获取每个item的表征;
         self.path = path
+        self.item2id = {str(k): v for k, v in item2id.items()} #图文件中是字符串, ml_1m等数据集的smap键是int;
         trainUniqueUsers, trainItem, trainUser = [], [], []
         # testUniqueUsers, testItem, testUser = [], [], []
         self.traindataSize = 0
@@ -63,8 +66,8 @@ class GraphLoader():
                     l = l.strip('\n').split(' ')
                     # items = [int(i) for i in l[1:]]
                     # pdb.set_trace()
-                    items = [int(item2id[i]) for i in l[1:]]
-                    uid = int(item2id[l[0]])
+                    items = [int(self.item2id[i]) for i in l[1:]]
+                    uid = int(self.item2id[l[0]])
                     # if config.rm_self_node:
                     #     items.remove(uid)
                     if config.rm_self_node:
@@ -115,6 +118,9 @@ class GraphLoader():
         self.items_D[self.items_D == 0.] = 1.
         # pre-calculate
         self._allPos = self.getUserPosItems(list(range(self.n_user)))
+        #缓存中最新版本的邻接矩阵包含的增量边, 同样加入R, bpr采样与邻接矩阵一致;
+        for edges in load_delta_edges(adj_cache_prefix(self.path, self.config)):
+            add_graph_edges(self, edges[0], edges[1])
         # self.__testDict = self.__build_test()
         print("Success to create the graph dataloader.")
         # print(f"{world.dataset} is ready to go")
@@ -165,6 +171,35 @@ class GraphLoader():
         data = torch.FloatTensor(coo.data)
         return torch.sparse.FloatTensor(index, data, torch.Size(coo.shape))
         
+    def _build_norm_adj(self):
+        """
+            构建归一化矩阵 D^-1/2 A D^-1/2;
+        """
+        print("generating adjacency matrix. Both Buy and view.")
+        s = time()
+        adj_mat = sp.dok_matrix((self.n_users + self.m_items, self.n_users + self.m_items), dtype=np.float32) #为什么构建(user_num + item_num, user_num + item_num)矩阵;
+        adj_mat = adj_mat.tolil() #convert list of lists format;
+        R = self.UserItemNet.tolil()
+        adj_mat[:self.n_users, self.n_users:] = R
+        adj_mat[self.n_users:, :self.n_users] = R.T
+        adj_mat = adj_mat.todok() #convert dictionary of Keys format;
+        # adj_mat = adj_mat + sp.eye(adj_mat.shape[0])
+
+        rowsum = np.array(adj_mat.sum(axis=1))
+        d_inv = np.power(rowsum, -0.5).flatten()
+        d_inv[np.isinf(d_inv)] = 0.
+        d_mat = sp.diags(d_inv) #(user_num + item_num)
+
+        """
+        乘以两次对角矩阵的原因是分别除以入度的平方根和出度的平方根;
+        """ 
+        norm_adj = d_mat.dot(adj_mat)
+        norm_adj = norm_adj.dot(d_mat)
+        norm_adj = norm_adj.tocsr()
+        end = time()
+        print(f"costing {end-s}s, saved norm_mat...")
+        return norm_adj
+
     def getSparseGraph(self):
         """
             构建归一化矩阵;
@@ -173,35 +208,20 @@ class GraphLoader():
         if self.Graph is None:
             try:
                 # pre_adj_mat = sp.load_npz(self.path + '/s_pre_adj_mat_{}.npz'.format(self.config.model_code))
-                pre_adj_mat = sp.load_npz(self.path + '/s_pre_adj_mat_{}.npz'.format(self.config.experiment_name))
+                pre_adj_mat = load_adj(adj_cache_prefix(self.path, self.config))
                 print("successfully loaded...")
                 norm_adj = pre_adj_mat
             except :
-                print("generating adjacency matrix. Both Buy and view.")
-                s = time()
-                adj_mat = sp.dok_matrix((self.n_users + self.m_items, self.n_users + self.m_items), dtype=np.float32) #为什么构建(user_num + item_num, user_num + item_num)矩阵;
-                adj_mat = adj_mat.tolil() #convert list of lists format;
-                R = self.UserItemNet.tolil()
-                adj_mat[:self.n_users, self.n_users:] = R
-                adj_mat[self.n_users:, :self.n_users] = R.T
-                adj_mat = adj_mat.todok() #convert dictionary of Keys format;
-                # adj_mat = adj_mat + sp.eye(adj_mat.shape[0])
-                
-                rowsum = np.array(adj_mat.sum(axis=1))
-                d_inv = np.power(rowsum, -0.5).flatten()
-                d_inv[np.isinf(d_inv)] = 0.
-                d_mat = sp.diags(d_inv) #(user_num + item_num)
-                
-                """
-                乘以两次对角矩阵的原因是分别除以入度的平方根和出度的平方根;
-                """ 
-                norm_adj = d_mat.dot(adj_mat)
-                norm_adj = norm_adj.dot(d_mat)
-                norm_adj = norm_adj.tocsr()
-                end = time()
-                print(f"costing {end-s}s, saved norm_mat...")
-                # sp.save_npz(self.path + '/s_pre_adj_mat_{}.npz'.format(self.config.model_code), norm_adj)
-                sp.save_npz(self.path + '/s_pre_adj_mat_{}.npz'.format(self.config.experiment_name), norm_adj)
+                prefix = adj_cache_prefix(self.path, self.config)
+                #同时启动的多个run(或prepare)只有一个构建邻接矩阵, 其余等待后加载;
+                with FileLock(prefix + '.lock'):
+                    if os.path.isfile(prefix + '.npz'):
+                        print("loading the adjacency matrix built by a concurrent run...")
+                        norm_adj = load_adj(prefix)
+                    else:
+                        norm_adj = self._build_norm_adj()
+                        clear_adj_versions(prefix) #旧的增量版本基于之前的矩阵, 一并删除;
+                        save_npz_atomic(prefix + '.npz', norm_adj)
 
             if self.split == True:
                 self.Graph = self._split_A_hat(norm_adj)
@@ -212,6 +232,44 @@ class GraphLoader():
                 print("don't split the matrix")
         return self.Graph
 
+    def getItemGraph(self):
+        """
+        N x N 归一化item图 D^-1/2 R D^-1/2, 用于user/item共享embedding的LightGCN (graph_item_propagation);
+        R对称时等于二部图邻接矩阵 [[0, R], [R^T, 0]] 归一化后的右上块, 直接由R构建, 不构建也不缓存 2N x 2N 的矩阵;
+        R不对称时返回None, 退回二部图传播;
+        """
+        R = self.UserItemNet.tocsr()
+        if R.shape[0] != R.shape[1] or (R != R.T).nnz > 0:
+            print('item graph is not symmetric, fall back to bipartite propagation')
+            return None
+        d = np.asarray(R.sum(axis=1), dtype=np.float64).flatten()
+        d_inv = np.power(d, -0.5, where=d > 0, out=np.zeros_like(d))
+        norm_adj = sp.diags(d_inv).dot(R).dot(sp.diags(d_inv)).tocsr()
+        graph = self._convert_sp_mat_to_sp_tensor(norm_adj).coalesce().to(self.config.device)
+        print(f"item-only propagation: {graph._nnz()} nnz instead of {2 * graph._nnz()}")
+        return graph
+
+    def updateSparseGraph(self, delta_file):
+        """
+        增量更新: delta_file与graph_filename格式相同(每行 head neighbor1 neighbor2 ...), 只更新受影响的度与行列,
+        并写入新版本的邻接矩阵缓存, 下一次getSparseGraph读取最新版本;
+        """
+        heads, tails = [], []
+        with open(delta_file) as f:
+            for l in f.readlines():
+                l = l.strip('\n').split(' ')
+                if len(l) > 1:
+                    items = [int(self.item2id[i]) for i in l[1:]]
+                    heads.extend([int(self.item2id[l[0]])] * len(items))
+                    tails.extend(items)
+        prefix = adj_cache_prefix(self.path, self.config)
+        if not os.path.isfile(prefix + '.npz'):
+            self.getSparseGraph() #缓存不存在时先完整构建一次;
+        path = update_adj_cache(prefix, graph_degree(self), self.n_users, heads, tails)
+        add_graph_edges(self, heads, tails) #R, allPos与trainDataSize随邻接矩阵一起更新;
+        self.Graph = None
+        return path
+
     # def __build_test(self):
     #     """
     #     return:
@@ -9,6 +9,8 @@ from scipy.sparse import csr_matrix
 import scipy.sparse as sp
 from time import time
 import pdb
+from .graph_update import adj_cache_prefix, load_adj, update_adj_cache, save_npz_atomic, clear_adj_versions, load_delta_edges, add_graph_edges, graph_degree
+from meantime.utils import FileLock
 
 class GraphLoader():
     """
@@ -53,6 +55,7 @@ class GraphLoader():
         # train_file = path
         # test_file = path + '/test.txt' #不需要测试集, 在整个数据集中pretrain来获取每个item的表征;
         self.path = path
+        self.item2id = {str(k): v for k, v in item2id.items()} #图文件中是字符串, ml_1m等数据集的smap键是int;
         trainUniqueUsers, trainItem, trainUser = [], [], []
         # testUniqueUsers, testItem, testUser = [], [], []
         self.traindataSize = 0
@@ -82,7 +85,7 @@ class GraphLoader():
 
                     rel_id = int(self.rel2id[rel])
                     attribute_id = int(self.attribute2id[attribute])
-                    uid = int(item2id[l[0]])
+                    uid = int(self.item2id[l[0]])
 
                     
                     self.all_head_list.append(uid)
@@ -143,6 +146,9 @@ class GraphLoader():
             else:
                 graph_kge[head].append((self.all_rel_list[i], self.all_tail_list[i]))
         self.graph_kge = graph_kge
+        #缓存中最新版本的邻接矩阵包含的增量三元组, 同样加入R与三元组列表;
+        for edges in load_delta_edges(adj_cache_prefix(self.path, self.config, '_kgat')):
+            self._add_triples(edges[0], edges[1], edges[2])
         # pdb.set_trace()
 
     
@@ -199,6 +205,35 @@ class GraphLoader():
         data = torch.FloatTensor(coo.data)
         return torch.sparse.FloatTensor(index, data, torch.Size(coo.shape))
         
+    def _build_norm_adj(self):
+        """
+            构建归一化矩阵 D^-1/2 A D^-1/2;
+        """
+        print("generating adjacency matrix. Both Buy and view.")
+        s = time()
+        adj_mat = sp.dok_matrix((self.n_users + self.m_items, self.n_users + self.m_items), dtype=np.float32) #为什么构建(user_num + item_num, user_num + item_num)矩阵;
+        adj_mat = adj_mat.tolil() #convert list of lists format;
+        R = self.UserItemNet.tolil()
+        adj_mat[:self.n_users, self.n_users:] = R
+        adj_mat[self.n_users:, :self.n_users] = R.T
+        adj_mat = adj_mat.todok() #convert dictionary of Keys format;
+        # adj_mat = adj_mat + sp.eye(adj_mat.shape[0])
+
+        rowsum = np.array(adj_mat.sum(axis=1))
+        d_inv = np.power(rowsum, -0.5).flatten()
+        d_inv[np.isinf(d_inv)] = 0.
+        d_mat = sp.diags(d_inv) #(user_num + item_num)
+
+        """
+        乘以两次对角矩阵的原因是分别除以入度的平方根和出度的平方根;
+        """ 
+        norm_adj = d_mat.dot(adj_mat)
+        norm_adj = norm_adj.dot(d_mat)
+        norm_adj = norm_adj.tocsr()
+        end = time()
+        print(f"costing {end-s}s, saved norm_mat...")
+        return norm_adj
+
     def getSparseGraph(self):
         """
             构建归一化矩阵;
@@ -208,35 +243,20 @@ class GraphLoader():
         if self.Graph is None:
             try:
                 # pre_adj_mat = sp.load_npz(self.path + '/s_pre_adj_mat_{}.npz'.format(self.config.model_code))
-                pre_adj_mat = sp.load_npz(self.path + '/s_pre_adj_mat_{}_kgat.npz'.format(self.config.experiment_name))
+                pre_adj_mat = load_adj(adj_cache_prefix(self.path, self.config, '_kgat'))
                 print("successfully loaded...")
                 norm_adj = pre_adj_mat
             except :
-                print("generating adjacency matrix. Both Buy and view.")
-                s = time()
-                adj_mat = sp.dok_matrix((self.n_users + self.m_items, self.n_users + self.m_items), dtype=np.float32) #为什么构建(user_num + item_num, user_num + item_num)矩阵;
-                adj_mat = adj_mat.tolil() #convert list of lists format;
-                R = self.UserItemNet.tolil()
-                adj_mat[:self.n_users, self.n_users:] = R
-                adj_mat[self.n_users:, :self.n_users] = R.T
-                adj_mat = adj_mat.todok() #convert dictionary of Keys format;
-                # adj_mat = adj_mat + sp.eye(adj_mat.shape[0])
-                
-                rowsum = np.array(adj_mat.sum(axis=1))
-                d_inv = np.power(rowsum, -0.5).flatten()
-                d_inv[np.isinf(d_inv)] = 0.
-                d_mat = sp.diags(d_inv) #(user_num + item_num)
-                
-                """
-                乘以两次对角矩阵的原因是分别除以入度的平方根和出度的平方根;
-                """ 
-                norm_adj = d_mat.dot(adj_mat)
-                norm_adj = norm_adj.dot(d_mat)
-                norm_adj = norm_adj.tocsr()
-                end = time()
-                print(f"costing {end-s}s, saved norm_mat...")
-                # sp.save_npz(self.path + '/s_pre_adj_mat_{}.npz'.format(self.config.model_code), norm_adj)
-                sp.save_npz(self.path + '/s_pre_adj_mat_{}_kgat.npz'.format(self.config.experiment_name), norm_adj)
+                prefix = adj_cache_prefix(self.path, self.config, '_kgat')
+                #同时启动的多个run(或prepare)只有一个构建邻接矩阵, 其余等待后加载;
+                with FileLock(prefix + '.lock'):
+                    if os.path.isfile(prefix + '.npz'):
+                        print("loading the adjacency matrix built by a concurrent run...")
+                        norm_adj = load_adj(prefix)
+                    else:
+                        norm_adj = self._build_norm_adj()
+                        clear_adj_versions(prefix) #旧的增量版本基于之前的矩阵, 一并删除;
+                        save_npz_atomic(prefix + '.npz', norm_adj)
 
             if self.split == True:
                 self.Graph = self._split_A_hat(norm_adj)
@@ -247,6 +267,42 @@ class GraphLoader():
                 print("don't split the matrix")
         return self.Graph
 
+    def updateSparseGraph(self, delta_file):
+        """
+        增量更新: delta_file与graph_filename_kgat格式相同(每行 head rel attribute), 只更新受影响的度与行列,
+        并写入新版本的邻接矩阵缓存, 下一次getSparseGraph读取最新版本;
+        新的attribute会改变矩阵大小, 需要重新构建;
+        """
+        heads, rels, tails = [], [], []
+        with open(delta_file) as f:
+            for l in f.readlines():
+                l = l.strip('\n').split(' ')
+                if len(l) == 3:
+                    assert l[2] in self.attribute2id, 'Unknown attribute {}, rebuild the adjacency matrix'.format(l[2])
+                    assert l[1] in self.rel2id, 'Unknown relation {}, rebuild the adjacency matrix'.format(l[1])
+                    heads.append(int(self.item2id[l[0]]))
+                    rels.append(int(self.rel2id[l[1]]))
+                    tails.append(int(self.attribute2id[l[2]]))
+        prefix = adj_cache_prefix(self.path, self.config, '_kgat')
+        if not os.path.isfile(prefix + '.npz'):
+            self.getSparseGraph() #缓存不存在时先完整构建一次;
+        path = update_adj_cache(prefix, graph_degree(self), self.n_users, heads, tails, edges=[heads, rels, tails])
+        self._add_triples(heads, rels, tails)
+        self.Graph = None
+        return path
+
+    def _add_triples(self, heads, rels, tails):
+        """
+        增量三元组加入R(及allPos, trainDataSize)与head/rel/tail列表, KGE采样与邻接矩阵一致;
+        """
+        heads, rels, tails = [[int(x) for x in column] for column in (heads, rels, tails)]
+        self.all_head_list.extend(heads)
+        self.all_rel_list.extend(rels)
+        self.all_tail_list.extend(tails)
+        for head, rel, tail in zip(heads, rels, tails):
+            self.graph_kge.setdefault(head, []).append((rel, tail))
+        add_graph_edges(self, heads, tails)
+
 
     # def __build_test(self):
     #     """
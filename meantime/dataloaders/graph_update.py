@@ -0,0 +1,332 @@
+import os
+import re
+import hashlib
+import numpy as np
+import scipy.sparse as sp
+from time import time
+
+
+def adj_cache_prefix(path, config, suffix=''):
+    """
+    prefix of the cached normalized adjacency under graph_path: keyed by experiment_name and, since the graph rows
+    follow the item ids, by item_order (a reordered dataset must not load the adjacency built in the old id space);
+    """
+    order = '-order{}'.format(config.item_order) if config.item_order else ''
+    return '{}/s_pre_adj_mat_{}{}{}'.format(path, config.experiment_name, order, suffix)
+
+
+def _version_files(prefix):
+    """
+    :return: (version, path) of the incremental updates of prefix
+    """
+    folder, name = os.path.split(prefix)
+    pattern = re.compile(re.escape(name) + r'_v(\d+)\.npz$')
+    if not os.path.isdir(folder or '.'):
+        return []
+    return [(int(m.group(1)), os.path.join(folder, filename))
+            for m, filename in ((pattern.match(f), f) for f in os.listdir(folder or '.')) if m]
+
+
+#内容哈希按(路径, 大小, mtime)缓存, 同一文件只读取一次;
+_BASE_HASHES = {}
+
+
+def adj_base_hash(prefix):
+    """
+    content hash of the base adjacency prefix + '.npz'; every update records the hash of the base it was applied to,
+    so a copied or touched base keeps its updates and a rebuilt one (different content) drops them;
+    """
+    path = prefix + '.npz'
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _BASE_HASHES:
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        _BASE_HASHES[key] = sha.hexdigest()
+    return _BASE_HASHES[key]
+
+
+def _valid_versions(prefix):
+    """
+    :return: paths of the updates applied on top of the current base, in order (versions 1, 2, ... recorded with its hash)
+    """
+    if not os.path.isfile(prefix + '.npz'):
+        return []
+    base_hash = adj_base_hash(prefix)
+    paths = dict(_version_files(prefix))
+    valid = []
+    while len(valid) + 1 in paths:
+        path = paths[len(valid) + 1]
+        with np.load(path) as version:
+            if str(version['base_hash']) != base_hash:
+                break
+        valid.append(path)
+    return valid
+
+
+def latest_adj_path(prefix):
+    """
+    cached normalized adjacency: prefix + '.npz' is version 0, every incremental update writes its patch to
+    prefix + '_v{k}.npz' (see update_adj_cache); load_adj merges them. Updates only count on top of the base they
+    were applied to: none without prefix + '.npz', and none recorded with the hash of another base (a rebuilt base
+    invalidates them, see clear_adj_versions).
+
+    :return: (path, version) of the newest artifact, (prefix + '.npz', 0) if there is no update yet
+    """
+    versions = _valid_versions(prefix)
+    if not versions:
+        return prefix + '.npz', 0
+    return versions[-1], len(versions)
+
+
+def load_adj(prefix):
+    """
+    the newest normalized adjacency of prefix: the base with the patches of all valid updates merged in
+    (a later patch overrides the entries of an earlier one);
+    """
+    norm_adj = sp.load_npz(prefix + '.npz').tocsr()
+    versions = _valid_versions(prefix)
+    if not versions:
+        return norm_adj
+    patches = []
+    for path in versions:
+        with np.load(path) as version:
+            patches.append((version['rows'], version['cols'], version['values']))
+    rows, cols, values = [np.concatenate(field)[::-1] for field in zip(*patches)]
+    _, last = np.unique(rows * norm_adj.shape[1] + cols, return_index=True) #反转后第一次出现即最后一个版本;
+    return apply_adj_patch(norm_adj, rows[last], cols[last], values[last])
+
+
+def clear_adj_versions(prefix):
+    """
+    delete the incremental updates of prefix, called whenever prefix + '.npz' is (re)built from the graph file;
+    """
+    for _, path in _version_files(prefix):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_delta_edges(prefix):
+    """
+    :return: the edges of the valid incremental updates of prefix, in order, as saved by update_adj_cache
+        (one int64 array per version, a row per field)
+    """
+    deltas = []
+    for path in _valid_versions(prefix):
+        with np.load(path) as version:
+            deltas.append(version['edges'])
+    return deltas
+
+
+def graph_degree(loader):
+    """
+    degree of the bipartite adjacency of a graph loader's R, computed once and kept up to date by add_graph_edges;
+    """
+    if getattr(loader, '_degree', None) is None:
+        loader._degree = bipartite_degree(loader.UserItemNet)
+    return loader._degree
+
+
+def add_graph_edges(loader, users, items):
+    """
+    add the edges to the R (UserItemNet) of a graph loader and to everything derived from it (positives, degrees,
+    train size, the CSR caches of the vectorized samplers), so that bpr sampling agrees with the updated adjacency;
+    only the rows and degrees of the touched users/items are recomputed.
+    """
+    users = np.asarray(users, dtype=np.int64)
+    items = np.asarray(items, dtype=np.int64)
+    degree = graph_degree(loader)
+    loader.UserItemNet = insert_csr_entries(loader.UserItemNet.tocsr(), users, items, np.ones(len(users)))
+    loader.trainUser = np.concatenate([loader.trainUser, users])
+    loader.trainItem = np.concatenate([loader.trainItem, items])
+    loader.traindataSize += len(users)
+
+    n_users = loader.UserItemNet.shape[0]
+    np.add.at(degree, users, 1)
+    np.add.at(degree, n_users + items, 1)
+    touched_users, touched_items = np.unique(users), np.unique(items)
+    loader.users_D[touched_users] = np.maximum(degree[touched_users], 1)
+    loader.items_D[touched_items] = np.maximum(degree[n_users + touched_items], 1)
+    indptr, indices = loader.UserItemNet.indptr, loader.UserItemNet.indices
+    for user in touched_users:
+        loader._allPos[user] = indices[indptr[user]:indptr[user + 1]].copy()
+    for cache in ['_bpr_csr', '_kg_csr', '_i2i_csr']:
+        if hasattr(loader, cache):
+            delattr(loader, cache)
+
+
+def save_npz_atomic(path, matrix):
+    """
+    sp.save_npz through a temporary file, so that concurrent runs (e.g. the trials of a sweep) never load a half-written adjacency;
+    """
+    tmp = '{}.tmp{}.npz'.format(path[:-len('.npz')] if path.endswith('.npz') else path, os.getpid())
+    sp.save_npz(tmp, matrix)
+    os.replace(tmp, path if path.endswith('.npz') else path + '.npz')
+
+
+def bipartite_degree(UserItemNet):
+    """
+    degree of the (n_users + m_items) bipartite adjacency [[0, R], [R^T, 0]], the same rowsum as in getSparseGraph;
+    """
+    return np.concatenate([np.asarray(UserItemNet.sum(axis=1)).flatten(),
+                           np.asarray(UserItemNet.sum(axis=0)).flatten()]).astype(np.float64)
+
+
+def _lower_bound(indptr, indices, rows, cols):
+    """
+    vectorized binary search in a csr matrix with sorted indices;
+    :return: for every k, the first position of row rows[k] whose column is not smaller than cols[k]
+    """
+    lo = indptr[rows].astype(np.int64)
+    hi = indptr[rows + 1].astype(np.int64)
+    while True:
+        active = lo < hi
+        if not active.any():
+            break
+        mid = (lo + hi) // 2
+        go_right = active & (indices[np.minimum(mid, len(indices) - 1)] < cols)
+        lo = np.where(go_right, mid + 1, lo)
+        hi = np.where(active & ~go_right, mid, hi)
+    return lo
+
+
+def _find_positions(indptr, indices, rows, cols):
+    """
+    :return: positions of (rows[k], cols[k]) in indices/data of a csr matrix with sorted indices, -1 if the entry does not exist
+    """
+    lo = _lower_bound(indptr, indices, rows, cols)
+    found = lo < indptr[rows + 1]
+    found[found] = indices[lo[found]] == cols[found]
+    return np.where(found, lo, -1)
+
+
+def insert_csr_entries(matrix, rows, cols, values):
+    """
+    add values at (rows[k], cols[k]) of a csr matrix: stored entries are updated in place, new entries are inserted
+    into their rows (duplicates summed), without re-sorting or merging the rest of the matrix;
+    """
+    matrix.sort_indices()
+    rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    pos = _find_positions(matrix.indptr, matrix.indices, rows, cols)
+    exist = pos >= 0
+    np.add.at(matrix.data, pos[exist], values[exist])
+    if exist.all():
+        return matrix
+    keys, inverse = np.unique(rows[~exist] * matrix.shape[1] + cols[~exist], return_inverse=True)
+    values = np.bincount(inverse.ravel(), values[~exist])
+    rows, cols = keys // matrix.shape[1], keys % matrix.shape[1]
+    at = _lower_bound(matrix.indptr, matrix.indices, rows, cols)
+    indices = np.insert(matrix.indices, at, cols.astype(matrix.indices.dtype))
+    data = np.insert(matrix.data, at, values.astype(matrix.data.dtype))
+    counts = np.bincount(rows, minlength=matrix.shape[0])
+    indptr = matrix.indptr + np.concatenate([[0], np.cumsum(counts)]).astype(matrix.indptr.dtype)
+    matrix = sp.csr_matrix((data, indices, indptr), shape=matrix.shape)
+    matrix.has_sorted_indices = True
+    return matrix
+
+
+def apply_adj_patch(norm_adj, rows, cols, values):
+    """
+    set the entries (rows[k], cols[k]) of a csr matrix to values[k] ((row, col) pairs unique), inserting the new ones;
+    """
+    norm_adj.sort_indices()
+    pos = _find_positions(norm_adj.indptr, norm_adj.indices, rows, cols)
+    exist = pos >= 0
+    norm_adj.data[pos[exist]] = values[exist]
+    if exist.all():
+        return norm_adj
+    return insert_csr_entries(norm_adj, rows[~exist], cols[~exist], values[~exist])
+
+
+def _row_entries(indptr, rows):
+    """
+    positions and rows of all stored entries of the given csr rows;
+    """
+    starts, ends = indptr[rows], indptr[rows + 1]
+    lengths = ends - starts
+    entry_rows = np.repeat(rows, lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, entry_rows
+
+
+def update_norm_adj(norm_adj, degree, n_users, users, items, weights=None):
+    """
+    Incremental version of getSparseGraph: add the edges (users[k], items[k]) to R and compute the entries of
+    D^-1/2 [[0, R], [R^T, 0]] D^-1/2 that change, without touching the rest of the matrix.
+
+    Only rows/columns whose degree changed are rescaled by sqrt(d_old / d_new); existing edges get the new weight
+    added, and edges that are new to the structure are returned as new entries. The cost is proportional to the
+    entries of the touched rows, not to the size of the graph.
+
+    :param norm_adj: csr (n_users + m_items, n_users + m_items), the current normalized adjacency (not modified)
+    :param degree: (n_users + m_items), degree of the un-normalized adjacency, see bipartite_degree
+    :return: ((rows, cols, values), degree): the new values of the changed entries (apply_adj_patch) and the degree after the update
+    """
+    norm_adj.sort_indices()
+    users = np.asarray(users, dtype=np.int64)
+    items = np.asarray(items, dtype=np.int64) + n_users
+    weights = np.ones(len(users)) if weights is None else np.asarray(weights, dtype=np.float64)
+    num_nodes = norm_adj.shape[0]
+
+    touched = np.unique(np.concatenate([users, items]))
+    new_degree = degree.copy()
+    np.add.at(new_degree, users, weights)
+    np.add.at(new_degree, items, weights)
+    scale = np.ones(num_nodes)
+    nonzero = degree[touched] > 0
+    scale[touched[nonzero]] = np.sqrt(degree[touched[nonzero]] / new_degree[touched[nonzero]])
+
+    indptr, indices, data = norm_adj.indptr, norm_adj.indices, norm_adj.data
+    #被影响的行: 对应元素乘以 s_r * s_c; pos按行升序, 因此有序;
+    pos, rows = _row_entries(indptr, touched)
+    cols = indices[pos].astype(np.int64)
+    values = data[pos] * scale[rows] * scale[cols]
+    #被影响的列: 邻接矩阵对称, (c, r) 与 (r, c) 对应, 只需处理c未被影响的元素(已在上一步处理过的不重复处理);
+    untouched = ~np.isin(cols, touched)
+    mirror = _find_positions(indptr, indices, cols[untouched], rows[untouched])
+    mirror_values = data[mirror] * scale[rows[untouched]]
+
+    #新增的边: w / sqrt(d_r * d_c), 两个方向; 已存在的边都在被影响的行中;
+    edge_rows = np.concatenate([users, items])
+    edge_cols = np.concatenate([items, users])
+    edge_values = np.concatenate([weights, weights]) / np.sqrt(new_degree[edge_rows] * new_degree[edge_cols])
+    edge_pos = _find_positions(indptr, indices, edge_rows, edge_cols)
+    exist = edge_pos >= 0
+    np.add.at(values, np.searchsorted(pos, edge_pos[exist]), edge_values[exist])
+    keys, inverse = np.unique(edge_rows[~exist] * num_nodes + edge_cols[~exist], return_inverse=True)
+    new_values = np.bincount(inverse.ravel(), edge_values[~exist], minlength=len(keys))
+
+    patch_rows = np.concatenate([rows, cols[untouched], keys // num_nodes])
+    patch_cols = np.concatenate([cols, rows[untouched], keys % num_nodes])
+    patch_values = np.concatenate([values, mirror_values, new_values])
+    return (patch_rows, patch_cols, patch_values), new_degree
+
+
+def update_adj_cache(prefix, degree, n_users, users, items, weights=None, edges=None):
+    """
+    apply the delta edges to the newest cached normalized adjacency of prefix and write the next version: only the
+    changed entries (the patch), the hash of the base and the edges (default: users and items), which the loaders
+    replay into their R on the next start (load_delta_edges). Written and read in time proportional to the change,
+    plus loading the current adjacency.
+
+    :param degree: bipartite degree of the adjacency before the update, see graph_degree
+    :return: path of the new version
+    """
+    s = time()
+    norm_adj = load_adj(prefix)
+    _, version = latest_adj_path(prefix)
+    (rows, cols, values), _ = update_norm_adj(norm_adj, degree, n_users, users, items, weights)
+    new_path = '{}_v{}.npz'.format(prefix, version + 1)
+    if edges is None:
+        edges = np.stack([np.asarray(users, dtype=np.int64), np.asarray(items, dtype=np.int64)])
+    tmp = '{}.tmp{}.npz'.format(new_path[:-len('.npz')], os.getpid())
+    np.savez(tmp, base_hash=adj_base_hash(prefix), rows=rows, cols=cols, values=values.astype(norm_adj.dtype),
+             edges=np.asarray(edges, dtype=np.int64))
+    os.replace(tmp, new_path) #版本文件完整写入后才可见;
+    print(f"costing {time()-s}s, {len(users)} new edges, {len(values)} changed entries, saved {new_path}")
+    return new_path
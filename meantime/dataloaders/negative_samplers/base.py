@@ -1,8 +1,13 @@
+from meantime.utils import FileLock, pickle_dump_atomic
+
 from abc import *
 from pathlib import Path
 import pickle
 import pdb
 
+#已加载的负样本, 同datasets.base._LOADED_DATASETS;
+_LOADED_NEGATIVES = {}
+
 
 class AbstractNegativeSampler(metaclass=ABCMeta):
     def __init__(self, user2dict, user_count, item_count, sample_size, seed, save_folder):
@@ -27,14 +32,22 @@ class AbstractNegativeSampler(metaclass=ABCMeta):
         # pdb.set_trace()
         if savefile_path.is_file():
             print('Negatives samples exist. Loading.')
-            negative_samples = pickle.load(savefile_path.open('rb'))
-            return negative_samples
-        print("Negative samples don't exist. Generating.")
-        negative_samples = self.generate_negative_samples()
-        with savefile_path.open('wb') as f:
-            pickle.dump(negative_samples, f)
+            return self._load(savefile_path)
+        with FileLock(str(savefile_path) + '.lock'):
+            if savefile_path.is_file(): #等待期间已由其他进程生成;
+                print('Negatives samples generated by a concurrent run. Loading.')
+                return self._load(savefile_path)
+            print("Negative samples don't exist. Generating.")
+            negative_samples = self.generate_negative_samples()
+            pickle_dump_atomic(negative_samples, savefile_path)
         return negative_samples
 
+    def _load(self, savefile_path):
+        key = (str(savefile_path.resolve()), savefile_path.stat().st_mtime)
+        if key not in _LOADED_NEGATIVES:
+            _LOADED_NEGATIVES[key] = pickle.load(savefile_path.open('rb'))
+        return _LOADED_NEGATIVES[key]
+
     def _get_save_path(self):
         folder = Path(self.save_folder)
         filename = '{}-sample_size{}-seed{}.pkl'.format(self.code(), self.sample_size, self.seed)
@@ -1,11 +1,7 @@
 from .base import AbstractDataset
-from meantime.utils import all_subclasses
-from meantime.utils import import_all_subclasses
-import_all_subclasses(__file__, __name__, AbstractDataset)
-
-DATASETS = {c.code():c
-            for c in all_subclasses(AbstractDataset)
-            if c.code() is not None}
+from meantime.registry import LazyRegistry
+#只导入被选中的类所在的模块, 见registry_index.json;
+DATASETS = LazyRegistry(__file__, __name__, AbstractDataset, 'dataset')
 
 
 def dataset_factory(args):
@@ -1,4 +1,5 @@
 from .utils import *
+from meantime.utils import FileLock, pickle_dump_atomic
 
 from tqdm import tqdm
 from dotmap import DotMap
@@ -13,6 +14,9 @@ from datetime import date
 
 tqdm.pandas()
 
+#已加载的预处理数据, 以(路径, 修改时间)为key; sweep的父进程加载一次, fork出的trial进程共享;
+_LOADED_DATASETS = {}
+
 
 class AbstractDataset(metaclass=ABCMeta):
     def __init__(self, args):
@@ -22,6 +26,7 @@ class AbstractDataset(metaclass=ABCMeta):
         self.min_sc = args.min_sc
         self.split = args.split
         self.local_data_folder = args.local_data_folder
+        self.item_order = args.item_order
 
         assert self.min_uc >= 2, 'Need at least 2 ratings per user for validation and test'
 
@@ -67,8 +72,10 @@ class AbstractDataset(metaclass=ABCMeta):
         else:
             dataset_path = self._get_preprocessed_dataset_path()
         # dataset_path = self._get_preprocessed_dataset_path_test()
-        dataset = pickle.load(dataset_path.open('rb'))
-        return dataset
+        key = (str(dataset_path.resolve()), dataset_path.stat().st_mtime)
+        if key not in _LOADED_DATASETS:
+            _LOADED_DATASETS[key] = pickle.load(dataset_path.open('rb'))
+        return _LOADED_DATASETS[key]
 
     def preprocess(self):
         if self.args.add_side_info_flag:
@@ -80,14 +87,23 @@ class AbstractDataset(metaclass=ABCMeta):
             print('Already preprocessed. Skip preprocessing')
             print(dataset_path)
             return
-        if not dataset_path.parent.is_dir():
-            dataset_path.parent.mkdir(parents=True)
+        dataset_path.parent.mkdir(parents=True, exist_ok=True)
+        #同时启动的多个run(或prepare)只有一个进行预处理, 其余等待后直接加载;
+        with FileLock(str(dataset_path) + '.lock'):
+            if dataset_path.is_file() and self.args.skip_preprocess:
+                print('Preprocessed by a concurrent run. Skip preprocessing')
+                return
+            self._preprocess(dataset_path)
+
+    def _preprocess(self, dataset_path):
         self.maybe_download_raw_dataset()
         # df = self.load_ratings_df()
         df = self.load_ratings_df_from_json()
         df = self.make_implicit(df)
         df = self.filter_triplets(df)
         df, umap, smap = self.densify_index(df)
+        if self.item_order:
+            df, smap = self.reorder_items(df, smap)
         # pdb.set_trace()
         # pdb.set_trace()
         user2dict, train_targets, validation_targets, test_targets = self.split_df(df, len(umap))
@@ -170,7 +186,7 @@ class AbstractDataset(metaclass=ABCMeta):
         
         if self.args.add_behavior_type_neighbor_flag:
             train_file = self.args.graph_path + self.args.graph_filename
-            item2id = smap
+            item2id = {str(k): v for k, v in smap.items()} #图文件中是字符串, ml_1m等数据集的smap键是int;
             item2relItemList = {}
             with open(train_file) as f:
                 for l in f.readlines():
@@ -186,8 +202,10 @@ class AbstractDataset(metaclass=ABCMeta):
                         item2relItemList[uid] = items
             dataset['item2relItemList'] = item2relItemList
 
-        with dataset_path.open('wb') as f:
-            pickle.dump(dataset, f)
+        pickle_dump_atomic(dataset, dataset_path)
+
+        if self.item_order:
+            self.remap_negative_samples(dataset_path.name, umap, smap)
 
     def maybe_download_raw_dataset(self):
         folder_path = self._get_rawdata_folder_path()
@@ -244,6 +262,46 @@ class AbstractDataset(metaclass=ABCMeta):
         df['sid'] = df['sid'].map(smap)
         return df, umap, smap
 
+    def reorder_items(self, df, smap):
+        """
+        按item共现图重新编号item ids, 使邻接矩阵的非零元集中在对角线附近, spmm和embedding查表的访存更连续;
+        图文件、item2id.json均通过smap映射, 因此自动使用新的编号;
+        """
+        print('Reordering items by {}'.format(self.item_order))
+        adj = item_cooccurrence_graph(df, len(smap))
+        perm = item_ordering(adj, self.item_order)
+        for name, graph in [('before', adj), ('after', permute_graph(adj, perm))]:
+            bandwidth, mean_distance = adjacency_bandwidth(graph)
+            print('{} reordering: bandwidth {}, mean |i-j| {:.1f}, propagation {:.2f}ms'.format(
+                name, bandwidth, mean_distance, 1000 * propagation_time(graph)))
+        smap = {s: int(perm[i]) for s, i in smap.items()}
+        df['sid'] = perm[df['sid'].values]
+        return df, smap
+
+    def remap_negative_samples(self, dataset_filename, umap, smap):
+        """
+        未重新编号的目录中已有负样本时, 按原始user/item id映射到新的编号, 保证两种编号下评测使用相同的负样本;
+        """
+        folder = self._get_preprocessed_folder_path()
+        base_folder = folder.with_name(folder.name[:-len('-order{}'.format(self.item_order))])
+        base_dataset_path = base_folder.joinpath(dataset_filename)
+        if not base_dataset_path.is_file():
+            return
+        base_dataset = pickle.load(base_dataset_path.open('rb'))
+        if set(base_dataset['umap']) != set(umap) or set(base_dataset['smap']) != set(smap):
+            print('Preprocessed dataset without item reordering differs. Skip remapping negative samples')
+            return
+        user_map = {base_dataset['umap'][u]: i for u, i in umap.items()}
+        item_map = {base_dataset['smap'][s]: i for s, i in smap.items()}
+        for base_path in base_folder.glob('*-sample_size*-seed*.pkl'):
+            savefile_path = folder.joinpath(base_path.name)
+            if savefile_path.is_file():
+                continue
+            print('Remapping negative samples {}'.format(base_path.name))
+            negative_samples = pickle.load(base_path.open('rb'))
+            negative_samples = {user_map[user]: [item_map[item] for item in items] for user, items in negative_samples.items()}
+            pickle_dump_atomic(negative_samples, savefile_path)
+
     def split_df(self, df, user_count):
         """
         数据集分割为train, valid, test;
@@ -298,6 +356,8 @@ class AbstractDataset(metaclass=ABCMeta):
         preprocessed_root = self._get_preprocessed_root_path()
         folder_name = '{}_min_rating{}-min_uc{}-min_sc{}-split{}' \
             .format(self.code(), self.min_rating, self.min_uc, self.min_sc, self.split)
+        if self.item_order:
+            folder_name += '-order{}'.format(self.item_order)
         return preprocessed_root.joinpath(folder_name)
 
     def _get_preprocessed_dataset_path(self):
@@ -0,0 +1,107 @@
+import argparse
+import pickle
+import numpy as np
+import scipy.sparse as sp
+from tqdm import tqdm
+
+
+def sequence_window_matrices(user2dict, train_targets, item_count, window):
+    """
+    one row per (user, position t) of the training part of every sequence:
+        X[row, s_t] = 1,  Y[row, s_{t+1..t+window}] += 1
+
+    so that (X^T Y)[i, j] counts how often j follows i within `window` steps. Only the training
+    range (items[:end] of train_targets) is used, valid/test targets never enter the graph.
+    """
+    seq_items, seq_offsets = [], [0]
+    for user, end in train_targets:
+        items = np.asarray(user2dict[user]['items'][:end], dtype=np.int64)
+        seq_items.append(items)
+        seq_offsets.append(seq_offsets[-1] + len(items))
+    seq_items = np.concatenate(seq_items) if seq_items else np.zeros(0, dtype=np.int64)
+    seq_offsets = np.asarray(seq_offsets, dtype=np.int64)
+    seq_end = np.repeat(seq_offsets[1:], np.diff(seq_offsets)) #每个位置所在序列的结束位置;
+
+    positions = np.arange(len(seq_items))
+    rows, cols = [], []
+    for k in range(1, window + 1):
+        valid = positions + k < seq_end
+        rows.append(positions[valid])
+        cols.append(seq_items[positions[valid] + k])
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+
+    shape = (len(seq_items), item_count + 1)
+    X = sp.csr_matrix((np.ones(len(seq_items), dtype=np.float32), (positions, seq_items)), shape=shape)
+    Y = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=shape)
+    return X, Y
+
+
+def top_neighbors(counts, min_count, topk):
+    """
+    :param counts: csr (chunk_items, item_count + 1)
+    :return: list of neighbor id arrays, count >= min_count, at most topk per item, sorted by count (desc) then id
+    """
+    neighbors = []
+    for r in range(counts.shape[0]):
+        start, end = counts.indptr[r], counts.indptr[r + 1]
+        cols, values = counts.indices[start:end], counts.data[start:end]
+        keep = values >= min_count
+        cols, values = cols[keep], values[keep]
+        order = np.lexsort((cols, -values))[:topk]
+        neighbors.append(cols[order])
+    return neighbors
+
+
+def build_cooccurrence_graph(dataset, output_path, window=3, min_count=1, topk=50, items_per_chunk=4096, self_loop=True):
+    """
+    Windowed item co-occurrence graph from the user sequences of dataset.pkl.
+
+    The count matrix is never materialized as item x item: rows are computed in chunks of items_per_chunk,
+    C[B, :] = X[:, B]^T Y + Y[:, B]^T X (both directions), thresholded and cut to top-k before the next chunk.
+
+    output_path is written in the format of graph_filename: one line per item, original item ids,
+    "item [item] neighbor_1 ... neighbor_k", which is read by GraphLoader and, through
+    add_behavior_type_neighbor_flag, becomes dataset['item2relItemList'] for sas_behavior_rel.
+    """
+    smap = dataset['smap']
+    id2item = {i: s for s, i in smap.items()}
+    item_count = len(smap)
+    X, Y = sequence_window_matrices(dataset['user2dict'], dataset['train_targets'], item_count, window)
+    X_csc, Y_csc = X.tocsc(), Y.tocsc()
+
+    edge_number = 0
+    with open(output_path, 'w') as w_f:
+        for start in tqdm(range(1, item_count + 1, items_per_chunk)):
+            end = min(start + items_per_chunk, item_count + 1)
+            counts = X_csc[:, start:end].T.tocsr().dot(Y) + Y_csc[:, start:end].T.tocsr().dot(X)
+            counts = counts.tocsr()
+            rows = np.repeat(np.arange(start, end), np.diff(counts.indptr))
+            counts.data[counts.indices == rows] = 0 #删除自身共现, 自连边由self_loop控制;
+            counts.eliminate_zeros()
+            counts.sort_indices()
+            for offset, neighbors in enumerate(top_neighbors(counts, min_count, topk)):
+                item = start + offset
+                if len(neighbors) == 0 and not self_loop:
+                    continue
+                data = [id2item[item]] if not self_loop else [id2item[item], id2item[item]]
+                data.extend(id2item[int(i)] for i in neighbors)
+                edge_number += len(neighbors)
+                w_f.write(" ".join(str(x) for x in data) + '\n') #ml_1m等数据集的smap键是int;
+    print("items: {}, edges: {}, mean degree: {:.2f}".format(item_count, edge_number, edge_number / max(item_count, 1)))
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset_path', type=str, required=True, help='preprocessed dataset.pkl')
+    parser.add_argument('--output_path', type=str, required=True, help='graph file, used as graph_path + graph_filename')
+    parser.add_argument('--window', type=int, default=3, help='items within this many steps co-occur')
+    parser.add_argument('--min_count', type=int, default=1, help='drop pairs that co-occur less often')
+    parser.add_argument('--topk', type=int, default=50, help='neighbors kept per item')
+    parser.add_argument('--items_per_chunk', type=int, default=4096, help='item rows computed at once, bounds memory')
+    parser.add_argument('--no_self_loop', action='store_true', help='do not write the self edge of every item')
+    args = parser.parse_args()
+
+    dataset = pickle.load(open(args.dataset_path, 'rb'))
+    build_cooccurrence_graph(dataset, args.output_path, args.window, args.min_count, args.topk,
+                             args.items_per_chunk, not args.no_self_loop)
@@ -0,0 +1,186 @@
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
+from dotmap import DotMap
+
+import socket
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized() and dist.get_world_size() > 1
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    return get_rank() == 0
+
+
+def launch(fn, conf, world_size, port=None):
+    """
+    Runs fn(DotMap(conf)) in world_size processes of this machine joined in a gloo process group, each with
+    an equal share of the torch threads. Returns when all of them finished; an error in one of them is raised.
+    """
+    port = port or _free_port()
+    threads = max(torch.get_num_threads() // world_size, 1)
+    mp.spawn(_run, args=(fn, conf, world_size, port, threads), nprocs=world_size, join=True)
+
+
+def _run(rank, fn, conf, world_size, port, threads):
+    torch.set_num_threads(threads)
+    dist.init_process_group('gloo', init_method='tcp://127.0.0.1:{}'.format(port), rank=rank, world_size=world_size)
+    try:
+        fn(DotMap(conf, _dynamic=False))
+    finally:
+        dist.destroy_process_group()
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def average_gradients(parameters, bucket_size=25 << 20):
+    """
+    Averages the gradients of parameters over the processes, in flat buckets of bucket_size bytes (what
+    DistributedDataParallel does after backward). Call it on every rank between backward and optimizer.step, with
+    the parameters in the same order. A parameter without gradient on some ranks gets zeros there; one without
+    gradient on every rank keeps None, so the optimizer still skips it.
+    """
+    if not is_distributed():
+        return
+    params, seen = [], set()
+    for p in parameters:
+        if p.requires_grad and id(p) not in seen:
+            seen.add(id(p))
+            params.append(p)
+    present = torch.tensor([float(p.grad is not None) for p in params])
+    dist.all_reduce(present)
+    grads = []
+    for p, n in zip(params, present.tolist()):
+        if n == 0:
+            continue
+        if p.grad is None:
+            p.grad = torch.zeros_like(p)
+        elif p.grad.is_sparse:
+            p.grad = p.grad.to_dense()
+        grads.append(p.grad)
+
+    buckets, size = [[]], 0
+    for g in grads:
+        if buckets[-1] and (g.dtype != buckets[-1][0].dtype or size >= bucket_size):
+            buckets.append([])
+            size = 0
+        buckets[-1].append(g)
+        size += g.numel() * g.element_size()
+    for bucket in buckets:
+        if not bucket:
+            continue
+        flat = _flatten_dense_tensors(bucket)
+        dist.all_reduce(flat)
+        flat /= get_world_size()
+        for grad, reduced in zip(bucket, _unflatten_dense_tensors(flat, bucket)):
+            grad.copy_(reduced)
+
+
+def broadcast_module(module, src=0):
+    """
+    parameters and buffers of rank src on every rank
+    """
+    if not is_distributed():
+        return
+    for tensor in module.state_dict().values():
+        dist.broadcast(tensor, src)
+
+
+def broadcast_flag(flag, src=0):
+    if not is_distributed():
+        return flag
+    t = torch.tensor([int(bool(flag))])
+    dist.broadcast(t, src)
+    return bool(t.item())
+
+
+def broadcast_indices(tensors, src=0):
+    """
+    rank src's 1-d index tensors of equal length (e.g. sampled graph triples) on every rank, as long tensors;
+    the other ranks pass None.
+    """
+    if not is_distributed():
+        return tensors
+    if get_rank() == src:
+        stacked = torch.stack([t.long() for t in tensors])
+        shape = torch.tensor(list(stacked.shape))
+    else:
+        shape = torch.zeros(2, dtype=torch.long)
+    dist.broadcast(shape, src)
+    if get_rank() != src:
+        stacked = torch.empty(*shape.tolist(), dtype=torch.long)
+    dist.broadcast(stacked, src)
+    return tuple(stacked.unbind(0))
+
+
+def shard(*tensors):
+    """
+    this rank's rows of a minibatch; batches smaller than the world size are used whole by every rank
+    """
+    world_size = get_world_size()
+    if world_size == 1 or len(tensors[0]) < world_size:
+        return tensors
+    rank = get_rank()
+    return tuple(t[rank::world_size] for t in tensors)
+
+
+def all_reduce_meters(average_meter_set):
+    """
+    sums and counts of the meters over the processes, so that every rank logs (and decides on) the same averages;
+    all ranks must hold the same meter names
+    """
+    if not is_distributed():
+        return average_meter_set
+    names = sorted(average_meter_set.meters)
+    t = torch.tensor([[float(average_meter_set.meters[k].sum), float(average_meter_set.meters[k].count)] for k in names], dtype=torch.float64).view(-1, 2)
+    dist.all_reduce(t)
+    for k, (s, n) in zip(names, t.tolist()):
+        meter = average_meter_set.meters[k]
+        meter.sum, meter.count = s, n
+        meter.avg = s / n if n else 0
+    return average_meter_set
+
+
+def all_reduce_sum(value):
+    if not is_distributed():
+        return value
+    t = torch.tensor([float(value)], dtype=torch.float64)
+    dist.all_reduce(t)
+    return type(value)(t.item())
+
+
+def all_gather_values(values):
+    """
+    concatenation of the per-rank lists of floats, in rank order
+    """
+    if not is_distributed():
+        return list(values)
+    n = torch.tensor([len(values)])
+    sizes = [torch.zeros_like(n) for _ in range(get_world_size())]
+    dist.all_gather(sizes, n)
+    width = max(int(s.item()) for s in sizes)
+    padded = torch.zeros(width, dtype=torch.float64)
+    padded[:len(values)] = torch.tensor([float(v) for v in values], dtype=torch.float64)
+    gathered = [torch.zeros_like(padded) for _ in range(get_world_size())]
+    dist.all_gather(gathered, padded)
+    return [v for t, s in zip(gathered, sizes) for v in t[:int(s.item())].tolist()]
+
+
+def barrier():
+    if is_distributed():
+        dist.barrier()
@@ -1,17 +1,135 @@
-from meantime.config import RECENT_STATE_DICT_FILENAME, BEST_STATE_DICT_FILENAME, USE_WANDB
+from meantime.config import RECENT_STATE_DICT_FILENAME, BEST_STATE_DICT_FILENAME, STATE_DICT_KEY, USE_WANDB
+from meantime.analyze_table import tail_table
 
 import torch
-import wandb
 import pandas as pd
 
 import os
+import csv
+import json
+import gzip
+import time
+import atexit
+import threading
 from abc import ABCMeta, abstractmethod
 from pathlib import Path
 import pdb
 
 
-def save_state_dict(state_dict, path, filename):
-    torch.save(state_dict, os.path.join(path, filename))
+def _wandb():
+    import wandb  # imported on first use, it takes a while and most runs do not log to wandb
+    return wandb
+
+
+def save_state_dict(state_dict, path, filename, writer=None):
+    if writer is not None:
+        writer.write(state_dict, path, filename)
+    else:
+        torch.save(state_dict, os.path.join(path, filename))
+
+
+class AsyncCheckpointWriter(object):
+    """
+    Writes state dicts in a background thread, so validation only pays for copying the tensors to host memory.
+
+    write() snapshots the state (every tensor copied to cpu, floating model weights cast to dtype if given) and
+    queues it; a newer write to the same file replaces a queued one that has not started yet. Files are written
+    to a temporary name and renamed, so readers never see a partial file. A snapshot that is already on disk
+    under another name (best == recent, the two loggers receive the same state dict) is hardlinked instead of
+    serialized again. compress gzips the files, read them with meantime.utils.load_state_dict.
+    """
+
+    def __init__(self, dtype=None, compress=False):
+        self.dtype = dtype
+        self.compress = compress
+        self.cond = threading.Condition()
+        self.pending = {}  # path -> (snapshot id, snapshot)
+        self.order = []
+        self.busy = False
+        self.on_disk = {}  # path -> snapshot id of the file content
+        self.last_source, self.last_keys, self.last_snapshot = None, None, None
+        self.num_snapshots = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def snapshot(self, state_dict):
+        #同一个state dict (RecentModelLogger与BestModelLogger在同一次log_val中收到的) 只拷贝一次;
+        if state_dict is self.last_source and list(state_dict.keys()) == self.last_keys:
+            return self.last_snapshot
+        self.num_snapshots += 1
+        snapshot = (self.num_snapshots, self._copy(state_dict, False))
+        self.last_source, self.last_keys, self.last_snapshot = state_dict, list(state_dict.keys()), snapshot
+        return snapshot
+
+    def _copy(self, value, is_model):
+        if isinstance(value, dict):
+            return {k: self._copy(v, is_model or k == STATE_DICT_KEY) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return type(value)(self._copy(v, is_model) for v in value)
+        if torch.is_tensor(value):
+            value = value.detach().to('cpu', copy=True)
+            if is_model and self.dtype is not None and value.is_floating_point():
+                value = value.to(self.dtype)
+            return value
+        return value
+
+    def write(self, state_dict, path, filename):
+        snapshot = self.snapshot(state_dict)
+        with self.cond:
+            self._raise()
+            filepath = os.path.join(path, filename)
+            if filepath not in self.pending:
+                self.order.append(filepath)
+            self.pending[filepath] = snapshot
+            self.cond.notify_all()
+
+    def flush(self):
+        """
+        blocks until every queued write is on disk, call before reading the files back
+        """
+        with self.cond:
+            while self.order or self.busy:
+                self.cond.wait()
+            self._raise()
+
+    def _raise(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError('Writing a checkpoint failed') from error
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.order:
+                    self.cond.wait()
+                filepath = self.order.pop(0)
+                snapshot_id, state = self.pending.pop(filepath)
+                linked = [p for p, i in self.on_disk.items() if i == snapshot_id and p != filepath and os.path.isfile(p)]
+                self.busy = True
+            try:
+                tmp = filepath + '.tmp'
+                if linked:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                    os.link(linked[0], tmp)
+                elif self.compress:
+                    with gzip.open(tmp, 'wb', compresslevel=1) as f:
+                        torch.save(state, f)
+                else:
+                    torch.save(state, tmp)
+                os.replace(tmp, filepath) #改名后旧文件的硬链接不受影响;
+                error = None
+            except Exception as e:
+                error = e
+            with self.cond:
+                if error is None:
+                    self.on_disk[filepath] = snapshot_id
+                else:
+                    self.on_disk.pop(filepath, None)
+                    self.error = error
+                self.busy = False
+                self.cond.notify_all()
 
 
 class LoggerService(object):
@@ -30,7 +148,7 @@ class LoggerService(object):
             resume_training = args.resume_training
 
             assert project_name is not None and run_name is not None and run_id is not None
-            wandb.init(project=project_name, name=run_name, config=args, id=run_id, resume=resume_training)
+            _wandb().init(project=project_name, name=run_name, config=args, id=run_id, resume=resume_training)
 
     def complete(self, log_data):
         for logger in self.train_loggers:
@@ -63,12 +181,13 @@ class AbstractBaseLogger(metaclass=ABCMeta):
 
 
 class RecentModelLogger(AbstractBaseLogger):
-    def __init__(self, checkpoint_path, filename=RECENT_STATE_DICT_FILENAME):
+    def __init__(self, checkpoint_path, filename=RECENT_STATE_DICT_FILENAME, writer=None):
         self.checkpoint_path = checkpoint_path
         if not os.path.exists(self.checkpoint_path):
             os.mkdir(self.checkpoint_path)
         self.recent_epoch = None
         self.filename = filename
+        self.writer = writer
 
     def log(self, *args, **kwargs):
         epoch = kwargs['epoch']
@@ -77,14 +196,14 @@ class RecentModelLogger(AbstractBaseLogger):
             self.recent_epoch = epoch
             state_dict = kwargs['state_dict']
             state_dict['epoch'] = kwargs['epoch']
-            save_state_dict(state_dict, self.checkpoint_path, self.filename + '_' + kwargs['train_type'])
+            save_state_dict(state_dict, self.checkpoint_path, self.filename + '_' + kwargs['train_type'], self.writer)
 
     def complete(self, *args, **kwargs):
-        save_state_dict(kwargs['state_dict'], self.checkpoint_path, self.filename + '_' + kwargs['train_type'] + '.final')
+        save_state_dict(kwargs['state_dict'], self.checkpoint_path, self.filename + '_' + kwargs['train_type'] + '.final', self.writer)
 
 
 class BestModelLogger(AbstractBaseLogger):
-    def __init__(self, checkpoint_path, metric_key='NDCG@10', filename=BEST_STATE_DICT_FILENAME):
+    def __init__(self, checkpoint_path, metric_key='NDCG@10', filename=BEST_STATE_DICT_FILENAME, writer=None):
         self.checkpoint_path = checkpoint_path
         if not os.path.exists(self.checkpoint_path):
             os.mkdir(self.checkpoint_path)
@@ -93,6 +212,7 @@ class BestModelLogger(AbstractBaseLogger):
         self.metric_key = metric_key
         self.filename = filename
         self.train_type = ''
+        self.writer = writer
 
     def log(self, *args, **kwargs):
         self.train_type = kwargs['train_type']
@@ -100,7 +220,7 @@ class BestModelLogger(AbstractBaseLogger):
         if self.best_metric < current_metric:
             print("Update Best {} Model at {}".format(self.metric_key, kwargs['epoch']))
             self.best_metric = current_metric
-            save_state_dict(kwargs['state_dict'], self.checkpoint_path, self.filename + '_' + kwargs['train_type'] + '_best')
+            save_state_dict(kwargs['state_dict'], self.checkpoint_path, self.filename + '_' + kwargs['train_type'] + '_best', self.writer)
 
     def filepath(self):
         return os.path.join(self.checkpoint_path, self.filename + '_' + self.train_type + '_best')
@@ -126,33 +246,51 @@ class WandbLogger(AbstractBaseLogger):
                 log_dict[k] = v
             else:
                 log_dict[self.prefix + k] = v
-        wandb.log(log_dict, step=step)
+        _wandb().log(log_dict, step=step)
 
     def complete(self, *args, **kwargs):
         for table_logger in self.table_loggers:
             table_logger.complete(**kwargs)
-        wandb.log({})  # so that the last log is not missing
+        _wandb().log({})  # so that the last log is not missing
 
 
 class WandbTableLogger(AbstractBaseLogger):
+    """
+    Logs each table row once: the rows added since the previous log go up as a small table under table_name,
+    the full table only once at complete(). Re-uploading the whole table on every row grows quadratically.
+    """
+
     def __init__(self, table_name, table_columns):
         self.table_name = table_name
         self.table_columns = table_columns
         self.table_rows = []
+        self.num_logged = 0
 
     def log(self, *args, **kwargs):
         row = [kwargs[col] for col in self.table_columns]
         self.table_rows.append(row)
-        table = wandb.Table(columns=self.table_columns,
+        table = _wandb().Table(columns=self.table_columns,
+                            data=self.table_rows[self.num_logged:])
+        self.num_logged = len(self.table_rows)
+        _wandb().log({self.table_name: table}, commit=False)  # final commit is done at WandbLogger
+
+    def complete(self, *args, **kwargs):
+        table = _wandb().Table(columns=self.table_columns,
                             data=self.table_rows)
-        wandb.log({self.table_name: table}, commit=False)  # final commit is done at WandbLogger
+        _wandb().log({self.table_name + '_full': table}, commit=False)
 
 
 class TableLoggersManager(AbstractBaseLogger):
-    def __init__(self, args=None, export_root=None, table_definitions=[]):
+    def __init__(self, args=None, export_root=None, table_definitions=[], buffered=False):
+        """
+        :param buffered: buffer the rows (train tables); val/test tables are written at every row, so a killed job
+            keeps every validated epoch and resuming finds val_log consistent with the saved best model
+        """
         self.table_loggers = []
+        table_format = (args.get('table_format') if args is not None else None) or 'csv'
+        flush_rows = 100 if buffered else 1
         for table_name, table_columns in table_definitions:
-            self.table_loggers.append(TableLogger(args, export_root, table_name, table_columns))
+            self.table_loggers.append(TableLogger(args, export_root, table_name, table_columns, table_format=table_format, flush_rows=flush_rows))
 
     def log(self, *args, **kwargs):
         for table_logger in self.table_loggers:
@@ -164,37 +302,64 @@ class TableLoggersManager(AbstractBaseLogger):
 
 
 class TableLogger(AbstractBaseLogger):
-    def __init__(self, args, export_root, table_name, table_columns):
+    """
+    Appends rows to export_root/tables/<table_name>.csv, or to a .jsonl file with one json object per row.
+
+    Rows are appended every flush_rows rows (every row by default) or flush_secs seconds, at complete() and at
+    interpreter exit, so a row costs O(1) however long the table is. A resumed run appends to the existing
+    file, otherwise the first flush truncates it. Read the files with meantime.analyze_table.read_table/iter_table.
+    """
+
+    def __init__(self, args, export_root, table_name, table_columns, table_format='csv', flush_rows=1, flush_secs=10):
         self.args = args
-        self.filepath = Path(export_root).joinpath('tables').joinpath(table_name + '.csv')
+        self.table_format = table_format
+        self.filepath = Path(export_root).joinpath('tables').joinpath(table_name + '.' + table_format)
         self.table_name = table_name
         self.table_columns = table_columns
-        self.table_rows = []
+        self.buffer = []
+        self.flush_rows = flush_rows
+        self.flush_secs = flush_secs
+        self.last_flush = time.time()
+        self.append = False
         if self.args.resume_training:
             self.recover()
+        atexit.register(self.flush)
 
     def recover(self):
         if os.path.exists(self.filepath):
             print('Recovering', self.filepath)
-            df = pd.read_csv(self.filepath)
-            rows = df.values.tolist()
             print('last 2 rows')
-            print(rows[-2:])
-            self.table_rows = rows
+            print(tail_table(self.filepath, 2).values.tolist())
+            self.append = True
 
     def log(self, *args, **kwargs):
         row = [kwargs[col] for col in self.table_columns]
-        self.table_rows.append(row)
-        # save table offline
+        self.buffer.append(row)
+        if len(self.buffer) >= self.flush_rows or time.time() - self.last_flush >= self.flush_secs:
+            self.flush()
+
+    def flush(self, force=False):
+        """
+        appends the buffered rows; force writes the header of a table without rows
+        """
+        if not self.buffer and not (force and not self.append):
+            return
         if not self.filepath.parent.is_dir():
-            self.filepath.parent.mkdir(parents=True)
-        df = pd.DataFrame(self.table_rows, columns=self.table_columns)
-        df.to_csv(self.filepath, index=False)
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.filepath, 'a' if self.append else 'w', newline='') as f:
+            if self.table_format == 'jsonl':
+                for row in self.buffer:
+                    f.write(json.dumps(dict(zip(self.table_columns, row)), default=float) + '\n')
+            else:
+                writer = csv.writer(f)
+                if not self.append:
+                    writer.writerow(self.table_columns)
+                writer.writerows(self.buffer)
+        self.append = True
+        self.buffer = []
+        self.last_flush = time.time()
 
     def complete(self, *args, **kwargs):
         # save table offline
-        if not self.filepath.parent.is_dir():
-            self.filepath.parent.mkdir(parents=True)
         print('saving table to', self.filepath)
-        df = pd.DataFrame(self.table_rows, columns=self.table_columns)
-        df.to_csv(self.filepath, index=False)
+        self.flush(force=True)
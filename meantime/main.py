@@ -1,5 +1,7 @@
 from meantime.options import parse_args
 from meantime.top.training import main as training_main
+from meantime.top.sweep import main as sweep_main
+from meantime.top.prepare import main as prepare_main
 
 from dotmap import DotMap
 
@@ -14,5 +16,9 @@ def main(sys_argv: List[str] = None):
     args = DotMap(conf, _dynamic=False)
     if args.meta == 'training':
         training_main(args)
+    elif args.meta == 'sweep':
+        sweep_main(args)
+    elif args.meta == 'prepare':
+        prepare_main(args)
     else:
         raise ValueError
@@ -14,6 +14,7 @@ class KGAT(BertBaseModel):
         self.config = config
         self.dataset = dataset  #dataloader.BasicDataset
         self.__init_weight()
+        self.subgraph_sampler = None #设置后, bpr训练只在batch的k-hop子图上传播, 见SubgraphSampler;
 
     def __init_weight(self):
         self.num_users  = self.dataset.n_users
@@ -83,6 +84,9 @@ class KGAT(BertBaseModel):
         self.all_rel_tensor = torch.Tensor(self.all_rel_list ).long().to(dtype=torch.long, device=self.config.device)
         self.all_tail_tensor = torch.Tensor(self.all_tail_list ).long().to(dtype=torch.long, device=self.config.device)
 
+        #attention邻接矩阵的索引只由三元组决定, 预先计算一次, updateAttentionScore时只更新values;
+        self.__init_attention_index()
+
 
         self.W_graph_para_1 = nn.ModuleList([nn.Linear(self.latent_dim, self.latent_dim) for _ in range(self.n_layers)])
         self.W_graph_para_2 = nn.ModuleList([nn.Linear(self.latent_dim, self.latent_dim) for _ in range(self.n_layers)])
@@ -92,6 +96,25 @@ class KGAT(BertBaseModel):
         print(f"lgn is already to go(dropout:{self.config.graph_dropout})")
 
 
+    def __init_attention_index(self):
+        """
+        Precompute the coalesced index pattern of the symmetric (|U|+|V|, |U|+|V|) attention adjacency.
+        Triples sharing the same (head, tail) are merged into one edge, as csr_matrix does.
+        """
+        edge_key = self.all_head_tensor * self.num_items + self.all_tail_tensor
+        unique_key, self.attention_triple2edge = torch.unique(edge_key, sorted=True, return_inverse=True)
+        num_edges = len(unique_key)
+        heads = torch.zeros(num_edges, dtype=torch.long, device=edge_key.device).scatter_(0, self.attention_triple2edge, self.all_head_tensor)
+        tails = torch.zeros(num_edges, dtype=torch.long, device=edge_key.device).scatter_(0, self.attention_triple2edge, self.all_tail_tensor)
+        tails = tails + self.num_users
+
+        rows = torch.cat([heads, tails])
+        cols = torch.cat([tails, heads])
+        num_nodes = self.num_users + self.num_items
+        self.attention_order = torch.argsort(rows * num_nodes + cols) #按行排序, 与coalesce后的顺序一致;
+        self.attention_index = torch.stack([rows[self.attention_order], cols[self.attention_order]])
+        self.attention_num_edges = num_edges
+
     @classmethod
     def code(cls):
         return 'lightGCN'
@@ -153,16 +176,7 @@ class KGAT(BertBaseModel):
                 # pdb.set_trace()
                 all_emb_neighbor = torch.sparse.mm(g_droped, all_emb)
             
-            if self.config.kgat_merge == "bilinear":
-                all_emb = F.leaky_relu(self.W_graph_para_1[layer](all_emb_neighbor + all_emb)) + F.leaky_relu(self.W_graph_para_2[layer](all_emb_neighbor * all_emb_neighbor))
-            elif self.config.kgat_merge == "lightgcn":
-                all_emb = F.leaky_relu(self.W_graph_para_1[layer](all_emb_neighbor + all_emb))
-            elif self.config.kgat_merge == "add":
-                all_emb = all_emb_neighbor + all_emb
-            elif self.config.kgat_merge == "max":
-                all_emb = torch.cat([all_emb_neighbor.unsqueeze(-2), all_emb.unsqueeze(-2)], dim=-2).max(dim=-2).values
-            elif self.config.kgat_merge == "mean":
-                all_emb = torch.cat([all_emb_neighbor.unsqueeze(-2), all_emb.unsqueeze(-2)], dim=-2).mean(dim=-2)
+            all_emb = self.merge(layer, all_emb_neighbor, all_emb)
 
             embs.append(all_emb)
 
@@ -171,6 +185,40 @@ class KGAT(BertBaseModel):
         light_out = torch.mean(embs, dim=1)
         users, items = torch.split(light_out, [self.num_users, self.num_items])
         return users, items
+
+    def merge(self, layer, all_emb_neighbor, all_emb):
+        if self.config.kgat_merge == "bilinear":
+            all_emb = F.leaky_relu(self.W_graph_para_1[layer](all_emb_neighbor + all_emb)) + F.leaky_relu(self.W_graph_para_2[layer](all_emb_neighbor * all_emb_neighbor))
+        elif self.config.kgat_merge == "lightgcn":
+            all_emb = F.leaky_relu(self.W_graph_para_1[layer](all_emb_neighbor + all_emb))
+        elif self.config.kgat_merge == "add":
+            all_emb = all_emb_neighbor + all_emb
+        elif self.config.kgat_merge == "max":
+            all_emb = torch.cat([all_emb_neighbor.unsqueeze(-2), all_emb.unsqueeze(-2)], dim=-2).max(dim=-2).values
+        elif self.config.kgat_merge == "mean":
+            all_emb = torch.cat([all_emb_neighbor.unsqueeze(-2), all_emb.unsqueeze(-2)], dim=-2).mean(dim=-2)
+        return all_emb
+
+    def computer_subgraph(self, nodes):
+        """
+        propagate methods for KGAT, restricted to the sampled k-hop subgraph of nodes
+        :param nodes: LongTensor, ids of the (n_users + m_items) graph, users first
+        :return: (len(nodes), dim), the representations of nodes
+        """
+        seeds, inverse = torch.unique(nodes, return_inverse=True)
+        input_nodes, blocks = self.subgraph_sampler.sample(seeds, self.n_layers)
+        is_user = (input_nodes < self.num_users).unsqueeze(-1)
+        all_emb = torch.where(is_user, self.embedding_user(input_nodes.clamp(max=self.num_users - 1)),
+                              self.embedding_item((input_nodes - self.num_users).clamp(min=0)))
+        embs = [all_emb[:len(seeds)]]
+        for layer, block in enumerate(blocks):
+            if self.config.graph_dropout and self.training:
+                block = self.__dropout_x(block, self.keep_prob)
+            all_emb_neighbor = torch.sparse.mm(block, all_emb)
+            all_emb = self.merge(layer, all_emb_neighbor, all_emb[:block.shape[0]]) #行是列的前缀;
+            embs.append(all_emb[:len(seeds)])
+        light_out = torch.mean(torch.stack(embs, dim=1), dim=1)
+        return light_out[inverse]
     
     def getUsersRating(self, users):
         all_users, all_items = self.computer()
@@ -180,10 +228,14 @@ class KGAT(BertBaseModel):
         return rating
     
     def getEmbedding(self, users, pos_items, neg_items):
-        all_users, all_items = self.computer()
-        users_emb = all_users[users]
-        pos_emb = all_items[pos_items]
-        neg_emb = all_items[neg_items]
+        if self.subgraph_sampler is not None:
+            nodes = torch.cat([users, pos_items + self.num_users, neg_items + self.num_users])
+            users_emb, pos_emb, neg_emb = self.computer_subgraph(nodes).split([len(users), len(pos_items), len(neg_items)])
+        else:
+            all_users, all_items = self.computer()
+            users_emb = all_users[users]
+            pos_emb = all_items[pos_items]
+            neg_emb = all_items[neg_items]
         users_emb_ego = self.embedding_user(users) #embedding layers;
         pos_emb_ego = self.embedding_item(pos_items)
         neg_emb_ego = self.embedding_item(neg_items)
@@ -198,10 +250,8 @@ class KGAT(BertBaseModel):
                          posEmb0.norm(2).pow(2)  +
                          negEmb0.norm(2).pow(2))/float(len(users))
         # pdb.set_trace()
-        W_R_param = self.W_R_hidden[rel] #(bs, dim, dim)
         # users_emb = torch.bmm(users_emb.unsqueeze(1), W_R_param).squeeze(1) #(bs, dim)
-        pos_emb = torch.bmm(pos_emb.unsqueeze(1), W_R_param).squeeze(1)
-        neg_emb = torch.bmm(neg_emb.unsqueeze(1), W_R_param).squeeze(1)
+        pos_emb, neg_emb = self.project_by_relation(self.W_R_hidden, rel, pos_emb, neg_emb)
 
         pos_scores = torch.mul(users_emb, pos_emb)
         pos_scores = torch.sum(pos_scores, dim=1)
@@ -245,6 +295,28 @@ class KGAT(BertBaseModel):
 
     #=====================KGE loss =================================
 
+    def project_by_relation(self, W, rel, *embeddings):
+        """
+        Relation-specific projection embeddings[i][j] @ W[rel[j]], equal to gathering W[rel] and using torch.bmm.
+        Samples are grouped by relation and each group uses one dense (n_r, dim) @ (dim, dim) matmul,
+        so the (bs, dim, dim) tensor W[rel] is never materialized.
+        input:
+            W: (rel_nums, dim, dim), rel: (bs), embeddings: (bs, dim) each
+        output:
+            list of (bs, dim)
+        """
+        order = torch.argsort(rel)
+        counts = torch.bincount(rel, minlength=W.size(0)).tolist()
+        groups = [(r, index) for r, index in enumerate(torch.split(order, counts)) if len(index) > 0]
+        inverse = torch.empty_like(order)
+        inverse[order] = torch.arange(len(order), device=order.device)
+
+        outputs = []
+        for emb in embeddings:
+            projected = torch.cat([torch.matmul(emb[index], W[r]) for r, index in groups], dim=0)
+            outputs.append(projected[inverse])
+        return outputs
+
     def _L2_loss_mean(self, x):
         return torch.mean(torch.sum(torch.pow(x, 2), dim=1, keepdim=False) / 2.)
 
@@ -262,11 +334,8 @@ class KGAT(BertBaseModel):
         tail_pos_embeddings = self.embedding_item(pos_tail) #(bs, dim)
         tail_neg_embeddings = self.embedding_item(neg_tail)
 
-        W_R_param = self.W_R[rel] #(bs, dim, dim)
-        
-        head_embeddings_h = torch.bmm(head_embeddings.unsqueeze(1), W_R_param).squeeze(1) #(bs, dim)
-        tail_embeddings_pos_h = torch.bmm(tail_pos_embeddings.unsqueeze(1), W_R_param).squeeze(1) #(bs, dim)
-        tail_embeddings_neg_h = torch.bmm(tail_neg_embeddings.unsqueeze(1), W_R_param).squeeze(1) #(bs, dim)
+        head_embeddings_h, tail_embeddings_pos_h, tail_embeddings_neg_h = self.project_by_relation(
+            self.W_R, rel, head_embeddings, tail_pos_embeddings, tail_neg_embeddings) #(bs, dim)
 
         pos_score = torch.sum(torch.pow(head_embeddings_h + rel_embeddings - tail_embeddings_pos_h, 2), dim=1)     # (kg_batch_size)
         neg_score = torch.sum(torch.pow(head_embeddings_h + rel_embeddings - tail_embeddings_neg_h, 2), dim=1)     # (kg_batch_size)
@@ -308,32 +377,21 @@ class KGAT(BertBaseModel):
         head_embeddings = self.embedding_user(all_head)
         rel_embeddings = self.embedding_rel(all_r)
         tail_pos_embeddings = self.embedding_item(all_tail) #(all, dim)
-        W_R_param = self.W_R[all_r] #(all, dim, dim)
-
 
         # the attention operation
-        head_embeddings_h = torch.bmm(head_embeddings.unsqueeze(1), W_R_param).squeeze(1) #(all, dim)
-        tail_embeddings_h = torch.bmm(tail_pos_embeddings.unsqueeze(1), W_R_param).squeeze(1) #(all, dim)
+        head_embeddings_h, tail_embeddings_h = self.project_by_relation(self.W_R, all_r, head_embeddings, tail_pos_embeddings) #(all, dim)
 
         attention_score = torch.sum(head_embeddings_h * torch.tanh(tail_embeddings_h + rel_embeddings), dim=-1) #(all)
-        # conducting the adjacent matrix in the sparse format
 
-        
-        attention_score = attention_score.cpu().detach().numpy()
-        attention_matrix_score = csr_matrix((attention_score, (self.all_head_list, self.all_tail_list)),
-                                      shape=(self.num_users, self.num_items)) #第一参数: value, 第二个采纳数: index;
-
-        adj_mat = sp.dok_matrix((self.num_users + self.num_items, self.num_users + self.num_items), dtype=np.float32) #为什么构建(user_num + item_num, user_num + item_num)矩阵;
-        adj_mat = adj_mat.tolil() #convert list of lists format;
-        R = attention_matrix_score.tolil()
-        adj_mat[:self.num_users, self.num_users:] = R
-        adj_mat[self.num_users:, :self.num_users] = R.T
-        adj_mat = adj_mat.tocsr() #convert dictionary of Keys format;
-
-        attention_matrix_score_tensor = self._convert_sp_mat_to_sp_tensor(adj_mat)
-        
+        # conducting the adjacent matrix in the sparse format: 只更新预先计算好的索引对应的values, 全程在device上;
+        edge_score = torch.zeros(self.attention_num_edges, dtype=attention_score.dtype, device=attention_score.device)
+        edge_score = edge_score.index_add_(0, self.attention_triple2edge, attention_score.detach())
+        values = torch.cat([edge_score, edge_score])[self.attention_order] #对称的两块;
+
+        num_nodes = self.num_users + self.num_items
+        attention_matrix_score_tensor = torch.sparse_coo_tensor(self.attention_index, values, (num_nodes, num_nodes)).coalesce()
+
         # the softmax function
-        # pdb.set_trace()
         attention_matrix_score_tensor = torch.sparse.softmax(attention_matrix_score_tensor, dim=1)
 
-        return attention_matrix_score_tensor.to(device=self.config.device)
\ No newline at end of file
+        return attention_matrix_score_tensor
\ No newline at end of file
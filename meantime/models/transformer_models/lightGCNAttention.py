@@ -1,6 +1,7 @@
 import pdb
 import torch
 from .bert_base import BertBaseModel
+from .utils.multi_graph import MultiGraph
 from torch import nn
 import numpy as np
 
@@ -57,6 +58,7 @@ class LightGCNAttention(BertBaseModel):
         self.Graph_cate3 = self.dataset.getSparseGraph("cate3")
         self.Graph_brand = self.dataset.getSparseGraph("brand")
         self.Graph_price = self.dataset.getSparseGraph("price")
+        self.multi_graph = MultiGraph([self.Graph_cate3, self.Graph_brand, self.Graph_price])
         # print(f"lgn is already to go(dropout:{self.config['dropout']})")
         print(f"lgn is already to go(dropout:{self.config.graph_dropout})")
 
@@ -125,8 +127,8 @@ class LightGCNAttention(BertBaseModel):
         """
         合并异构图的表征
         """
-        users, items = self.computer_inner(self.Graph_cate3, self.Graph_brand, self.Graph_price)
-        # users, items = self.computer_outside(self.Graph_cate3, self.Graph_brand, self.Graph_price)
+        users, items = self.computer_inner()
+        # users, items = self.computer_outside()
         # embs_view, rels_view = self.computer(self.Graph_view, self.rel_view)
         #融合两个表征;
         # rels_buy = torch.stack(rels_buy, dim=1)
@@ -147,7 +149,7 @@ class LightGCNAttention(BertBaseModel):
         # return users, items, rels_emb
         return users, items
 
-    def computer_inner(self, Graph_cate3, Graph_brand, Graph_price):
+    def computer_inner(self):
         """
         propagate methods for lightGCN, inner attention. 
         relationship: (1, dim)
@@ -167,64 +169,15 @@ class LightGCNAttention(BertBaseModel):
         # embs_price = [all_emb]
 
         # if self.config['dropout']:
-        if self.config.graph_dropout:
-            if self.training:
-                print("droping")
-                g_droped_cate3 = self.__dropout(self.keep_prob, Graph_cate3) #随机丢弃一些节点;
-                g_droped_brand = self.__dropout(self.keep_prob, Graph_brand) #随机丢弃一些节点;
-                g_droped_price = self.__dropout(self.keep_prob, Graph_price) #随机丢弃一些节点;
-            else:
-                g_droped_cate3 = Graph_cate3
-                g_droped_brand = Graph_brand
-                g_droped_price = Graph_price
-
+        if self.config.graph_dropout and self.training:
+            print("droping")
+            g_droped = self.__dropout_x(self.multi_graph.stacked, self.keep_prob) #随机丢弃一些节点;
         else:
-            g_droped_cate3 = Graph_cate3
-            g_droped_brand = Graph_brand
-            g_droped_price = Graph_price
+            g_droped = self.multi_graph.stacked
         
-        # cate3
         for layer in range(self.n_layers):
-            if self.A_split: #按行切分，完成矩阵乘法后，再按照行拼接;
-                temp_emb = []
-                for f in range(len(g_droped_cate3)):
-                    temp_emb.append(torch.sparse.mm(g_droped_cate3[f], all_emb))
-                side_emb = torch.cat(temp_emb, dim=0)
-                all_emb_cate3 = side_emb
-            else:
-                # pdb.set_trace()
-                all_emb_cate3 = torch.sparse.mm(g_droped_cate3, all_emb) #(node_number, dim)
-            
-            #添加边信息
-            # all_emb = nn.functional.leaky_relu(torch.matmul(torch.mul(all_emb, relationship), self.gcn_linears[layer]))
-            # all_emb_buy = self.gcn_linears[layer](torch.mul(all_emb_buy, relationship_buy))
-            # relationship_buy = self.rel_linears[layer](relationship_buy)
-            # all_emb_buy = torch.mul(all_emb_buy, relationship_buy)
-            # relationship_buy = self.rel_linears[layer](relationship_buy)
-
-
-            #brand
-            if self.A_split: #按行切分，完成矩阵乘法后，再按照行拼接;
-                temp_emb = []
-                for f in range(len(g_droped_brand)):
-                    temp_emb.append(torch.sparse.mm(g_droped_brand[f], all_emb))
-                side_emb = torch.cat(temp_emb, dim=0)
-                all_emb_brand = side_emb
-            else:
-                # pdb.set_trace()
-                all_emb_brand = torch.sparse.mm(g_droped_brand, all_emb) #(node_number, dim)
-            
-
-            #price
-            if self.A_split: #按行切分，完成矩阵乘法后，再按照行拼接;
-                temp_emb = []
-                for f in range(len(g_droped_price)):
-                    temp_emb.append(torch.sparse.mm(g_droped_price[f], all_emb))
-                side_emb = torch.cat(temp_emb, dim=0)
-                all_emb_price = side_emb
-            else:
-                # pdb.set_trace()
-                all_emb_price = torch.sparse.mm(g_droped_price, all_emb) #(node_number, dim)
+            #cate3/brand/price 三个图按行堆叠, 一次spmm;
+            all_emb_cate3, all_emb_brand, all_emb_price = self.multi_graph.propagate_shared(g_droped, all_emb) #(node_number, dim)
             #添加边信息
             # all_emb = nn.functional.leaky_relu(torch.matmul(torch.mul(all_emb, relationship), self.gcn_linears[layer]))
             # all_emb_view = self.gcn_linears[layer](torch.mul(all_emb_view, relationship_view))
@@ -264,7 +217,7 @@ class LightGCNAttention(BertBaseModel):
 
 
 
-    def computer_outside(self, Graph_cate3, Graph_brand, Graph_price):
+    def computer_outside(self):
         """
         propagate methods for lightGCN, outside attention. 
         relationship: (1, dim)
@@ -284,65 +237,15 @@ class LightGCNAttention(BertBaseModel):
         embs_price = [all_emb]
 
         # if self.config['dropout']:
-        if self.config.graph_dropout:
-            if self.training:
-                print("droping")
-                g_droped_cate3 = self.__dropout(self.keep_prob, Graph_cate3) #随机丢弃一些节点;
-                g_droped_brand = self.__dropout(self.keep_prob, Graph_brand) #随机丢弃一些节点;
-                g_droped_price = self.__dropout(self.keep_prob, Graph_price) #随机丢弃一些节点;
-            else:
-                g_droped_cate3 = Graph_cate3
-                g_droped_brand = Graph_brand
-                g_droped_price = Graph_price
-
+        if self.config.graph_dropout and self.training:
+            print("droping")
+            g_droped = self.__dropout_x(self.multi_graph.block, self.keep_prob) #随机丢弃一些节点;
         else:
-            g_droped_cate3 = Graph_cate3
-            g_droped_brand = Graph_brand
-            g_droped_price = Graph_price
+            g_droped = self.multi_graph.block
         
-        # cate3
         for layer in range(self.n_layers):
-            if self.A_split: #按行切分，完成矩阵乘法后，再按照行拼接;
-                temp_emb = []
-                for f in range(len(g_droped_cate3)):
-                    temp_emb.append(torch.sparse.mm(g_droped_cate3[f], embs_cate3[-1]))
-                side_emb = torch.cat(temp_emb, dim=0)
-                all_emb_cate3 = side_emb
-            else:
-                # pdb.set_trace()
-                all_emb_cate3 = torch.sparse.mm(g_droped_cate3, embs_cate3[-1]) #(node_number, dim)
-            
-            #添加边信息
-            # all_emb = nn.functional.leaky_relu(torch.matmul(torch.mul(all_emb, relationship), self.gcn_linears[layer]))
-            # all_emb_buy = self.gcn_linears[layer](torch.mul(all_emb_buy, relationship_buy))
-            # relationship_buy = self.rel_linears[layer](relationship_buy)
-            # all_emb_buy = torch.mul(all_emb_buy, relationship_buy)
-            # relationship_buy = self.rel_linears[layer](relationship_buy)
-            #添加边信息
-
-
-            #brand
-            if self.A_split: #按行切分，完成矩阵乘法后，再按照行拼接;
-                temp_emb = []
-                for f in range(len(g_droped_brand)):
-                    temp_emb.append(torch.sparse.mm(g_droped_brand[f], embs_brand[-1]))
-                side_emb = torch.cat(temp_emb, dim=0)
-                all_emb_brand = side_emb
-            else:
-                # pdb.set_trace()
-                all_emb_brand = torch.sparse.mm(g_droped_brand, embs_brand[-1]) #(node_number, dim)
-            
-
-            #price
-            if self.A_split: #按行切分，完成矩阵乘法后，再按照行拼接;
-                temp_emb = []
-                for f in range(len(g_droped_price)):
-                    temp_emb.append(torch.sparse.mm(g_droped_price[f], embs_price[-1]))
-                side_emb = torch.cat(temp_emb, dim=0)
-                all_emb_price = side_emb
-            else:
-                # pdb.set_trace()
-                all_emb_price = torch.sparse.mm(g_droped_price, embs_price[-1]) #(node_number, dim)
+            #cate3/brand/price 三个图在分块对角矩阵上一次传播;
+            all_emb_cate3, all_emb_brand, all_emb_price = self.multi_graph.propagate(g_droped, [embs_cate3[-1], embs_brand[-1], embs_price[-1]])
             #添加边信息
             # all_emb = nn.functional.leaky_relu(torch.matmul(torch.mul(all_emb, relationship), self.gcn_linears[layer]))
             # all_emb_view = self.gcn_linears[layer](torch.mul(all_emb_view, relationship_view))
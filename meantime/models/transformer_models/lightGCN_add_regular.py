@@ -11,6 +11,7 @@ class LightGCN(BertBaseModel):
         self.config = config
         self.dataset = dataset  #dataloader.BasicDataset
         self.__init_weight()
+        self.subgraph_sampler = None #设置后, bpr训练只在batch的k-hop子图上传播, 见SubgraphSampler;
 
     def __init_weight(self):
         self.num_users  = self.dataset.n_users
@@ -115,6 +116,26 @@ class LightGCN(BertBaseModel):
         light_out = torch.mean(embs, dim=1)
         users, items = torch.split(light_out, [self.num_users, self.num_items])
         return users, items
+
+    def computer_subgraph(self, nodes):
+        """
+        propagate methods for lightGCN, restricted to the sampled k-hop subgraph of nodes
+        :param nodes: LongTensor, ids of the (n_users + m_items) graph, users first
+        :return: (len(nodes), dim), the representations of nodes
+        """
+        seeds, inverse = torch.unique(nodes, return_inverse=True)
+        input_nodes, blocks = self.subgraph_sampler.sample(seeds, self.n_layers)
+        is_user = (input_nodes < self.num_users).unsqueeze(-1)
+        all_emb = torch.where(is_user, self.embedding_user(input_nodes.clamp(max=self.num_users - 1)),
+                              self.embedding_item((input_nodes - self.num_users).clamp(min=0)))
+        embs = [all_emb[:len(seeds)]]
+        for block in blocks:
+            if self.config.graph_dropout and self.training:
+                block = self.__dropout_x(block, self.keep_prob)
+            all_emb = torch.sparse.mm(block, all_emb) #行是列的前缀, 最后一层只剩seeds;
+            embs.append(all_emb[:len(seeds)])
+        light_out = torch.mean(torch.stack(embs, dim=1), dim=1)
+        return light_out[inverse]
     
     def getUsersRating(self, users):
         all_users, all_items = self.computer()
@@ -124,10 +145,14 @@ class LightGCN(BertBaseModel):
         return rating
     
     def getEmbedding(self, users, pos_items, neg_items):
-        all_users, all_items = self.computer()
-        users_emb = all_users[users]
-        pos_emb = all_items[pos_items]
-        neg_emb = all_items[neg_items]
+        if self.subgraph_sampler is not None:
+            nodes = torch.cat([users, pos_items + self.num_users, neg_items + self.num_users])
+            users_emb, pos_emb, neg_emb = self.computer_subgraph(nodes).split([len(users), len(pos_items), len(neg_items)])
+        else:
+            all_users, all_items = self.computer()
+            users_emb = all_users[users]
+            pos_emb = all_items[pos_items]
+            neg_emb = all_items[neg_items]
         users_emb_ego = self.embedding_user(users) #embedding layers;
         pos_emb_ego = self.embedding_item(pos_items)
         neg_emb_ego = self.embedding_item(neg_items)
@@ -152,9 +177,12 @@ class LightGCN(BertBaseModel):
 
 
     def regular_loss(self, users, pos, neg):
-        all_users, all_items = self.computer()
-        users_emb_in = all_users[users]
-        users_emb_out = all_items[users]
+        if self.subgraph_sampler is not None:
+            users_emb_in, users_emb_out = self.computer_subgraph(torch.cat([users, users + self.num_users])).split(len(users))
+        else:
+            all_users, all_items = self.computer()
+            users_emb_in = all_users[users]
+            users_emb_out = all_items[users]
 
         loss = self.loss_dependence_hisc(torch.cat((users_emb_in, users_emb_out), dim=-1), 2, self.config.latent_dim_rec)
 
@@ -1,6 +1,7 @@
 import pdb
 import torch
 from .bert_base import BertBaseModel
+from .utils.multi_graph import MultiGraph
 from torch import nn
 import numpy as np
 
@@ -55,6 +56,7 @@ class LightGCNHeterogeneous(BertBaseModel):
         self.Graph_buy = self.dataset.getSparseGraph(UserItemNet_buy, rel_type, UserItemNet_both) 
         rel_type = 'view'
         self.Graph_view = self.dataset.getSparseGraph(UserItemNet_view, rel_type, UserItemNet_both)
+        self.multi_graph = MultiGraph([self.Graph_buy, self.Graph_view])
 
 
         #初始化异构关系表征;
@@ -123,7 +125,7 @@ class LightGCNHeterogeneous(BertBaseModel):
         """
         合并异构图的表征
         """
-        users, items, rels_emb, users_buy, items_buy, users_view, items_view = self.computer(self.Graph_buy, self.Graph_view, self.rel_buy, self.rel_view)
+        users, items, rels_emb, users_buy, items_buy, users_view, items_view = self.computer(self.rel_buy, self.rel_view)
         # embs_view, rels_view = self.computer(self.Graph_view, self.rel_view)
         #融合两个表征;
         # rels_buy = torch.stack(rels_buy, dim=1)
@@ -144,7 +146,7 @@ class LightGCNHeterogeneous(BertBaseModel):
         # return users, items, rels_emb
         return users, items, rels_emb, users_buy, items_buy, users_view, items_view
 
-    def computer(self, Graph_buy,  Graph_view, relationship_buy, relationship_view):
+    def computer(self, relationship_buy, relationship_view):
         """
         propagate methods for lightGCN
         relationship: (1, dim)
@@ -164,47 +166,16 @@ class LightGCNHeterogeneous(BertBaseModel):
         rels_buy = [relationship_buy]
         rels_view = [relationship_view]
         # if self.config['dropout']:
-        if self.config.graph_dropout:
-            if self.training:
-                print("droping")
-                g_droped_buy = self.__dropout(self.keep_prob, Graph_buy) #随机丢弃一些节点;
-                g_droped_view = self.__dropout(self.keep_prob, Graph_view) #随机丢弃一些节点;
-            else:
-                g_droped_buy = Graph_buy
-                g_droped_view = Graph_view
-
+        if self.config.graph_dropout and self.training:
+            print("droping")
+            g_droped = self.__dropout_x(self.multi_graph.stacked, self.keep_prob) #随机丢弃一些节点;
         else:
-            g_droped_buy = Graph_buy
-            g_droped_view = Graph_view
+            g_droped = self.multi_graph.stacked
         
         # pdb.set_trace()
         for layer in range(self.n_layers):
-            if self.A_split: #按行切分，完成矩阵乘法后，再按照行拼接;
-                temp_emb = []
-                for f in range(len(g_droped_buy)):
-                    temp_emb.append(torch.sparse.mm(g_droped_buy[f], all_emb))
-                side_emb = torch.cat(temp_emb, dim=0)
-                all_emb_buy = side_emb
-            else:
-                # pdb.set_trace()
-                all_emb_buy = torch.sparse.mm(g_droped_buy, all_emb) #(node_number, dim)
-            
-            # 添加边信息
-            # all_emb = nn.functional.leaky_relu(torch.matmul(torch.mul(all_emb, relationship), self.gcn_linears[layer]))
-            # all_emb_buy = self.gcn_linears[layer](torch.mul(all_emb_buy, relationship_buy))
-            # relationship_buy = self.rel_linears[layer](relationship_buy)
-            # all_emb_buy = torch.mul(all_emb_buy, relationship_buy)
-            # relationship_buy = self.rel_linears[layer](relationship_buy)
-
-            if self.A_split: #按行切分，完成矩阵乘法后，再按照行拼接;
-                temp_emb = []
-                for f in range(len(g_droped_view)):
-                    temp_emb.append(torch.sparse.mm(g_droped_view[f], all_emb))
-                side_emb = torch.cat(temp_emb, dim=0)
-                all_emb_view = side_emb
-            else:
-                # pdb.set_trace()
-                all_emb_view = torch.sparse.mm(g_droped_view, all_emb) #(node_number, dim)
+            #buy/view 两个rel_type的图按行堆叠, 一次spmm;
+            all_emb_buy, all_emb_view = self.multi_graph.propagate_shared(g_droped, all_emb) #(node_number, dim)
             
             #添加边信息
             # all_emb = nn.functional.leaky_relu(torch.matmul(torch.mul(all_emb, relationship), self.gcn_linears[layer]))
@@ -46,11 +46,13 @@ class LightGCN(BertBaseModel):
             # self.embedding_item.weight.data.copy_(torch.from_numpy(self.config['item_emb']))
             print('use pretarined data')
         self.f = nn.Sigmoid()
-        self.Graph = self.dataset.getSparseGraph()
+        #user/item共享embedding时, 二部图 [[0, A], [A^T, 0]] 在 [E; E] 上传播, 若A对称则两半结果完全相同,
+        #只需在 N x N 的A上传播一张表, 不加载 2N x 2N 的二部图; A不对称时退回二部图传播;
+        self.ItemGraph = self.dataset.getItemGraph() if self.config.graph_item_propagation else None
+        self.Graph = self.dataset.getSparseGraph() if self.ItemGraph is None else None
         # print(f"lgn is already to go(dropout:{self.config['dropout']})")
         print(f"lgn is already to go(dropout:{self.config.graph_dropout})")
 
-
     @classmethod
     def code(cls):
         return 'lightGCN'
@@ -85,6 +87,8 @@ class LightGCN(BertBaseModel):
         """
         propagate methods for lightGCN
         """       
+        if self.ItemGraph is not None:
+            return self.computer_item()
         users_emb = self.embedding_user.weight
         items_emb = self.embedding_item.weight
         all_emb = torch.cat([users_emb, items_emb])
@@ -117,6 +121,22 @@ class LightGCN(BertBaseModel):
         light_out = torch.mean(embs, dim=1)
         users, items = torch.split(light_out, [self.num_users, self.num_items])
         return users, items
+
+    def computer_item(self):
+        """
+        item-only propagation, 结果与computer()相同: users与items两半均为 mean(E, AE, ..., A^K E);
+        """
+        all_emb = self.embedding_item.weight
+        embs = [all_emb]
+        if self.config.graph_dropout and self.training:
+            g_droped = self.__dropout_x(self.ItemGraph, self.keep_prob)
+        else:
+            g_droped = self.ItemGraph
+        for layer in range(self.n_layers):
+            all_emb = torch.sparse.mm(g_droped, all_emb)
+            embs.append(all_emb)
+        light_out = torch.mean(torch.stack(embs, dim=1), dim=1)
+        return light_out, light_out
     
     def getUsersRating(self, users):
         all_users, all_items = self.computer()
@@ -3,3 +3,5 @@ from .layer_norm import LayerNorm
 from .sublayer import SublayerConnection
 from .gelu import GELU
 from .pooling import PoolingLayer
+from .multi_graph import MultiGraph
+from .subgraph import SubgraphSampler
@@ -0,0 +1,43 @@
+import torch
+
+
+class MultiGraph():
+    """
+    Several (n, n) normalized adjacencies (e.g. cate3/brand/price or buy/view) fused into one sparse operator,
+    so that one layer of propagation over all graphs is a single spmm:
+
+        stacked:   [G_1; G_2; ...; G_k]          (k*n, n),   every graph propagates the same embeddings
+        block:     diag(G_1, G_2, ..., G_k)      (k*n, k*n), every graph propagates its own embeddings
+    """
+
+    def __init__(self, graphs):
+        graphs = [torch.cat(g).coalesce() if isinstance(g, list) else g.coalesce() for g in graphs]
+        self.num_graphs = len(graphs)
+        self.n = graphs[0].shape[0]
+        indices, values = [], []
+        for k, g in enumerate(graphs):
+            #第k个图的行/列整体偏移k*n;
+            indices.append(g.indices() + k * self.n)
+            values.append(g.values())
+        indices = torch.cat(indices, dim=1)
+        values = torch.cat(values)
+        self.block = torch.sparse_coo_tensor(indices, values, (self.num_graphs * self.n, self.num_graphs * self.n)).coalesce()
+        #stacked 与 block 共用行偏移, 列不偏移;
+        self.stacked = torch.sparse_coo_tensor(torch.stack([indices[0], indices[1] % self.n]), values,
+                                               (self.num_graphs * self.n, self.n)).coalesce()
+
+    def propagate_shared(self, graph, emb):
+        """
+        :param graph: self.stacked, or its dropped version
+        :param emb: (n, dim), shared by all graphs
+        :return: list of k tensors (n, dim), G_i @ emb
+        """
+        return list(torch.sparse.mm(graph, emb).split(self.n))
+
+    def propagate(self, graph, embs):
+        """
+        :param graph: self.block, or its dropped version
+        :param embs: list of k tensors (n, dim), one per graph
+        :return: list of k tensors (n, dim), G_i @ embs[i]
+        """
+        return list(torch.sparse.mm(graph, torch.cat(embs)).split(self.n))
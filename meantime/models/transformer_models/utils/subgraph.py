@@ -0,0 +1,92 @@
+import numpy as np
+import scipy.sparse as sp
+import torch
+
+
+class SubgraphSampler():
+    """
+    k-hop neighbor sampling over a normalized (n_users + m_items) adjacency, so that a BPR mini-batch only
+    propagates over the nodes its seeds depend on instead of the whole graph.
+
+    For seeds S and n_layers = k hops, nodes[0] = S and nodes[h + 1] = nodes[h] + sampled neighbors of nodes[h],
+    nodes[h] always being a prefix of nodes[h + 1]. Layer l of propagation computes the representations of
+    nodes[k - l] from those of nodes[k - l + 1], so the last layer leaves exactly the seeds (first rows).
+
+    fanouts[h] caps the neighbors sampled per node at hop h (from the seeds outward, the last value is repeated
+    for deeper hops, None/<=0 keeps every neighbor). A row drawing f of its d neighbors is rescaled by d / f,
+    which keeps the neighbor sum unbiased; without caps the result equals the full-graph propagation exactly.
+    """
+
+    def __init__(self, graph, fanouts=None, seed=None):
+        self.fanouts = list(fanouts) if fanouts else [None]
+        self.rng = np.random.default_rng(seed)
+        self.set_graph(graph)
+
+    def set_graph(self, graph):
+        """
+        :param graph: torch sparse (n, n), or the list of row blocks when A_split, e.g. model.Graph
+        """
+        if isinstance(graph, list):
+            graph = torch.cat(graph)
+        graph = graph.coalesce()
+        self.device = graph.device
+        indices = graph.indices().cpu().numpy()
+        values = graph.values().detach().cpu().numpy()
+        self.adj = sp.csr_matrix((values, (indices[0], indices[1])), shape=tuple(graph.shape))
+        self.adj.sort_indices()
+        self.degree = np.diff(self.adj.indptr)
+        self.position = np.full(self.adj.shape[0], -1, dtype=np.int64) #全局id -> 子图中的位置, 用完即复原;
+
+    def fanout(self, hop):
+        fanout = self.fanouts[min(hop, len(self.fanouts) - 1)]
+        return fanout if fanout is not None and fanout > 0 else None
+
+    def sample_neighbors(self, nodes, fanout):
+        """
+        rows with at most fanout neighbors keep all of them, the others draw fanout neighbors uniformly
+        (with replacement, duplicates are summed by coalesce), scaled by degree / fanout.
+
+        :return: (local row in nodes, neighbor id, weight) of the kept entries of the rows of nodes
+        """
+        lengths = self.degree[nodes]
+        starts = self.adj.indptr[nodes]
+        if fanout is not None:
+            full = lengths <= fanout
+        else:
+            full = np.ones(len(nodes), dtype=bool)
+        full_rows = np.nonzero(full)[0]
+        full_lengths = lengths[full_rows]
+        offsets = np.arange(full_lengths.sum()) - np.repeat(np.cumsum(full_lengths) - full_lengths, full_lengths) #行内序号;
+        rows = np.repeat(full_rows, full_lengths)
+        pos = np.repeat(starts[full_rows], full_lengths) + offsets
+        scale = np.ones(len(rows))
+        if not full.all():
+            heavy_rows = np.repeat(np.nonzero(~full)[0], fanout)
+            heavy_offsets = (self.rng.random(len(heavy_rows)) * lengths[heavy_rows]).astype(np.int64)
+            rows = np.concatenate([rows, heavy_rows])
+            pos = np.concatenate([pos, starts[heavy_rows] + heavy_offsets])
+            scale = np.concatenate([scale, lengths[heavy_rows] / fanout])
+        return rows, self.adj.indices[pos], self.adj.data[pos] * scale
+
+    def sample(self, seeds, n_layers):
+        """
+        :param seeds: LongTensor of unique node ids (users, n_users + items)
+        :return: input_nodes, LongTensor of the nodes whose layer-0 embeddings are needed;
+                 blocks, list of n_layers torch sparse matrices in propagation order, blocks[l] maps the
+                 layer-l representations (its columns) to the layer-(l + 1) ones (its rows, a prefix of the columns)
+        """
+        nodes = seeds.cpu().numpy().astype(np.int64)
+        blocks = []
+        for hop in range(n_layers):
+            rows, neighbors, values = self.sample_neighbors(nodes, self.fanout(hop))
+            self.position[nodes] = np.arange(len(nodes))
+            new = np.unique(neighbors[self.position[neighbors] < 0])
+            next_nodes = np.concatenate([nodes, new])
+            self.position[new] = np.arange(len(nodes), len(next_nodes))
+            cols = self.position[neighbors]
+            self.position[next_nodes] = -1
+            block = torch.sparse_coo_tensor(torch.from_numpy(np.stack([rows, cols])), torch.from_numpy(values.astype(np.float32)),
+                                            (len(nodes), len(next_nodes)))
+            blocks.append(block.coalesce().to(self.device))
+            nodes = next_nodes
+        return torch.from_numpy(nodes).to(self.device), blocks[::-1]
@@ -9,11 +9,11 @@ class Parser:
 
     def parse(self):
         parser = argparse.ArgumentParser(allow_abbrev=False)
-        parser.add_argument('--meta', type=str, choices=['training'], default='training')
+        parser.add_argument('--meta', type=str, choices=['training', 'sweep', 'prepare'], default='training')
 
         args = parser.parse_known_args(self.sys_argv)[0]
         meta = args.meta
-        if meta == 'training':
+        if meta in ['training', 'sweep', 'prepare']:
             conf = TrainingParser(self.sys_argv).parse()
         else:
             raise ValueError
@@ -22,7 +22,10 @@ class TrainingParser:
         conf.update(self.parse_negative_sampler())
         conf.update(self.parse_trainer())
         conf.update(self.parse_model())
+        conf.update(self.parse_graph())
         conf.update(self.parse_experiment())
+        conf.update(self.parse_sweep())
+        conf.update(self.parse_prepare())
         conf.update(self.parse_wandb())
 
         set_template(conf)
@@ -59,6 +62,7 @@ class TrainingParser:
         parser.add_argument('--min_uc', type=int, help='Discard users whose number of ratings is below this value')
         parser.add_argument('--min_sc', type=int, help='Discard items whose number of ratings is below this value')
         parser.add_argument('--split', type=str, choices=['leave_one_out'], help='How to split the dataset')
+        parser.add_argument('--item_order', type=str, choices=['rcm', 'degree'], help='If set, item ids are reordered by reverse Cuthill-McKee or degree over the item co-occurrence graph')
 
         args = parser.parse_known_args(self.sys_argv)[0]
         return vars(args)
@@ -95,6 +99,8 @@ class TrainingParser:
         parser.add_argument('--trainer_code', type=str, choices=TRAINERS.keys(), help='Selects the trainer for the experiment')
         parser.add_argument('--device', type=str, choices=['cpu', 'cuda'])
         parser.add_argument('--use_parallel', type=str2bool, help='If true, the program uses all visible cuda devices with DataParallel')
+        parser.add_argument('--distributed_world_size', type=int, help='If > 1, training runs in this many processes on this machine (torch.distributed, gloo), each on a shard of every batch, with gradients averaged after each backward; rank 0 logs and saves (bert, sas, marank and graph_sasrec_improve_lightgcn_kgat trainers only)')
+        parser.add_argument('--distributed_port', type=int, help='Port of the gloo rendezvous on 127.0.0.1 (default: a free port)')
         parser.add_argument('--num_workers', type=int)
         # optimizer #
         parser.add_argument('--optimizer', type=str, choices=['SGD', 'Adam'])
@@ -110,11 +116,21 @@ class TrainingParser:
         parser.add_argument('--num_epochs', type=int, help='Maximum number of epochs to run. Training will terminate early if saturation point is found. If you want to never stop until saturation, give num_epochs=-1')
         # logger #
         parser.add_argument('--log_period_as_iter', type=int, help='Will log every log_period_as_iter')
+        parser.add_argument('--table_format', type=str, choices=['csv', 'jsonl'], help='File format of the appended tables in the tables folder (default: csv)')
         # evaluation #
         parser.add_argument('--metric_ks', nargs='+', type=int, help='list of k for NDCG@k and Recall@k')
         parser.add_argument('--best_metric', type=str, help='This metric will be used to compare and determine the best model')
         # saturation wait epochs
         parser.add_argument('--saturation_wait_epochs', type=int, help="If validation performance doesn't improve for this number of epochs, the training will stop")
+        # validation scheduling #
+        parser.add_argument('--val_subsample', type=float, help='Validate on a fixed subsample of the validation set, a fraction (<= 1) or a number of instances; the best candidates are re-scored on the full set at the end (trainers built on AbstractTrainer.train and graph_sasrec_improve_lightgcn_kgat; the other graph trainers ignore the val_* options)')
+        parser.add_argument('--val_adaptive', type=str2bool, help='If true, validate every epoch only near the best score and back off up to val_max_every epochs otherwise')
+        parser.add_argument('--val_max_every', type=int, help='Largest gap between two validations with val_adaptive')
+        parser.add_argument('--val_confirm_top', type=int, help='Number of subsample candidates re-scored on the full validation set')
+        # checkpoint writing #
+        parser.add_argument('--checkpoint_async', type=str2bool, help='If true, model checkpoints are copied to host memory and written to disk in a background thread')
+        parser.add_argument('--checkpoint_dtype', type=str, choices=['float32', 'float16'], help='Dtype of the model weights in asynchronously written checkpoints')
+        parser.add_argument('--checkpoint_compress', type=str2bool, help='If true, asynchronously written checkpoints are gzipped')
 
         args = parser.parse_known_args(self.sys_argv)[0]
         return vars(args)
@@ -151,6 +167,24 @@ class TrainingParser:
         args = parser.parse_known_args(self.sys_argv)[0]
         return vars(args)
 
+    def parse_graph(self):
+        parser = argparse.ArgumentParser(allow_abbrev=False)
+        parser.add_argument('--graph_sample_async', type=str2bool, help='If true, graph training triples of the next epoch are sampled in a background process')
+        parser.add_argument('--graph_item_propagation', type=str2bool, help='If true, lightGCN with shared item embeddings propagates over the item-item block only (requires a symmetric item graph)')
+        parser.add_argument('--graph_refresh_steps', type=int, help='Recompute graph representations during finetuning every this many batches (default: every batch)')
+        parser.add_argument('--graph_refresh_drift', type=float, help='Also recompute when the relative drift of graph model parameters exceeds this value')
+        parser.add_argument('--graph_refresh_touched', type=str2bool, help='If true, graph representations are cached without autograd and only the rows used by the batch receive gradients')
+        parser.add_argument('--graph_pretrain_concurrent', type=str2bool, help='If true, LightGCN and KGAT are pretrained at the same time in two forked processes (CPU only, sequential on CUDA)')
+        parser.add_argument('--graph_pretrain_threads', type=int, help='Torch threads of each concurrent pretraining process (default: available threads split evenly)')
+        parser.add_argument('--graph_hogwild_workers', type=int, help='If > 1, LightGCN and then KGAT are each pretrained by this many forked processes updating embeddings in shared memory without locks (Hogwild), each on its shard of every epoch\'s triples (CPU only)')
+        parser.add_argument('--graph_pretrain_cache', type=str, help='Folder of pretrained graph model states keyed by a hash of the graph inputs and graph args; a hit skips graph pretraining (graph_sasrec_improve_lightgcn_kgat only)')
+        parser.add_argument('--checkpoint_every', type=int, help='The graph_sasrec_improve_lightgcn_kgat trainer writes a fully resumable checkpoint (models/graph_checkpoint.pth) every this many epochs of pretraining and finetuning (other trainers ignore it)')
+        parser.add_argument('--resume_checkpoint', type=str2bool, help='If true, the graph_sasrec_improve_lightgcn_kgat trainer resumes from models/graph_checkpoint.pth of the experiment folder when it exists (other trainers ignore it)')
+        parser.add_argument('--graph_subgraph_fanout', type=int, nargs='+', help='If set, graph pretraining propagates only over the k-hop subgraph of each bpr batch, sampling at most this many neighbors per node and hop (from the batch outward, <=0 keeps all)')
+
+        args = parser.parse_known_args(self.sys_argv)[0]
+        return vars(args)
+
     def parse_experiment(self):
         parser = argparse.ArgumentParser(allow_abbrev=False)
         parser.add_argument('--experiment_root', type=str, default='experiments', help='Root folder of all experiments')
@@ -160,6 +194,27 @@ class TrainingParser:
         args = parser.parse_known_args(self.sys_argv)[0]
         return vars(args)
 
+    def parse_sweep(self):
+        parser = argparse.ArgumentParser(allow_abbrev=False)
+        parser.add_argument('--sweep_space', type=str, help='Yaml file of the swept args (--meta sweep), lists of values or distributions, see meantime.sweep.SweepSpace')
+        parser.add_argument('--sweep_mode', type=str, choices=['grid', 'random'], help='Cartesian product of the lists, or sweep_trials random draws')
+        parser.add_argument('--sweep_trials', type=int, help='Number of trials (required for random sweeps, caps grid sweeps)')
+        parser.add_argument('--sweep_seed', type=int, help='Seed of random sweeps')
+        parser.add_argument('--sweep_workers', type=int, help='Number of trials running at the same time')
+        parser.add_argument('--sweep_pruner', type=str, choices=['none', 'median', 'halving'], help='Stops weak trials early on their validation metric')
+        parser.add_argument('--sweep_min_epochs', type=int, help='Epochs before the median pruner starts; validated epochs at the first rung of successive halving')
+        parser.add_argument('--sweep_eta', type=int, help='Successive halving keeps the top 1/eta of the trials at each rung')
+
+        args = parser.parse_known_args(self.sys_argv)[0]
+        return vars(args)
+
+    def parse_prepare(self):
+        parser = argparse.ArgumentParser(allow_abbrev=False)
+        parser.add_argument('--prepare_workers', type=int, help='Number of artifacts (negative samples, graph adjacencies) built at the same time by --meta prepare (default: all)')
+
+        args = parser.parse_known_args(self.sys_argv)[0]
+        return vars(args)
+
     def parse_wandb(self):
         parser = argparse.ArgumentParser(allow_abbrev=False)
         parser.add_argument('--wandb_project_name', type=str, help='Project name for wandb, if wandb is used')
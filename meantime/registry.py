@@ -0,0 +1,143 @@
+from meantime.utils import all_subclasses, import_all_subclasses
+
+from collections.abc import Mapping
+from importlib import import_module
+import hashlib
+import json
+import os
+import time
+
+
+INDEX_FILENAME = 'registry_index.json'
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'meantime', 'registry')
+
+
+class UnknownCodeError(KeyError):
+    def __str__(self):
+        return self.args[0]
+
+
+class LazyRegistry(Mapping):
+    """
+    code -> class of the subclasses of a base class in a package, like the dicts built with import_all_subclasses,
+    but only the module of the requested code is imported.
+
+    The code -> (module, class name) pairs come from <package>/registry_index.json, generated by importing the
+    whole package once. The index stores a hash of the list of modules of the package, so editing a module does
+    not invalidate it; adding, removing or renaming one does. A code missing from the index, or an entry that no
+    longer resolves to a class with that code, makes the registry import everything once and retry.
+
+    Indexes rebuilt at runtime are written to CACHE_DIR, never into the source tree. Regenerate the tracked
+    indexes (after adding or moving modules) with
+
+        python -m meantime.registry
+    """
+
+    def __init__(self, package_file, package_name, base_class, kind):
+        self.package_dir = os.path.dirname(package_file)
+        self.package_file = package_file
+        self.package_name = package_name
+        self.base_class = base_class
+        self.kind = kind
+        self.entries = None
+        self.complete = False  # every module imported, entries cannot be stale
+        self.classes = {}
+
+    def index_path(self):
+        return os.path.join(self.package_dir, INDEX_FILENAME)
+
+    def cache_path(self):
+        return os.path.join(CACHE_DIR, self.package_name + '.json')
+
+    def digest(self):
+        h = hashlib.sha1()
+        for root, dirs, files in os.walk(self.package_dir):
+            dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+            for name in sorted(files):
+                if name.endswith('.py'):
+                    h.update(os.path.relpath(os.path.join(root, name), self.package_dir).encode())
+                    h.update(b'\0')
+        return h.hexdigest()
+
+    def _load(self):
+        if self.entries is not None:
+            return
+        digest = self.digest()
+        for path in [self.index_path(), self.cache_path()]:
+            try:
+                with open(path) as f:
+                    index = json.load(f)
+                if index['digest'] == digest:
+                    self.entries = index['entries']
+                    return
+            except (OSError, ValueError, KeyError):
+                pass
+        self.build(self.cache_path(), digest)
+
+    def build(self, path=None, digest=None):
+        """
+        imports the whole package and writes the index to path (default: the cache, see CACHE_DIR)
+        """
+        import_all_subclasses(self.package_file, self.package_name, self.base_class)
+        #重复的code取(module, class)排序后的最后一个, 使索引与导入顺序无关;
+        classes = sorted((c for c in all_subclasses(self.base_class) if c.code() is not None), key=lambda c: (c.__module__, c.__qualname__))
+        self.classes = {c.code(): c for c in classes}
+        self.entries = {code: [c.__module__, c.__qualname__] for code, c in sorted(self.classes.items())}
+        self.complete = True
+        path = path or self.cache_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump({'digest': digest or self.digest(), 'entries': self.entries}, f, indent=2, sort_keys=True)
+                f.write('\n')
+        except OSError:
+            pass  # read-only cache, the next run imports everything again
+
+    def _resolve(self, code):
+        module_name, qualname = self.entries[code]
+        try:
+            attribute = import_module(module_name)
+            for name in qualname.split('.'):
+                attribute = getattr(attribute, name)
+        except (ImportError, AttributeError):
+            return None
+        if not isinstance(attribute, type) or attribute.code() != code:
+            return None
+        return attribute
+
+    def __getitem__(self, code):
+        self._load()
+        if code in self.classes:
+            return self.classes[code]
+        attribute = self._resolve(code) if code in self.entries else None
+        if attribute is None and not self.complete:
+            self.build()  # stale index (class added, moved or renamed inside a module)
+            return self[code]
+        if attribute is None:
+            raise UnknownCodeError("Unknown {} code '{}'. Available codes: {}".format(self.kind, code, ', '.join(sorted(self.entries))))
+        self.classes[code] = attribute
+        return attribute
+
+    def __iter__(self):
+        self._load()
+        return iter(self.entries)
+
+    def __len__(self):
+        self._load()
+        return len(self.entries)
+
+    def __contains__(self, code):
+        self._load()
+        return code in self.entries
+
+
+if __name__ == '__main__':
+    start = time.time()
+    from meantime.models import MODELS
+    from meantime.trainers import TRAINERS
+    from meantime.dataloaders import DATALOADERS
+    from meantime.datasets import DATASETS
+    for registry in [MODELS, TRAINERS, DATALOADERS, DATASETS]:
+        registry.build(registry.index_path())
+        print('{}: {} codes -> {}'.format(registry.kind, len(registry), registry.index_path()))
+    print('Imported every {} in {:.2f}s'.format('/'.join(r.kind for r in [MODELS, TRAINERS, DATALOADERS, DATASETS]), time.time() - start))
@@ -0,0 +1,2 @@
+from .space import SweepSpace
+from .pruners import MedianPruner, SuccessiveHalvingPruner, TrialReporter, set_trial_reporter, get_trial_reporter
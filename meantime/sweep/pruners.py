@@ -0,0 +1,99 @@
+import numpy as np
+
+
+class MedianPruner():
+    """
+    Stops a trial at a validated epoch e >= warmup_epochs when its best metric so far is below the median of the
+    best metrics so far (at epoch e) of the other trials that got to e, given at least min_trials of them.
+
+    history is shared by the trials of a sweep (a multiprocessing Manager dict): trial id -> {epoch: metric}.
+    """
+
+    def __init__(self, history, warmup_epochs=1, min_trials=2):
+        self.history = history
+        self.warmup_epochs = warmup_epochs or 0
+        self.min_trials = min_trials
+
+    def should_prune(self, trial_id, epoch, best):
+        if epoch < self.warmup_epochs:
+            return False
+        others = []
+        for other_id, reports in self.history.items():
+            if other_id == trial_id or not reports or max(reports) < epoch:
+                continue
+            others.append(max(m for e, m in reports.items() if e <= epoch))
+        return len(others) >= self.min_trials and best < np.median(others)
+
+
+class SuccessiveHalvingPruner():
+    """
+    Asynchronous successive halving: the rungs are at min_epochs * eta ** k validated epochs (counted, not epoch
+    indices, so that epochs skipped by --val_adaptive do not skip a rung). A trial reaching a rung continues only if
+    its best metric so far is within the top 1 / eta of the metrics that trials recorded at that rung until then
+    (the first trials at a rung always continue).
+    """
+
+    def __init__(self, history, min_epochs=1, eta=3):
+        self.history = history
+        self.min_epochs = max(min_epochs or 1, 1)
+        self.eta = max(eta or 3, 2)
+
+    def rung(self, validated):
+        """
+        :param validated: number of validated epochs of the trial so far
+        :return: the rung of that count, None if it is not a rung
+        """
+        r, k = self.min_epochs, 0
+        while r < validated:
+            r, k = r * self.eta, k + 1
+        return k if r == validated else None
+
+    def should_prune(self, trial_id, epoch, best):
+        validated = len(self.history.get(trial_id, {}))
+        if self.rung(validated) is None:
+            return False
+        others = []
+        for other_id, reports in self.history.items():
+            if other_id != trial_id and len(reports) >= validated:
+                others.append(reports[sorted(reports)[validated - 1]]) #第validated次验证时的最优值;
+        if not others:
+            return False
+        ranked = sorted(others + [best], reverse=True)
+        keep = max(len(ranked) // self.eta, 1)
+        return best < ranked[keep - 1]
+
+
+class TrialReporter():
+    """
+    Records the validation metrics of one trial in the shared history and asks the pruner whether to stop.
+    Trainers get the reporter of their process with get_trial_reporter(), None outside of sweeps.
+    """
+
+    def __init__(self, pruner, history, trial_id):
+        self.pruner = pruner
+        self.history = history
+        self.trial_id = trial_id
+        self.reports = {}
+        self.pruned = False
+
+    def report(self, epoch, metric):
+        """
+        :return: True if the trial should stop
+        """
+        self.reports[epoch] = max([metric] + list(self.reports.values()))
+        self.history[self.trial_id] = dict(self.reports) #Manager dict只在重新赋值时同步;
+        if self.pruner is not None and self.pruner.should_prune(self.trial_id, epoch, self.reports[epoch]):
+            self.pruned = True
+        return self.pruned
+
+
+_TRIAL_REPORTER = None
+
+
+def set_trial_reporter(reporter):
+    global _TRIAL_REPORTER
+    _TRIAL_REPORTER = reporter
+
+
+def get_trial_reporter():
+    return _TRIAL_REPORTER
@@ -0,0 +1,61 @@
+import itertools
+import math
+import random
+
+
+class SweepSpace():
+    """
+    Search space over the training args, read from a yaml file such as
+
+        lr: {type: loguniform, low: 0.0001, high: 0.01}
+        hidden_units: [64, 128]
+        dropout: {type: uniform, low: 0.1, high: 0.5}
+        num_blocks: {type: int, low: 1, high: 3}
+
+    A list is a set of choices. The other entries are distributions and only work with mode='random':
+    uniform, loguniform and int (both bounds included). mode='grid' takes the cartesian product of the lists.
+    """
+
+    DISTRIBUTIONS = ['uniform', 'loguniform', 'int']
+
+    def __init__(self, space, mode='grid', num_trials=None, seed=0):
+        self.space = space
+        self.mode = mode
+        self.num_trials = num_trials
+        self.seed = seed
+        for k, v in space.items():
+            if isinstance(v, dict):
+                if mode == 'grid':
+                    raise ValueError('Sweep arg {} is a distribution, grid sweeps need a list of values'.format(k))
+                if v.get('type') not in self.DISTRIBUTIONS:
+                    raise ValueError('Sweep arg {} has unknown type {}, choose from {}'.format(k, v.get('type'), self.DISTRIBUTIONS))
+            elif not isinstance(v, list):
+                self.space[k] = [v]
+
+    def check(self, conf):
+        unknown = [k for k in self.space if k not in conf]
+        if unknown:
+            raise ValueError('Sweep args {} are not training args'.format(unknown))
+
+    def trials(self):
+        """
+        :return: list of {arg: value}, one per trial
+        """
+        keys = sorted(self.space)
+        if self.mode == 'grid':
+            trials = [dict(zip(keys, values)) for values in itertools.product(*(self.space[k] for k in keys))]
+            return trials[:self.num_trials] if self.num_trials else trials
+        if not self.num_trials:
+            raise ValueError('Random sweeps need sweep_trials')
+        rng = random.Random(self.seed)
+        return [{k: self._draw(self.space[k], rng) for k in keys} for _ in range(self.num_trials)]
+
+    @staticmethod
+    def _draw(v, rng):
+        if isinstance(v, list):
+            return rng.choice(v)
+        if v['type'] == 'uniform':
+            return rng.uniform(v['low'], v['high'])
+        if v['type'] == 'loguniform':
+            return math.exp(rng.uniform(math.log(v['low']), math.log(v['high'])))
+        return rng.randint(v['low'], v['high'])
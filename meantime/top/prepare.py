@@ -0,0 +1,85 @@
+from meantime.datasets import dataset_factory
+from meantime.dataloaders.negative_samplers import negative_sampler_factory
+from meantime.dataloaders.graph import GraphLoader
+from meantime.dataloaders.graphGAT import GraphLoader as GATLoader
+from meantime.dataloaders.graph_update import adj_cache_prefix, latest_adj_path
+
+import torch
+import torch.multiprocessing as mp
+from dotmap import DotMap
+
+from copy import deepcopy
+from time import time
+
+
+def main(args):
+    """
+    Builds the cached artifacts of a template before training, so that the runs started afterwards (possibly
+    several at once) only load them:
+
+        python run.py --templates <template> --meta prepare --prepare_workers 4
+
+    The preprocessed dataset comes first since everything else is indexed by its umap/smap. Then the train and
+    test negative samples and the normalized LightGCN and KGAT adjacencies (when the template sets graph_path and
+    graph_filename / graph_filename_kgat) are built at the same time in forked workers. Every artifact is built
+    under a file lock next to it, so a prepare and training runs started concurrently never build one twice.
+    """
+    start = time()
+    conf = args.toDict()
+    dataset_factory(args).load_dataset()  # preprocesses if needed; the workers fork with it loaded
+    print('dataset ready in {:.1f}s'.format(time() - start))
+
+    jobs = prepare_jobs(conf)
+    workers = max(min(args.prepare_workers or len(jobs), len(jobs)), 1)
+    threads = max(torch.get_num_threads() // workers, 1)
+    ctx = mp.get_context('fork')
+    pool = ctx.Pool(workers)
+    try:
+        results = [(name, pool.apply_async(func, (conf,) + job_args + (threads,))) for name, func, job_args in jobs]
+        for name, result in results:
+            path, seconds = result.get()
+            print('{}: {} ({:.1f}s)'.format(name, path, seconds))
+    finally:
+        pool.close()
+        pool.join()
+    print('Prepared {} artifacts in {:.1f}s'.format(len(jobs) + 1, time() - start))
+
+
+def prepare_jobs(conf):
+    """
+    :return: (name, function, args) of the artifacts to build after the dataset
+    """
+    jobs = []
+    for mode in ['train', 'test']:
+        key = (conf[mode + '_negative_sampler_code'], conf[mode + '_negative_sample_size'], conf[mode + '_negative_sampling_seed'])
+        if all(key != job_args for _, _, job_args in jobs): #train与test参数相同时是同一个文件;
+            jobs.append(('{} negatives'.format(mode), prepare_negatives, key))
+    if conf.get('graph_path') and conf.get('graph_filename'):
+        jobs.append(('lightgcn adjacency', prepare_graph, ('lightgcn',)))
+    if conf.get('graph_path') and conf.get('graph_filename_kgat'):
+        jobs.append(('kgat adjacency', prepare_graph, ('kgat',)))
+    return jobs
+
+
+def prepare_negatives(conf, code, sample_size, seed, threads):
+    torch.set_num_threads(threads)
+    start = time()
+    dataset = dataset_factory(DotMap(conf, _dynamic=False))
+    data = dataset.load_dataset()
+    sampler = negative_sampler_factory(code, data['user2dict'], len(data['umap']), len(data['smap']),
+                                       sample_size, seed, dataset._get_preprocessed_folder_path())
+    sampler.get_negative_samples()
+    return str(sampler._get_save_path()), time() - start
+
+
+def prepare_graph(conf, kind, threads):
+    torch.set_num_threads(threads)
+    start = time()
+    conf = deepcopy(conf)
+    conf['device'] = 'cpu' #只需要缓存的npz, 不在fork出的进程中初始化cuda;
+    args = DotMap(conf, _dynamic=False)
+    data = dataset_factory(args).load_dataset()
+    loader = (GraphLoader if kind == 'lightgcn' else GATLoader)(args, data['umap'], data['smap'])
+    loader.getSparseGraph()
+    suffix = '' if kind == 'lightgcn' else '_kgat'
+    return latest_adj_path(adj_cache_prefix(loader.path, args, suffix))[0], time() - start
@@ -0,0 +1,114 @@
+from meantime.top.training import train
+from meantime.datasets import dataset_factory
+from meantime.dataloaders import dataloader_factory
+from meantime.sweep import SweepSpace, MedianPruner, SuccessiveHalvingPruner, TrialReporter, set_trial_reporter
+from meantime.analyze_table import table_path, iter_table
+
+import torch
+import torch.multiprocessing as mp
+import pandas as pd
+import yaml
+from dotmap import DotMap
+
+import os
+import json
+from copy import deepcopy
+from time import time
+
+
+def main(args):
+    """
+    Runs the trials of a sweep over the training args in a local process pool:
+
+        python run.py --templates <template> --meta sweep --sweep_space sweeps/lr.yaml --sweep_workers 4 --sweep_pruner median
+
+    The parent loads the preprocessed dataset and the negative samples once, then forks the workers (one per
+    trial), which see them copy-on-write instead of unpickling their own copies. Trial i is exported to
+    <experiment_root>/<experiment_group>/<experiment_name>_sweep/trial_<i>/<experiment_name>; the experiment
+    name is kept so that trials share the adjacency files cached under it. The results go to sweep.csv there.
+    """
+    conf = args.toDict()
+    space = SweepSpace(yaml.safe_load(open(args.sweep_space)), args.sweep_mode or 'grid', args.sweep_trials, args.sweep_seed or 0)
+    space.check(conf)
+    trials = space.trials()
+    sweep_root = os.path.join(args.experiment_root, args.experiment_group, args.experiment_name + '_sweep')
+    os.makedirs(sweep_root, exist_ok=True)
+    workers = max(args.sweep_workers or 1, 1)
+    print('Sweep of {} trials with {} workers in {}'.format(len(trials), workers, sweep_root))
+
+    preload(args)
+
+    ctx = mp.get_context('fork')
+    manager = ctx.Manager()
+    history = manager.dict()
+    threads = max(torch.get_num_threads() // workers, 1)
+    pool = ctx.Pool(workers, maxtasksperchild=1) #每个trial一个新进程, 都从已加载数据的父进程fork;
+    try:
+        jobs = [pool.apply_async(run_trial, (conf, sweep_root, i, params, history, threads)) for i, params in enumerate(trials)]
+        results = [job.get() for job in jobs]
+    finally:
+        pool.close()
+        pool.join()
+        manager.shutdown()
+
+    df = pd.DataFrame(results)
+    if args.best_metric in df:
+        df = df.sort_values(args.best_metric, ascending=False)
+    df.to_csv(os.path.join(sweep_root, 'sweep.csv'), index=False)
+    print(df.to_string(index=False))
+    return df
+
+
+def preload(args):
+    """
+    loads the read-only artifacts shared by all trials into the parent process
+    """
+    dataset_factory(args).load_dataset()
+    dataloader_factory(deepcopy(args))
+
+
+def create_pruner(conf, history):
+    if conf['sweep_pruner'] == 'median':
+        return MedianPruner(history, warmup_epochs=conf['sweep_min_epochs'])
+    if conf['sweep_pruner'] == 'halving':
+        return SuccessiveHalvingPruner(history, min_epochs=conf['sweep_min_epochs'], eta=conf['sweep_eta'])
+    return None
+
+
+def run_trial(conf, sweep_root, trial_id, params, history, threads):
+    torch.set_num_threads(threads)
+    conf = deepcopy(conf)
+    conf.update(params)
+    conf['meta'] = 'training'
+    conf['experiment_root'] = sweep_root
+    conf['experiment_group'] = 'trial_{}'.format(trial_id)
+    reporter = TrialReporter(create_pruner(conf, history), history, trial_id)
+    set_trial_reporter(reporter)
+
+    result = {'trial': trial_id}
+    result.update(params)
+    start = time()
+    try:
+        train(DotMap(conf, _dynamic=False))
+        result['status'] = 'pruned' if reporter.pruned else 'finished'
+    except SystemExit:
+        result['status'] = 'skipped' #实验目录已存在;
+    except Exception as e:
+        result['status'] = 'failed: {}'.format(e)
+    result['time'] = time() - start
+    result['validated_epochs'] = len(reporter.reports)
+
+    path = table_path(os.path.join(sweep_root, conf['experiment_group'], conf['experiment_name']), 'val_log')
+    if path is not None:
+        best = None
+        for chunk in iter_table(path):
+            if conf['best_metric'] in chunk and len(chunk):
+                row = chunk.loc[chunk[conf['best_metric']].idxmax()]
+                if best is None or row[conf['best_metric']] > best[conf['best_metric']]:
+                    best = row
+        if best is not None:
+            result['best_epoch'] = int(best['epoch'])
+            result.update({k: v for k, v in best.items() if k != 'epoch'})
+    with open(os.path.join(sweep_root, 'trial_{}.json'.format(trial_id)), 'w') as f:
+        json.dump(result, f, indent=2, default=str)
+    return result
@@ -1,13 +1,20 @@
 from meantime.models import model_factory
 from meantime.dataloaders import dataloader_factory
-from meantime.trainers import trainer_factory
+from meantime.trainers import trainer_factory, TRAINERS
 from meantime.utils import *
 from meantime.config import *
+from meantime.analyze_table import table_path
+from meantime.distributed import is_distributed, is_main_process, launch, broadcast_flag
 import pdb
 
 
 def main(args):
     # pdb.set_trace()
+    if (args.distributed_world_size or 1) > 1 and not is_distributed():
+        if not TRAINERS[args.trainer_code].supports_distributed:
+            raise ValueError('Trainer {} does not support distributed_world_size > 1'.format(args.trainer_code))
+        launch(main, args.toDict(), args.distributed_world_size, args.distributed_port) #每个进程重新进入main;
+        return
     if args.mode == 'train':
         train(args)
     elif args.mode == 'validate':
@@ -18,8 +25,29 @@ def main(args):
         raise ValueError
 
 
+def setup(args):
+    """
+    setup_train on rank 0, the other ranks of a distributed run wait for it and share the export root
+    """
+    if not is_distributed():
+        return setup_train(args, MACHINE_IS_HOST)
+    result = None
+    if is_main_process():
+        try:
+            result = setup_train(args, MACHINE_IS_HOST)
+        except SystemExit:
+            broadcast_flag(False) #导出目录已存在, 所有进程一起退出;
+            raise
+        broadcast_flag(True)
+    elif not broadcast_flag(False):
+        exit(0)
+    if result is None:
+        result = (os.path.join(args.experiment_root, args.experiment_group, args.experiment_name), None, None)
+    return result
+
+
 def train(args):
-    local_export_root, remote_export_root, communicator = setup_train(args, MACHINE_IS_HOST)
+    local_export_root, remote_export_root, communicator = setup(args)
     assert (communicator is None and MACHINE_IS_HOST) or (communicator is not None and not MACHINE_IS_HOST)
     if communicator:
         communicator.close()  # close station because it might lose connection during long training
@@ -30,6 +58,9 @@ def train(args):
     trainer = trainer_factory(args, model, train_loader, val_loader, test_loader, local_export_root)
     status_file = os.path.join(local_export_root, 'status.txt')
     error_log_file = os.path.join(local_export_root, 'error_log.txt')
+    if not is_main_process():
+        trainer.train()
+        return
     open(status_file, 'w').write(STATUS_RUNNING)
     try:
         trainer.train()
@@ -42,7 +73,7 @@ def train(args):
         # recover
         if args.experiment_group == 'test':
             raise
-        if not os.path.exists(os.path.join(local_export_root, 'tables', 'val_log.csv')):
+        if table_path(local_export_root, 'val_log') is None:
             print('Removing empty local export root')
             # shutil.rmtree(local_export_root) #是否要删除整个目录?
             raise
@@ -57,7 +88,7 @@ def train(args):
 
 
 def validate(args, mode='val'):
-    local_export_root, remote_export_root, communicator = setup_train(args, MACHINE_IS_HOST)
+    local_export_root, remote_export_root, communicator = setup(args)
     if communicator:
         communicator.close()
     train_loader, val_loader, test_loader = dataloader_factory(args)
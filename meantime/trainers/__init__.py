@@ -1,11 +1,7 @@
 from .base import AbstractTrainer
-from meantime.utils import all_subclasses
-from meantime.utils import import_all_subclasses
-import_all_subclasses(__file__, __name__, AbstractTrainer)
-
-TRAINERS = {c.code():c
-            for c in all_subclasses(AbstractTrainer)
-            if c.code() is not None}
+from meantime.registry import LazyRegistry
+#只导入被选中的类所在的模块, 见registry_index.json;
+TRAINERS = LazyRegistry(__file__, __name__, AbstractTrainer, 'trainer')
 
 
 def trainer_factory(args, model, train_loader, val_loader, test_loader, export_root):
@@ -3,7 +3,10 @@ from meantime.loggers import *
 from meantime.config import *
 from meantime.utils import AverageMeterSet
 from meantime.utils import fix_random_seed_as
-from meantime.analyze_table import find_saturation_point
+from meantime.analyze_table import find_saturation_point, read_table, table_path
+from meantime.sweep import get_trial_reporter
+from meantime.distributed import is_main_process, get_world_size, average_gradients, broadcast_module, all_reduce_meters, all_reduce_sum, all_gather_values
+from meantime.trainers.validation_scheduler import ValidationScheduler
 
 import torch
 import torch.nn as nn
@@ -18,6 +21,10 @@ import pdb
 
 
 class AbstractTrainer(metaclass=ABCMeta):
+    #多进程训练需要train/validate在每个batch后平均梯度, 并且只在rank 0上使用loggers; 只有满足这一点的训练器设为True
+    #(使用本类train/train_one_epoch/validate的训练器), top.training.main拒绝以多进程启动其他训练器;
+    supports_distributed = False
+
     def __init__(self, args, model, train_loader, val_loader, test_loader, local_export_root, graph_loader=None):
         self.args = args
         self.device = args.device
@@ -25,6 +32,8 @@ class AbstractTrainer(metaclass=ABCMeta):
         self.use_parallel = args.use_parallel
         if self.use_parallel:
             self.model = nn.DataParallel(self.model)
+        #多进程(gloo)训练: 各进程从相同的参数开始, 每个batch后平均梯度, 只有rank 0记录日志与保存模型;
+        broadcast_module(self.model)
 
         if graph_loader != None:
             self.graph_loader = graph_loader
@@ -51,9 +60,18 @@ class AbstractTrainer(metaclass=ABCMeta):
             self.num_epochs = 1
             self.pilot_batch_cnt = 1
 
+        #验证的频率与子集, 未设置时每个epoch在完整验证集上验证;
+        self.val_scheduler, self.val_loader_subsample = None, None
+        if args.val_subsample or args.val_adaptive:
+            seed = args.model_init_seed if args.model_init_seed is not None else 0
+            self.val_scheduler = ValidationScheduler(self.num_epochs, args.val_subsample, args.val_adaptive, args.val_max_every, args.val_confirm_top, seed=seed)
+            self.val_loader_subsample = self.val_scheduler.subsample_loader(self.val_loader)
+
+        self.trial_reporter = get_trial_reporter() #sweep中的trial向pruner汇报验证指标, 否则为None;
+
         self.local_export_root = local_export_root
         # pdb.set_trace()
-        self.train_loggers, self.val_loggers, self.test_loggers = self._create_loggers() if not self.pilot else (None, None, None)
+        self.train_loggers, self.val_loggers, self.test_loggers = self._create_loggers() if not self.pilot and is_main_process() else (None, None, None)
         self.add_extra_loggers()
         
         #
@@ -103,27 +121,38 @@ class AbstractTrainer(metaclass=ABCMeta):
             # self.lr_scheduler.step()  # step before val because state_dict is saved at val. it doesn't affect val result
             self.optimizer.step()
 
-            val_log_data = self.validate(epoch, accum_iter, mode='val') #用验证代码, 每次保存模型, 调用log_val方法;
-            metric = val_log_data[self.best_metric] #默认是NDCG指标;
-            if metric > best_metric:
-                best_metric = metric
-                best_epoch = epoch
-            elif (self.saturation_wait_epochs is not None) and\
-                    (epoch - best_epoch >= self.saturation_wait_epochs):
-                stop_training = True  # stop training if val perf doesn't improve for saturation_wait_epochs
+            if self.val_scheduler is None or self.val_scheduler.should_validate(epoch):
+                val_log_data = self.validate(epoch, accum_iter, mode='val', subsample=True) #用验证代码, 每次保存模型, 调用log_val方法;
+                metric = val_log_data[self.best_metric] #默认是NDCG指标;
+                if self.val_scheduler is not None:
+                    self.val_scheduler.observe(epoch, metric, val_log_data.get(self.best_metric + '_ci', 0.), self._validation_snapshot)
+                if metric > best_metric:
+                    best_metric = metric
+                    best_epoch = epoch
+                elif (self.saturation_wait_epochs is not None) and\
+                        (epoch - best_epoch >= self.saturation_wait_epochs):
+                    stop_training = True  # stop training if val perf doesn't improve for saturation_wait_epochs
+                if self.trial_reporter is not None and self.trial_reporter.report(epoch, metric):
+                    print('Sweep trial pruned at epoch {}'.format(epoch))
+                    stop_training = True
 
             if stop_training:
+                best_epoch, best_metric = self._confirm_validation(best_epoch, best_metric, accum_iter)
                 # load best model
-                best_model_logger = self.val_loggers[-1] #最后一个存放的是bestModel;
-                assert isinstance(best_model_logger, BestModelLogger)
-                weight_path = best_model_logger.filepath() #检索最有模型路径;
-                if self.use_parallel:
-                    self.model.module.load(weight_path)
-                else:
-                    self.model.load(weight_path) #从valid集最优参数中加载模型来测试;
+                if is_main_process():
+                    best_model_logger = self.val_loggers[-1] #最后一个存放的是bestModel;
+                    assert isinstance(best_model_logger, BestModelLogger)
+                    weight_path = best_model_logger.filepath() #检索最有模型路径;
+                    if self.use_parallel:
+                        self.model.module.load(weight_path)
+                    else:
+                        self.model.load(weight_path) #从valid集最优参数中加载模型来测试;
+                broadcast_module(self.model)
                 # self.validate(epoch, accum_iter, mode='test')  # test result at best model
                 self.validate(best_epoch, accum_iter, mode='test')  # test result at best model
                 break
+        if not stop_training:
+            best_epoch, best_metric = self._confirm_validation(best_epoch, best_metric, accum_iter)
         
         train_type = ''
         if self.args.finetune_flag != True:
@@ -145,7 +174,7 @@ class AbstractTrainer(metaclass=ABCMeta):
 
         average_meter_set = AverageMeterSet()
         num_instance = 0
-        tqdm_dataloader = tqdm(train_loader) if not self.pilot else train_loader
+        tqdm_dataloader = tqdm(train_loader, disable=not is_main_process()) if not self.pilot else train_loader
         # pdb.set_trace()
         for batch_idx, batch in enumerate(tqdm_dataloader):
             if self.pilot and batch_idx >= self.pilot_batch_cnt:
@@ -163,6 +192,7 @@ class AbstractTrainer(metaclass=ABCMeta):
                 for k, v in extra_info.items():
                     average_meter_set.update(k, v)
             loss.backward()
+            average_gradients(self.model.parameters())
 
             if self.clip_grad_norm is not None:
                 torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.clip_grad_norm)
@@ -174,7 +204,7 @@ class AbstractTrainer(metaclass=ABCMeta):
                 tqdm_dataloader.set_description(
                     'Epoch {}, loss {:.4f} '.format(epoch, average_meter_set['loss'].avg))
 
-            accum_iter += batch_size
+            accum_iter += batch_size * get_world_size()
 
             if self._needs_to_log(accum_iter):
                 if not self.pilot:
@@ -189,11 +219,12 @@ class AbstractTrainer(metaclass=ABCMeta):
                 self.log_extra_train_info(log_data)
                 self.logger_service.log_train(log_data)
 
+        all_reduce_meters(average_meter_set)
         log_data = {
             # 'state_dict': (self._create_state_dict()),
             'epoch': epoch,
             'accum_iter': accum_iter,
-            'num_train_instance': num_instance,
+            'num_train_instance': all_reduce_sum(num_instance),
         }
         log_data.update(average_meter_set.averages())
         log_data.update(kwargs)
@@ -201,12 +232,14 @@ class AbstractTrainer(metaclass=ABCMeta):
         self.logger_service.log_train(log_data)
         return accum_iter
 
-    def validate(self, epoch, accum_iter, mode, doLog=True, **kwargs):
+    def validate(self, epoch, accum_iter, mode, doLog=True, subsample=False, **kwargs):
         """
             根据model来预测
+            subsample: 设置了val_subsample时只在固定的验证子集上验证, 并记录best_metric的置信区间半径(best_metric + '_ci');
         """
+        subsample = subsample and mode == 'val' and self.val_loader_subsample is not None
         if mode == 'val':
-            loader = self.val_loader
+            loader = self.val_loader_subsample if subsample else self.val_loader
         elif mode == 'test':
             loader = self.test_loader
         else:
@@ -216,6 +249,7 @@ class AbstractTrainer(metaclass=ABCMeta):
 
         average_meter_set = AverageMeterSet()
         num_instance = 0
+        batch_metrics = [] #每个batch的best_metric, 用于计算置信区间;
 
         train_type = ''
         if self.args.finetune_flag != True:
@@ -224,7 +258,7 @@ class AbstractTrainer(metaclass=ABCMeta):
             train_type = 'finetune'
 
         with torch.no_grad():
-            tqdm_dataloader = tqdm(loader) if not self.pilot else loader
+            tqdm_dataloader = tqdm(loader, disable=not is_main_process()) if not self.pilot else loader
             # pdb.set_trace()
             for batch_idx, batch in enumerate(tqdm_dataloader):
                 # pdb.set_trace()
@@ -240,6 +274,7 @@ class AbstractTrainer(metaclass=ABCMeta):
 
                 for k, v in metrics.items():
                     average_meter_set.update(k, v)
+                batch_metrics.append(metrics[self.best_metric])
                 if not self.pilot:
                     description_metrics = ['NDCG@%d' % k for k in self.metric_ks[:3]] +\
                                           ['Recall@%d' % k for k in self.metric_ks[:3]]
@@ -248,14 +283,17 @@ class AbstractTrainer(metaclass=ABCMeta):
                     description = description.format(*(average_meter_set[k].avg for k in description_metrics))
                     tqdm_dataloader.set_description(description)
 
+            all_reduce_meters(average_meter_set) #各进程验证集分片上的指标合并;
             log_data = {
                 'state_dict': (self._create_state_dict(epoch, accum_iter)),
                 'epoch': epoch,
                 'accum_iter': accum_iter,
-                'num_eval_instance': num_instance,
+                'num_eval_instance': all_reduce_sum(num_instance),
                 'train_type': train_type
             }
             log_data.update(average_meter_set.averages())
+            if subsample:
+                log_data[self.best_metric + '_ci'] = self.val_scheduler.half_width(all_gather_values(batch_metrics))
             log_data.update(kwargs)
             if doLog:
                 if mode == 'val':
@@ -294,7 +332,7 @@ class AbstractTrainer(metaclass=ABCMeta):
              ['Recall@%d' % k for k in self.metric_ks]),
         ]
 
-        train_loggers = [TableLoggersManager(args=self.args, export_root=self.local_export_root, table_definitions=train_table_definitions)]
+        train_loggers = [TableLoggersManager(args=self.args, export_root=self.local_export_root, table_definitions=train_table_definitions, buffered=True)]
         val_loggers = [TableLoggersManager(args=self.args, export_root=self.local_export_root, table_definitions=val_table_definitions)]
         test_loggers = [TableLoggersManager(args=self.args, export_root=self.local_export_root, table_definitions=test_table_definitions)]
 
@@ -311,6 +349,41 @@ class AbstractTrainer(metaclass=ABCMeta):
 
         return train_loggers, val_loggers, test_loggers
 
+    def _validation_snapshot(self):
+        model = self.model.module if self.use_parallel else self.model
+        return {'model': {k: v.detach().to('cpu', copy=True) for k, v in model.state_dict().items()}}
+
+    def _load_validation_snapshot(self, snapshot):
+        model = self.model.module if self.use_parallel else self.model
+        model.load_state_dict(snapshot['model'])
+
+    def _confirm_validation(self, best_epoch, best_metric, accum_iter):
+        """
+        验证子集上的候选epoch在完整验证集上重新打分, 取最优者写入BestModelLogger; 模型最后恢复为当前状态;
+        """
+        if self.val_loader_subsample is None or not self.val_scheduler.candidates():
+            return best_epoch, best_metric
+        current = self._validation_snapshot()
+        results = []
+        for candidate in self.val_scheduler.candidates():
+            self._load_validation_snapshot(candidate['snapshot'])
+            log_data = self.validate(candidate['epoch'], accum_iter, mode='val', doLog=False)
+            print("Full validation of epoch {}: {} {:.4f} (subsample {:.4f} +- {:.4f})".format(
+                candidate['epoch'], self.best_metric, log_data[self.best_metric], candidate['metric'], candidate['half_width']))
+            results.append((log_data[self.best_metric], candidate, log_data))
+        metric, candidate, log_data = max(results, key=lambda r: r[0])
+        self._load_validation_snapshot(candidate['snapshot'])
+        for logger in (self.val_loggers or []):
+            if isinstance(logger, BestModelLogger):
+                logger.best_metric = -1
+                logger.log(**dict(log_data, state_dict=self._create_state_dict(candidate['epoch'], accum_iter)))
+        self._flush_checkpoints()
+        self._load_validation_snapshot(current)
+        return candidate['epoch'], metric
+
+    def _flush_checkpoints(self):
+        pass
+
     def _create_state_dict(self, epoch, accum_iter):
         return {
             STATE_DICT_KEY: self.model.module.state_dict() if self.use_parallel else self.model.state_dict(),
@@ -323,8 +396,8 @@ class AbstractTrainer(metaclass=ABCMeta):
 
     def _restore_best_state(self):
         ### restore best epoch
-        df_path = os.path.join(self.local_export_root, 'tables', 'val_log.csv')
-        df = pd.read_csv(df_path)
+        df_path = table_path(self.local_export_root, 'val_log') #val_log.csv或val_log.jsonl (--table_format);
+        df = read_table(df_path)
         sat, reached_end = find_saturation_point(df, self.saturation_wait_epochs, display=False)
         e = sat['epoch'].iloc[0]
         self.best_epoch = e
@@ -3,6 +3,8 @@ from .utils import recalls_and_ndcgs_for_ks
 
 
 class BERTTrainer(AbstractTrainer):
+    supports_distributed = True
+
     def __init__(self, args, model, train_loader, val_loader, test_loader, export_root):
         super().__init__(args, model, train_loader, val_loader, test_loader, export_root)
 
@@ -3,12 +3,12 @@ from meantime.loggers import *
 from meantime.config import *
 from meantime.utils import AverageMeterSet
 from meantime.utils import fix_random_seed_as
-from meantime.analyze_table import find_saturation_point
+from meantime.analyze_table import find_saturation_point, read_table, table_path
 from meantime.dataloaders import get_dataloader
 from .utils import recalls_and_ndcgs_for_ks
 
 from .base import AbstractTrainer
-from meantime.trainers.utils import UniformSample_original, timer, minibatch, shuffle, UniformSample_original_KGE
+from meantime.trainers.utils import UniformSample_vectorized, timer, minibatch, shuffle, UniformSample_vectorized_KGE
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -195,11 +195,7 @@ class GraphTrainer(AbstractTrainer):
         optim_graph_kge = optim_graph #同一个optim;
 
         with timer(name="SampleKGE"):
-            S = UniformSample_original_KGE(self.graph_loader_kgat) #return <centor_node, rel, posItems, negItems>
-        users = torch.Tensor(S[:, 0]).long()
-        rels = torch.Tensor(S[:, 1]).long()
-        posItems = torch.Tensor(S[:, 2]).long()
-        negItems = torch.Tensor(S[:, 3]).long() #(len(train_items))
+            users, rels, posItems, negItems = UniformSample_vectorized_KGE(self.graph_loader_kgat) #return <centor_node, rel, posItems, negItems>
 
         # pdb.set_trace()
         users = users.to(dtype=torch.long, device=self.args.device)
@@ -305,10 +301,7 @@ class GraphTrainer(AbstractTrainer):
         # self.lr = config['lr']
         
         with timer(name="Sample"):
-            S = UniformSample_original(self.graph_loader)
-        users = torch.Tensor(S[:, 0]).long()
-        posItems = torch.Tensor(S[:, 1]).long()
-        negItems = torch.Tensor(S[:, 2]).long() #(len(train_items))
+            users, posItems, negItems = UniformSample_vectorized(self.graph_loader)
 
         users = users.to(self.args.device)
         posItems = posItems.to(self.args.device)
@@ -644,7 +637,7 @@ class GraphTrainer(AbstractTrainer):
              ['Recall@%d' % k for k in self.metric_ks]),
         ]
 
-        train_loggers = [TableLoggersManager(args=self.args, export_root=self.local_export_root, table_definitions=train_table_definitions)]
+        train_loggers = [TableLoggersManager(args=self.args, export_root=self.local_export_root, table_definitions=train_table_definitions, buffered=True)]
         val_loggers = [TableLoggersManager(args=self.args, export_root=self.local_export_root, table_definitions=val_table_definitions)]
         test_loggers = [TableLoggersManager(args=self.args, export_root=self.local_export_root, table_definitions=test_table_definitions)]
 
@@ -673,8 +666,8 @@ class GraphTrainer(AbstractTrainer):
 
     def _restore_best_state(self):
         ### restore best epoch
-        df_path = os.path.join(self.local_export_root, 'tables', 'val_log.csv')
-        df = pd.read_csv(df_path)
+        df_path = table_path(self.local_export_root, 'val_log') #val_log.csv或val_log.jsonl (--table_format);
+        df = read_table(df_path)
         sat, reached_end = find_saturation_point(df, self.saturation_wait_epochs, display=False)
         e = sat['epoch'].iloc[0]
         self.best_epoch = e
@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+import torch
+from meantime.trainers.graph_pretrain import _to_device
+
+
+#影响图模型预训练结果的参数(包括初始化: model_init_seed, model_init_range); SAS侧的参数(merge_type等)不在其中,
+#只改这些参数的实验可以复用预训练结果;
+GRAPH_ARG_KEYS = [
+    'latent_dim_rec', 'lightGCN_n_layers', 'keep_prob', 'A_split', 'A_n_fold', 'graph_dropout', 'graph_pretrain',
+    'kgat_merge', 'kg_l2loss_lambda', 'graph_epochs', 'graph_attribute_epochs', 'bpr_batch_size', 'weight_decay',
+    'lr', 'model_init_seed', 'model_init_range', 'graph_sample_async', 'graph_subgraph_fanout', 'graph_item_propagation',
+    'graph_pretrain_concurrent', 'graph_hogwild_workers',
+]
+
+
+def _update_tensor(h, value):
+    if isinstance(value, (list, tuple)):
+        for v in value:
+            _update_tensor(h, v)
+    elif torch.is_tensor(value):
+        if value.is_sparse:
+            value = value.coalesce()
+            _update_tensor(h, [value.indices(), value.values()])
+        else:
+            h.update(str((tuple(value.shape), str(value.dtype))).encode())
+            h.update(value.detach().cpu().contiguous().numpy().tobytes())
+    elif value is not None:
+        h.update(repr(value).encode())
+
+
+def graph_cache_key(trainer_code, args, inputs):
+    """
+    content address of a graph pretraining run.
+
+    :param trainer_code: code() of the trainer, the pretraining loops differ between trainers
+    :param inputs: dict of name -> tensor(s) the pretraining reads, e.g. the adjacencies and kg triples
+                   (hashed by content, so rebuilt or incrementally updated graphs get a new key)
+    :return: sha256 hex digest
+    """
+    h = hashlib.sha256()
+    h.update(trainer_code.encode())
+    h.update(json.dumps({k: args.get(k) for k in GRAPH_ARG_KEYS}, sort_keys=True, default=str).encode())
+    for name in sorted(inputs):
+        h.update(name.encode())
+        _update_tensor(h, inputs[name])
+    return h.hexdigest()
+
+
+class GraphPretrainCache():
+    """
+    Pretrained graph model states stored under cache_dir/<key>.pth, with the graph args of the run in <key>.json.
+
+    Every entry holds one state dict per model plus its non-parameter attributes (KGAT's attention adjacency),
+    loaded in place so optimizers created before loading stay valid.
+    """
+
+    def __init__(self, cache_dir, key):
+        self.cache_dir = cache_dir
+        self.key = key
+
+    def path(self):
+        return os.path.join(self.cache_dir, self.key + '.pth')
+
+    def exists(self):
+        return os.path.isfile(self.path())
+
+    def load(self, models):
+        """
+        :param models: dict of name -> (model, attribute names)
+        :return: True on a cache hit
+        """
+        if not self.exists():
+            return False
+        entry = torch.load(self.path(), map_location='cpu')
+        for name, (model, attributes) in models.items():
+            device = next(model.parameters()).device
+            model.load_state_dict(entry[name]['state_dict'])
+            for a in attributes:
+                setattr(model, a, _to_device(entry[name]['attributes'][a], device))
+        return True
+
+    def save(self, models, args=None):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {}
+        for name, (model, attributes) in models.items():
+            entry[name] = {
+                'state_dict': {k: v.detach().cpu() for k, v in model.state_dict().items()},
+                'attributes': {a: _to_device(getattr(model, a), 'cpu') for a in attributes},
+            }
+        tmp = self.path() + '.tmp.{}'.format(os.getpid())
+        torch.save(entry, tmp)
+        os.replace(tmp, self.path()) #并行的实验可能同时写同一个key, 整体替换保证文件完整;
+        if args is not None:
+            with open(os.path.join(self.cache_dir, self.key + '.json'), 'w') as f:
+                json.dump({k: args.get(k) for k in GRAPH_ARG_KEYS}, f, indent=2, default=str)
+
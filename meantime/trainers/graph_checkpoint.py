@@ -0,0 +1,66 @@
+import os
+import random
+import numpy as np
+import torch
+
+
+def rng_state():
+    """
+    global RNG states used by graph sampling (np.random), shuffling and dropout (torch, random);
+    """
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {
+        'python': random.getstate(),
+        'numpy': (name, torch.from_numpy(keys.astype(np.int64)), pos, has_gauss, cached_gaussian), #只含tensor与基本类型;
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+    }
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    name, keys, pos, has_gauss, cached_gaussian = state['numpy']
+    np.random.set_state((name, keys.numpy().astype(np.uint32), pos, has_gauss, cached_gaussian))
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+class GraphCheckpointer():
+    """
+    Single resumable checkpoint of a graph-augmented trainer, overwritten every `every` epochs of each phase
+    (LightGCN pretraining, KGAT pretraining, joint finetuning). The content is assembled by the trainer, see
+    GraphTrainer._create_checkpoint; this class only decides when to write and writes atomically, so a crash
+    while saving leaves the previous checkpoint intact.
+    """
+
+    def __init__(self, checkpoint_path, every=1, filename='graph_checkpoint.pth', write=True):
+        """
+        :param write: False on the ranks other than 0 of a distributed run, which only read the checkpoint to resume
+        """
+        self.checkpoint_path = checkpoint_path
+        self.every = max(every or 1, 1)
+        self.filename = filename
+        self.write = write
+
+    def path(self):
+        return os.path.join(self.checkpoint_path, self.filename)
+
+    def due(self, epoch):
+        return self.write and (epoch + 1) % self.every == 0
+
+    def save(self, state):
+        if not self.write:
+            return
+        os.makedirs(self.checkpoint_path, exist_ok=True)
+        tmp = self.path() + '.tmp'
+        torch.save(state, tmp)
+        os.replace(tmp, self.path())
+
+    def load(self):
+        """
+        :return: the checkpoint dict, None if there is none
+        """
+        if not os.path.isfile(self.path()):
+            return None
+        return torch.load(self.path(), map_location='cpu')
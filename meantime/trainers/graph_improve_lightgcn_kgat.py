@@ -3,15 +3,27 @@ from meantime.loggers import *
 # from config import STATE_DICT_KEY, OPTIMIZER_STATE_DICT_KEY, TRAIN_LOADER_RNG_STATE_DICT_KEY
 from meantime.config import *
 from meantime.utils import AverageMeterSet
+from meantime.utils import load_state_dict
 from meantime.utils import fix_random_seed_as
-from meantime.analyze_table import find_saturation_point
+from meantime.analyze_table import find_saturation_point, find_saturation_point_streaming, table_path
 from meantime.dataloaders import get_dataloader
 from .utils import recalls_and_ndcgs_for_ks
 import json
 import time
 
 from .base import AbstractTrainer
-from meantime.trainers.utils import UniformSample_original, timer, minibatch, shuffle, UniformSample_original_KGE
+from meantime.trainers.utils import UniformSample_vectorized, timer, minibatch, shuffle, UniformSample_vectorized_KGE
+from meantime.trainers.graph_sampler import GraphSampleProducer
+from meantime.trainers.graph_refresh import GraphRefreshPolicy
+from meantime.trainers.graph_pretrain import ConcurrentPretrainer, HogwildPretrainer, HogwildShard, HogwildAttention
+from meantime.trainers.graph_cache import GraphPretrainCache, graph_cache_key
+from meantime.trainers.graph_checkpoint import GraphCheckpointer, rng_state, set_rng_state
+from meantime.trainers.graph_pretrain import _to_device
+from meantime.trainers.validation_scheduler import ValidationScheduler
+from meantime.sweep import get_trial_reporter
+from meantime.distributed import is_distributed, is_main_process, get_world_size, average_gradients, broadcast_module, broadcast_indices, shard, all_reduce_meters, all_reduce_sum, all_gather_values
+from functools import partial
+from meantime.models.transformer_models.utils import SubgraphSampler
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -31,11 +43,16 @@ from meantime.dataloaders.graphGAT import GraphLoader as GATLoader
 # from meantime.dataloaders.graphGAT 
 
 class GraphTrainer(AbstractTrainer):
-    def __init__(self, args, model, train_loader, val_loader, test_loader, local_export_root):
+    supports_distributed = True
+
+    def __init__(self, args, model, train_loader, val_loader, test_loader, local_export_root,
+                 graph_loader=None, graph_loader_kgat=None, graph_model=None, graph_model_kgat=None):
         """
         train_loader, val_loader, test_loader are objects of the pytorch:
 
         we need to use 'get_dataloader' to get the dataloader object;
+        graph_loader, graph_loader_kgat: the LightGCN and KGAT graph loaders, built from the dataset when not given;
+        graph_model, graph_model_kgat: LightGCN and KGAT on these loaders, built when not given;
         """
         self.args = args
         self.device = args.device
@@ -43,39 +60,52 @@ class GraphTrainer(AbstractTrainer):
 
         self.kg_l2loss_lambda = self.args.kg_l2loss_lambda
         #graph-based model and loader;
-        # if graph_loader != None and graph_model != None:
-            # self.graph_loader = graph_loader
-        # pdb.set_trace()
-        # mode = 'train'
-        dataset = get_dataloader(args).dataset
-        # pdb.set_trace()
-        user2id = dataset['umap']
-        item2id = dataset['smap']
-
-
-        json_str = json.dumps(item2id)
-        with open('item2id.json', 'w') as json_file:
-            json_file.write(json_str)
-        
-        self.graph_loader = GraphLoader(self.args, user2id, item2id)
+        if graph_loader is None or graph_loader_kgat is None:
+            dataset = get_dataloader(args).dataset
+            user2id = dataset['umap']
+            item2id = dataset['smap']
+
+            if is_main_process():
+                json_str = json.dumps(item2id)
+                with open('item2id.json', 'w') as json_file:
+                    json_file.write(json_str)
+
+            graph_loader = graph_loader if graph_loader is not None else GraphLoader(self.args, user2id, item2id)
+            #add cate
+            # self.graph_loader_cate = GraphLoaderCateBrand(self.args, user2id, item2id)
+            graph_loader_kgat = graph_loader_kgat if graph_loader_kgat is not None else GATLoader(self.args, user2id, item2id)
+        self.graph_loader = graph_loader
+        self.graph_loader_kgat = graph_loader_kgat
+
+        self.graph_model = (graph_model if graph_model is not None else LightGCN(self.args, self.graph_loader)).to(self.device)
         #add cate
-        # self.graph_loader_cate = GraphLoaderCateBrand(self.args, user2id, item2id)
-        self.graph_loader_kgat = GATLoader(self.args, user2id, item2id)
-        
-        # pdb.set_trace()
-        # self.graph_model = graph_model
-        self.graph_model = LightGCN(self.args, self.graph_loader).to(self.device)
-        #add cate
-        self.graph_model_kgat = KGAT(self.args, self.graph_loader_kgat).to(self.device)
+        self.graph_model_kgat = (graph_model_kgat if graph_model_kgat is not None else KGAT(self.args, self.graph_loader_kgat)).to(self.device)
 
         self.graph_epochs = args.graph_epochs
         # self.graph_cate_epochs = args.graph_cate_epochs
         self.graph_attribute_epochs = args.graph_attribute_epochs
+        self.bpr_producer, self.kge_producer = None, None
+        self.graph_shard = None #hogwild worker中, 该worker的训练三元组分片, 见HogwildShard;
+        self.graph_attention = None #hogwild预训练KGAT时各worker共享的attention邻接矩阵, 见HogwildAttention;
+        self.graph_epoch_start, self.graph_attribute_epoch_start = 0, 0 #已完成的预训练epoch数, 恢复时从此继续;
+        #finetune时图表征的刷新策略, 默认每个batch刷新;
+        self.graph_refresh = GraphRefreshPolicy(self.graph_model, args.graph_refresh_steps, args.graph_refresh_drift, args.graph_refresh_touched)
+        #KGAT的参数不在finetune的optimizer中(见_create_optimizer_total), 表征不需要梯度;
+        self.graph_refresh_kgat = GraphRefreshPolicy(self.graph_model_kgat, args.graph_refresh_steps, trainable=False,
+                                                     ego_weight=1. if args.kgat_output == 'emb' else None)
+        #图预训练时只在batch的k-hop子图上传播;
+        if args.graph_subgraph_fanout:
+            seed = args.model_init_seed if args.model_init_seed is not None else 0
+            self.graph_model.subgraph_sampler = SubgraphSampler(self.graph_model.Graph, args.graph_subgraph_fanout, seed)
+            self.graph_model_kgat.subgraph_sampler = SubgraphSampler(self.graph_model_kgat.Graph, args.graph_subgraph_fanout, seed + 1)
         # self.graph_optimizer = self._create_graph_optimizer() #创建图模型优化器;
         
         self.use_parallel = args.use_parallel
         if self.use_parallel:
             self.model = nn.DataParallel(self.model)
+        #多进程(gloo)训练: 各进程从相同的参数开始, 每个batch后平均梯度, 只有rank 0记录日志与保存模型;
+        for m in [self.model, self.graph_model, self.graph_model_kgat]:
+            broadcast_module(m)
 
         self.train_loader = train_loader
         self.val_loader = val_loader
@@ -101,9 +131,27 @@ class GraphTrainer(AbstractTrainer):
             self.num_epochs = 1
             self.pilot_batch_cnt = 1
 
+        #验证的频率与子集, 未设置时每个epoch在完整验证集上验证;
+        self.val_scheduler, self.val_loader_subsample = None, None
+        if args.val_subsample or args.val_adaptive:
+            seed = args.model_init_seed if args.model_init_seed is not None else 0
+            self.val_scheduler = ValidationScheduler(self.num_epochs, args.val_subsample, args.val_adaptive, args.val_max_every, args.val_confirm_top, seed=seed)
+            self.val_loader_subsample = self.val_scheduler.subsample_loader(self.val_loader)
+
+        self.trial_reporter = get_trial_reporter() #sweep中的trial向pruner汇报验证指标, 否则为None;
+
         self.local_export_root = local_export_root
+        #完整训练状态(包括图模型, 图优化器, 预训练进度, KGAT邻接矩阵与RNG)的checkpoint;
+        self.checkpointer = None
+        if local_export_root is not None and (args.checkpoint_every or args.resume_checkpoint):
+            self.checkpointer = GraphCheckpointer(os.path.join(local_export_root, 'models'), args.checkpoint_every, write=is_main_process())
+        #模型文件在后台线程中写入, 验证时只拷贝到内存;
+        self.checkpoint_writer = None
+        if local_export_root is not None and args.checkpoint_async and is_main_process():
+            dtype = torch.float16 if args.checkpoint_dtype == 'float16' else None
+            self.checkpoint_writer = AsyncCheckpointWriter(dtype=dtype, compress=bool(args.checkpoint_compress))
         # pdb.set_trace()
-        self.train_loggers, self.val_loggers, self.test_loggers = self._create_loggers() if not self.pilot else (None, None, None)
+        self.train_loggers, self.val_loggers, self.test_loggers = self._create_loggers() if not self.pilot and is_main_process() else (None, None, None)
         self.add_extra_loggers()
         
         #
@@ -168,7 +216,52 @@ class GraphTrainer(AbstractTrainer):
         metrics = recalls_and_ndcgs_for_ks(scores, labels, self.metric_ks)
         return metrics
 
-    def trainGraphModelOneEpochKGAT(self, optim_graph):
+    def _sample_bpr(self):
+        """
+        Shuffled <user, positem, negitem> of one LightGCN epoch, from the background producer if it is running.
+        """
+        if self.graph_shard is not None:
+            return tuple(x.to(self.args.device) for x in self.graph_shard.sample(UniformSample_vectorized, self.graph_loader))
+        if not is_main_process():
+            S = None #多进程时由rank 0采样, 其他进程接收相同的样本;
+        elif self.bpr_producer is not None:
+            S = self.bpr_producer.next()
+        else:
+            S = shuffle(*UniformSample_vectorized(self.graph_loader))
+        S = broadcast_indices(S)
+        return tuple(x.to(self.args.device) for x in S)
+
+    def _sample_kge(self):
+        """
+        Shuffled <head, rel, pos_tail, neg_tail> for KGAT, sampled twice per epoch (bpr and transR).
+        """
+        if self.graph_shard is not None:
+            return tuple(x.to(self.args.device) for x in self.graph_shard.sample(UniformSample_vectorized_KGE, self.graph_loader_kgat))
+        if not is_main_process():
+            S = None
+        elif self.kge_producer is not None:
+            S = self.kge_producer.next()
+        else:
+            S = shuffle(*UniformSample_vectorized_KGE(self.graph_loader_kgat))
+        S = broadcast_indices(S)
+        return tuple(x.to(self.args.device) for x in S)
+
+    def _start_sample_producers(self, bpr=True, kge=True):
+        seed = self.args.model_init_seed if self.args.model_init_seed is not None else 0
+        if bpr and self.graph_epoch_start < self.graph_epochs:
+            self.bpr_producer = GraphSampleProducer(UniformSample_vectorized, self.graph_loader, self.graph_epochs, seed,
+                                                    start_epoch=self.graph_epoch_start)
+        if kge and self.graph_attribute_epoch_start < self.graph_attribute_epochs:
+            self.kge_producer = GraphSampleProducer(UniformSample_vectorized_KGE, self.graph_loader_kgat, 2 * self.graph_attribute_epochs, seed + 1,
+                                                    start_epoch=2 * self.graph_attribute_epoch_start)
+
+    def _stop_sample_producers(self):
+        for producer in [self.bpr_producer, self.kge_producer]:
+            if producer is not None:
+                producer.close()
+        self.bpr_producer, self.kge_producer = None, None
+
+    def trainGraphModelOneEpochKGAT(self, optim_graph, barrier=None):
         # Recmodel = self.graph_model
         # Recmodel.train()
         self.graph_model_kgat.train()
@@ -180,19 +273,7 @@ class GraphTrainer(AbstractTrainer):
         
         with timer(name="Sample"):
             # S = UniformSample_original(self.graph_loader_kgat)
-            S = UniformSample_original_KGE(self.graph_loader_kgat)
-            
-        users = torch.Tensor(S[:, 0]).long()
-        rels = torch.Tensor(S[:, 1]).long() #(len(train_items))
-        posItems = torch.Tensor(S[:, 2]).long()
-        negItems = torch.Tensor(S[:, 3]).long() #(len(train_items))
-        
-
-        users = users.to(self.args.device)
-        rels = rels.to(self.args.device)
-        posItems = posItems.to(self.args.device)
-        negItems = negItems.to(self.args.device)
-        users, rels, posItems, negItems = shuffle(users, rels, posItems, negItems)
+            users, rels, posItems, negItems = self._sample_kge()
         # total_batch = len(users) // world.config['bpr_batch_size'] + 1
         total_batch = len(users) // self.args.bpr_batch_size + 1
         aver_loss = 0.
@@ -204,12 +285,14 @@ class GraphTrainer(AbstractTrainer):
             batch_neg)) in enumerate(minibatch(users, rels, posItems, negItems, batch_size=self.args.bpr_batch_size)):
             # cri = bpr.stageOne(batch_users, batch_pos, batch_neg)
             # loss, reg_loss = self.model.bpr_loss(batch_users, batch_pos, batch_neg)
+            batch_users, batch_rels, batch_pos, batch_neg = shard(batch_users, batch_rels, batch_pos, batch_neg) #多进程时每个进程计算minibatch的一部分;
             loss, reg_loss = self.graph_model_kgat.bpr_loss(batch_users, batch_pos, batch_neg, batch_rels)
             reg_loss = reg_loss*self.weight_decay
             loss = loss + reg_loss
 
             optim_graph.zero_grad()
             loss.backward(retain_graph=True)
+            average_gradients(self.graph_model_kgat.parameters())
             optim_graph.step()
             cri = loss.cpu().item()
             aver_loss += cri
@@ -223,19 +306,8 @@ class GraphTrainer(AbstractTrainer):
         optim_graph_kge = optim_graph #同一个optim;
 
         with timer(name="SampleKGE"):
-            S = UniformSample_original_KGE(self.graph_loader_kgat) #return <centor_node, rel, posItems, negItems>
-        users = torch.Tensor(S[:, 0]).long()
-        rels = torch.Tensor(S[:, 1]).long()
-        posItems = torch.Tensor(S[:, 2]).long()
-        negItems = torch.Tensor(S[:, 3]).long() #(len(train_items))
+            users, rels, posItems, negItems = self._sample_kge() #return <centor_node, rel, posItems, negItems>
 
-        # pdb.set_trace()
-        users = users.to(dtype=torch.long, device=self.args.device)
-        rels = rels.to(dtype=torch.long, device=self.args.device)
-        posItems = posItems.to(dtype=torch.long, device=self.args.device)
-        negItems = negItems.to(dtype=torch.long, device=self.args.device)
-
-        users, rels, posItems, negItems = shuffle(users, rels, posItems, negItems)
         # total_batch = len(users) // world.config['bpr_batch_size'] + 1
         total_batch = len(users) // self.args.bpr_batch_size + 1
         tranR_aver_loss = 0.
@@ -246,6 +318,7 @@ class GraphTrainer(AbstractTrainer):
             batch_pos,
             batch_neg)) in enumerate(minibatch(users, rels, posItems, negItems, batch_size=self.args.bpr_batch_size)):
 
+            batch_users, batch_rels, batch_pos, batch_neg = shard(batch_users, batch_rels, batch_pos, batch_neg)
             tranR_loss, reg_loss = self.graph_model_kgat.tranR_loss(batch_users, batch_rels, batch_pos, batch_neg)
             
             # reg_loss = reg_loss*self.kg_l2loss_lambda
@@ -254,6 +327,7 @@ class GraphTrainer(AbstractTrainer):
 
             optim_graph_kge.zero_grad()
             tranR_loss.backward(retain_graph=True)
+            average_gradients(self.graph_model_kgat.parameters())
             optim_graph_kge.step()
             cri = tranR_loss.cpu().item()
             tranR_aver_loss += cri
@@ -262,12 +336,19 @@ class GraphTrainer(AbstractTrainer):
         tranR_aver_loss = tranR_aver_loss / total_batch
         tranR_time_info = timer.dict()
         timer.zero()
+        self.graph_epoch_loss = (aver_loss, tranR_aver_loss)
 
         # updating attention scores
         with torch.no_grad():
             # pdb.set_trace()
-            att = self.graph_model_kgat.updateAttentionScore()
+            if barrier is not None:
+                #hogwild: 所有worker的更新结束后由worker 0计算一次, 写入共享内存;
+                att = self.graph_attention.update(self.graph_shard.worker, barrier, self.graph_model_kgat.updateAttentionScore)
+            else:
+                att = self.graph_model_kgat.updateAttentionScore()
             self.graph_model_kgat.Graph = att
+            if self.graph_model_kgat.subgraph_sampler is not None:
+                self.graph_model_kgat.subgraph_sampler.set_graph(att)
 
         return f"loss{aver_loss:.4f}-{time_info}" + "----------" + f"loss{tranR_aver_loss:.4f}-{tranR_time_info}"
     
@@ -333,15 +414,8 @@ class GraphTrainer(AbstractTrainer):
         # self.lr = config['lr']
         
         with timer(name="Sample"):
-            S = UniformSample_original(self.graph_loader)
-        users = torch.Tensor(S[:, 0]).long()
-        posItems = torch.Tensor(S[:, 1]).long()
-        negItems = torch.Tensor(S[:, 2]).long() #(len(train_items))
-
-        users = users.to(self.args.device)
-        posItems = posItems.to(self.args.device)
-        negItems = negItems.to(self.args.device)
-        users, posItems, negItems = shuffle(users, posItems, negItems)
+            users, posItems, negItems = self._sample_bpr()
+
         # total_batch = len(users) // world.config['bpr_batch_size'] + 1
         total_batch = len(users) // self.args.bpr_batch_size + 1
         aver_loss = 0.
@@ -352,12 +426,14 @@ class GraphTrainer(AbstractTrainer):
             batch_neg)) in enumerate(minibatch(users, posItems, negItems, batch_size=self.args.bpr_batch_size)):
             # cri = bpr.stageOne(batch_users, batch_pos, batch_neg)
             # loss, reg_loss = self.model.bpr_loss(batch_users, batch_pos, batch_neg)
+            batch_users, batch_pos, batch_neg = shard(batch_users, batch_pos, batch_neg)
             loss, reg_loss = self.graph_model.bpr_loss(batch_users, batch_pos, batch_neg)
             reg_loss = reg_loss*self.weight_decay
             loss = loss + reg_loss
 
             optim_graph.zero_grad()
             loss.backward(retain_graph=True)
+            average_gradients(self.graph_model.parameters())
             optim_graph.step()
             cri = loss.cpu().item()
             aver_loss += cri
@@ -366,9 +442,108 @@ class GraphTrainer(AbstractTrainer):
         aver_loss = aver_loss / total_batch
         time_info = timer.dict()
         timer.zero()
+        self.graph_epoch_loss = (aver_loss,)
         return f"loss{aver_loss:.4f}-{time_info}"
     
 
+    def _graph_cache_inputs(self):
+        """
+        everything the graph pretraining reads besides args, hashed by content for the pretraining cache;
+        """
+        return {
+            'graph': self.graph_model.Graph,
+            'graph_kgat': self.graph_model_kgat.Graph,
+            'kg_triples': [self.graph_model_kgat.all_head_tensor, self.graph_model_kgat.all_rel_tensor, self.graph_model_kgat.all_tail_tensor],
+        }
+
+    def pretrainLightGCN(self, checkpoint=True):
+        if self.args.graph_sample_async and self.bpr_producer is None and is_main_process():
+            self._start_sample_producers(kge=False)
+        #预训练graph模型;
+        for epoch in range(self.graph_epoch_start, self.graph_epochs):
+            start_time = time.time()
+            info_train_loss = self.trainGraphModelOneEpoch(self.graph_opt)
+            seconds = time.time() - start_time
+            print("Both buy and view loss:", info_train_loss, "({:.1f}s, {:.0f} triples/s)".format(seconds, self.graph_loader.trainDataSize / max(seconds, 1e-9)))
+            self.graph_epoch_start = epoch + 1
+            if checkpoint and self.checkpointer is not None and self.args.checkpoint_every and self.checkpointer.due(epoch):
+                self.checkpointer.save(self._create_checkpoint())
+        if self.bpr_producer is not None:
+            self.bpr_producer.close()
+            self.bpr_producer = None
+
+    def pretrainKGAT(self, checkpoint=True):
+        if self.args.graph_sample_async and self.kge_producer is None and is_main_process():
+            self._start_sample_producers(bpr=False)
+        #预预先cate_brand graph模型
+        for epoch in range(self.graph_attribute_epoch_start, self.graph_attribute_epochs):
+            # info_train_loss = self.trainGraphModelOneEpochCate(self.graph_opt_cate)
+            start_time = time.time()
+            info_train_loss = self.trainGraphModelOneEpochKGAT(self.graph_opt_attribute)
+            seconds = time.time() - start_time
+            print("cate_and_graph_loss:", info_train_loss, "({:.1f}s, {:.0f} triples/s)".format(seconds, 2 * len(self.graph_loader_kgat.all_head_list) / max(seconds, 1e-9)))
+            self.graph_attribute_epoch_start = epoch + 1
+            if checkpoint and self.checkpointer is not None and self.args.checkpoint_every and self.checkpointer.due(epoch):
+                self.checkpointer.save(self._create_checkpoint())
+        if self.kge_producer is not None:
+            self.kge_producer.close()
+            self.kge_producer = None
+
+    def _hogwild_worker(self, worker, num_workers, draw):
+        """
+        per-worker state of a hogwild pretraining process: its shard of the triples and its own subgraph rng;
+        """
+        seed = self.args.model_init_seed if self.args.model_init_seed is not None else 0
+        self.graph_shard = HogwildShard(worker, num_workers, seed, draw)
+        for m in [self.graph_model, self.graph_model_kgat]:
+            if m.subgraph_sampler is not None:
+                m.subgraph_sampler.rng = np.random.default_rng([seed, worker])
+
+    def _pretrainLightGCNHogwild(self, worker, num_workers, barrier, report):
+        self._hogwild_worker(worker, num_workers, self.graph_epoch_start)
+        optim_graph = optim.Adam(self.graph_model.parameters(), lr=self.lr) #Adam的状态是每个worker自己的, 参数是共享的;
+        for epoch in range(self.graph_epoch_start, self.graph_epochs):
+            self.trainGraphModelOneEpoch(optim_graph)
+            report(epoch, self.graph_epoch_loss)
+
+    def _pretrainKGATHogwild(self, worker, num_workers, barrier, report):
+        self._hogwild_worker(worker, num_workers, 2 * self.graph_attribute_epoch_start)
+        optim_graph = optim.Adam(self.graph_model_kgat.parameters(), lr=self.lr)
+        for epoch in range(self.graph_attribute_epoch_start, self.graph_attribute_epochs):
+            self.trainGraphModelOneEpochKGAT(optim_graph, barrier)
+            report(epoch, self.graph_epoch_loss)
+
+    def pretrainHogwild(self):
+        """
+        LightGCN, then KGAT, each pretrained by graph_hogwild_workers processes updating the shared embeddings without
+        locks; no checkpoints are written in between.
+
+        :return: dict of model name -> wall time in seconds
+        """
+        hogwild = HogwildPretrainer(self.args.graph_hogwild_workers, self.args.graph_pretrain_threads)
+
+        def log(name, n):
+            def on_epoch(epoch, losses, seconds):
+                print("Hogwild {} epoch {}: loss {} ({} workers, {:.1f}s, {:.0f} triples/s)".format(
+                    name, epoch, '/'.join('{:.4f}'.format(l) for l in losses), hogwild.num_workers, seconds, n / max(seconds, 1e-9)))
+            return on_epoch
+
+        elapsed = {}
+        elapsed['lightgcn'] = hogwild.run(self.graph_model, self._pretrainLightGCNHogwild, log('LightGCN', self.graph_loader.trainDataSize))
+        self.graph_epoch_start = self.graph_epochs
+        print("Hogwild LightGCN pretraining time: {:.1f}s".format(elapsed['lightgcn']))
+        kgat = self.graph_model_kgat
+        self.graph_attention = HogwildAttention(kgat.attention_index, (kgat.num_users + kgat.num_items,) * 2)
+        trained = self.graph_attribute_epoch_start < self.graph_attribute_epochs
+        elapsed['kgat'] = hogwild.run(kgat, self._pretrainKGATHogwild, log('KGAT', 2 * len(self.graph_loader_kgat.all_head_list)))
+        self.graph_attribute_epoch_start = self.graph_attribute_epochs
+        #worker 0最后一次由最终参数计算的attention;
+        if trained:
+            kgat.Graph = self.graph_attention.graph(copy=True)
+        print("Hogwild KGAT pretraining time: {:.1f}s".format(elapsed['kgat']))
+        self.graph_shard, self.graph_attention = None, None #不能fork时worker在本进程中运行;
+        return elapsed
+
     def train(self):
         epoch = self.epoch_start
         best_epoch = self.best_epoch
@@ -383,21 +558,61 @@ class GraphTrainer(AbstractTrainer):
         # self.graph_opt_cate = optim.Adam(self.graph_model_cate.parameters(), lr=self.lr)
         self.graph_opt_attribute = optim.Adam(self.graph_model_kgat.parameters(), lr=self.lr)
 
-        #预训练graph模型;
-        for epoch in range(self.graph_epochs):
-            info_train_loss = self.trainGraphModelOneEpoch(self.graph_opt)
-            print("Both buy and view loss:", info_train_loss)
-
-        #预预先cate_brand graph模型
-        for epoch in range(self.graph_attribute_epochs):
-            # info_train_loss = self.trainGraphModelOneEpochCate(self.graph_opt_cate)
-            info_train_loss = self.trainGraphModelOneEpochKGAT(self.graph_opt_attribute)
-            print("cate_and_graph_loss:", info_train_loss)       
+        #图输入与图参数完全相同的实验复用预训练结果;
+        graph_models = {'lightgcn': (self.graph_model, []), 'kgat': (self.graph_model_kgat, ['Graph'])}
+        cache = None
+        if self.args.graph_pretrain_cache:
+            cache = GraphPretrainCache(self.args.graph_pretrain_cache, graph_cache_key(self.code(), self.args, self._graph_cache_inputs()))
+
+        #从checkpoint恢复: 先恢复图模型与预训练进度, SAS侧的状态在createMergeParameter之后恢复;
+        checkpoint = None
+        if self.args.resume_checkpoint and self.checkpointer is not None:
+            checkpoint = self.checkpointer.load()
+        if checkpoint is not None:
+            self._restore_checkpoint_graph(checkpoint)
+            print("Resuming from {}: LightGCN epoch {}, KGAT epoch {}".format(self.checkpointer.path(), self.graph_epoch_start, self.graph_attribute_epoch_start))
+
+        pretrained = self.graph_epoch_start >= self.graph_epochs and self.graph_attribute_epoch_start >= self.graph_attribute_epochs
+        if checkpoint is not None and pretrained:
+            pass
+        elif checkpoint is None and cache is not None and cache.load(graph_models):
+            print("Loaded pretrained graph models from", cache.path())
+        elif self.args.graph_hogwild_workers and not is_distributed():
+            #每个模型由多个进程无锁地异步更新共享内存中的参数;
+            self.pretrainHogwild()
+        elif self.args.graph_pretrain_concurrent and not is_distributed():
+            #两个图模型不共享参数, 分别在子进程中预训练; 子进程不写checkpoint;
+            pretrainer = ConcurrentPretrainer(self.local_export_root)
+            pretrainer.add('lightgcn', self.graph_model, partial(self.pretrainLightGCN, checkpoint=False), self.args.graph_pretrain_threads)
+            pretrainer.add('kgat', self.graph_model_kgat, partial(self.pretrainKGAT, checkpoint=False), self.args.graph_pretrain_threads, attributes=['Graph'])
+            elapsed = pretrainer.run()
+            print("Graph pretraining time:", elapsed)
+        else:
+            #下一个epoch的采样在后台进程中完成;
+            if self.args.graph_sample_async and is_main_process():
+                self._start_sample_producers()
+            self.pretrainLightGCN()
+            self.pretrainKGAT()
+        self.graph_epoch_start, self.graph_attribute_epoch_start = self.graph_epochs, self.graph_attribute_epochs
+        if cache is not None and not cache.exists() and is_main_process():
+            cache.save(graph_models, self.args)
+        if self.graph_model_kgat.subgraph_sampler is not None:
+            self.graph_model_kgat.subgraph_sampler.set_graph(self.graph_model_kgat.Graph)
 
         print("Finish training the LightGCN model;")
 
+        #预训练结束, 之后的崩溃不必重新预训练; 在createMergeParameter之前保存, 恢复时以相同的RNG状态创建merge参数;
+        if self.checkpointer is not None and self.args.checkpoint_every and not (checkpoint is not None and pretrained):
+            self.checkpointer.save(self._create_checkpoint())
+
         #加载模型的额外的参数
         self.model.createMergeParameter() #创建merge参数;
+        broadcast_module(self.model) #只有rank 0采样, 各进程的RNG状态不同, merge参数以rank 0为准;
+
+        if checkpoint is not None and checkpoint['finetune'] is not None:
+            self._restore_checkpoint_finetune(checkpoint)
+            epoch, best_epoch, best_metric, accum_iter = self.epoch_start - 1, self.best_epoch, self.best_metric_at_best_epoch, self.accum_iter_start
+            print("Resuming finetuning at epoch {}".format(self.epoch_start))
         
         #pdb.set_trace()
         #get user and item embeddings
@@ -425,28 +640,43 @@ class GraphTrainer(AbstractTrainer):
             self.optimizer.step()
             # self.lr_scheduler.step()  # step before val because state_dict is saved at val. it doesn't affect val result
             start_time = time.time()
-            val_log_data = self.validate(epoch, accum_iter, mode='val') #用验证代码, 每次保存模型, 调用log_val方法;
-            # print("val time: {}".format(time.time()-start_time))
-            metric = val_log_data[self.best_metric] #默认是NDCG指标;
-            if metric > best_metric:
-                best_metric = metric
-                best_epoch = epoch
-            elif (self.saturation_wait_epochs is not None) and\
-                    (epoch - best_epoch >= self.saturation_wait_epochs):
-                stop_training = True  # stop training if val perf doesn't improve for saturation_wait_epochs
+            if self.val_scheduler is None or self.val_scheduler.should_validate(epoch):
+                val_log_data = self.validate(epoch, accum_iter, mode='val', subsample=True) #用验证代码, 每次保存模型, 调用log_val方法;
+                # print("val time: {}".format(time.time()-start_time))
+                metric = val_log_data[self.best_metric] #默认是NDCG指标;
+                if self.val_scheduler is not None:
+                    self.val_scheduler.observe(epoch, metric, val_log_data.get(self.best_metric + '_ci', 0.), self._validation_snapshot)
+                if metric > best_metric:
+                    best_metric = metric
+                    best_epoch = epoch
+                elif (self.saturation_wait_epochs is not None) and\
+                        (epoch - best_epoch >= self.saturation_wait_epochs):
+                    stop_training = True  # stop training if val perf doesn't improve for saturation_wait_epochs
+                if self.trial_reporter is not None and self.trial_reporter.report(epoch, metric):
+                    print('Sweep trial pruned at epoch {}'.format(epoch))
+                    stop_training = True
+
+            if self.checkpointer is not None and self.args.checkpoint_every and self.checkpointer.due(epoch):
+                self.checkpointer.save(self._create_checkpoint(epoch, accum_iter, best_epoch, best_metric))
 
             if stop_training:
+                best_epoch, best_metric = self._confirm_validation(best_epoch, best_metric, accum_iter)
                 # load best model
-                best_model_logger = self.val_loggers[-1] #最后一个存放的是bestModel;
-                assert isinstance(best_model_logger, BestModelLogger)
-                weight_path = best_model_logger.filepath() #检索最有模型路径;
-                if self.use_parallel:
-                    self.model.module.load(weight_path)
-                else:
-                    self.model.load(weight_path) #从valid集最优参数中加载模型来测试;
+                self._flush_checkpoints()
+                if is_main_process():
+                    best_model_logger = self.val_loggers[-1] #最后一个存放的是bestModel;
+                    assert isinstance(best_model_logger, BestModelLogger)
+                    weight_path = best_model_logger.filepath() #检索最有模型路径;
+                    if self.use_parallel:
+                        self.model.module.load(weight_path)
+                    else:
+                        self.model.load(weight_path) #从valid集最优参数中加载模型来测试;
+                broadcast_module(self.model)
                 # self.validate(epoch, accum_iter, mode='test')  # test result at best model
                 self.validate(best_epoch, accum_iter, mode='test')  # test result at best model
                 break
+        if not stop_training:
+            best_epoch, best_metric = self._confirm_validation(best_epoch, best_metric, accum_iter)
         
         train_type = ''
         if self.args.finetune_flag != True:
@@ -458,6 +688,7 @@ class GraphTrainer(AbstractTrainer):
             'state_dict': (self._create_state_dict(epoch, accum_iter)),
             'train_type': train_type #指明是预训练还是微调;
         }) #循环调用每次logger中的complete方法, 其中对于valid方法, 保存最后一次的模型; 以final为后缀;
+        self._flush_checkpoints()
 
     def just_validate(self, mode):
         dummy_epoch, dummy_accum_iter = 0, 0
@@ -471,21 +702,25 @@ class GraphTrainer(AbstractTrainer):
 
         average_meter_set = AverageMeterSet()
         num_instance = 0
-        tqdm_dataloader = tqdm(train_loader) if not self.pilot else train_loader
+        num_refresh = self.graph_refresh.num_refresh
+        epoch_start_time = time.time()
+        tqdm_dataloader = tqdm(train_loader, disable=not is_main_process()) if not self.pilot else train_loader
         # pdb.set_trace()
         for batch_idx, batch in enumerate(tqdm_dataloader):
             if self.pilot and batch_idx >= self.pilot_batch_cnt:
                 break
                 
-            #经过一次epoch, 重新获取item representation; 修改为每次batch就重新获取item representation;
-            self.user_hidden_rep, self.item_hidden_rep = self.graph_model.getUserItemEmb()
+            batch_size = next(iter(batch.values())).size(0)
+            batch = {k:v.to(self.device) for k, v in batch.items()}
+
+            #经过一次epoch, 重新获取item representation; 修改为按刷新策略获取item representation, 两次刷新之间复用缓存;
+            rows = self._batch_item_rows(batch)
+            self.user_hidden_rep, self.item_hidden_rep = self.graph_refresh.get(rows)
             # self.user_hidden_rep_cate, self.item_hidden_rep_cate = self.graph_model_cate.getUserItemEmb()
-            self.user_hidden_rep_cate, self.item_hidden_rep_cate = self.graph_model_kgat.getUserItemEmb()
+            self.user_hidden_rep_cate, self.item_hidden_rep_cate = self.graph_refresh_kgat.get(rows)
             #setting representations to sequential models; 由于user embedding不参与模型, 两个输出的均是item表征;
             self.model.setUserItemRepFromGraph(self.user_hidden_rep, self.item_hidden_rep, self.user_hidden_rep_cate, self.item_hidden_rep_cate) #每次加载相同的hidden representatin, 不合理;
 
-            batch_size = next(iter(batch.values())).size(0)
-            batch = {k:v.to(self.device) for k, v in batch.items()}
             # pdb.set_trace() # 参照原始bert模型构建输入数据, 随机mask任意的词, 注意此处没有特意去mask next item;
             num_instance += batch_size
 
@@ -496,6 +731,7 @@ class GraphTrainer(AbstractTrainer):
                 for k, v in extra_info.items():
                     average_meter_set.update(k, v)
             loss.backward(retain_graph=True)
+            average_gradients(p for group in self.optimizer.param_groups for p in group['params'])
 
             if self.clip_grad_norm is not None:
                 # torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.clip_grad_norm)
@@ -517,7 +753,7 @@ class GraphTrainer(AbstractTrainer):
                 tqdm_dataloader.set_description(
                     'Epoch {}, loss {:.4f} '.format(epoch, average_meter_set['loss'].avg))
 
-            accum_iter += batch_size
+            accum_iter += batch_size * get_world_size()
 
             if self._needs_to_log(accum_iter):
                 if not self.pilot:
@@ -532,11 +768,15 @@ class GraphTrainer(AbstractTrainer):
                 self.log_extra_train_info(log_data)
                 self.logger_service.log_train(log_data)
 
+        all_reduce_meters(average_meter_set)
+        num_instance = all_reduce_sum(num_instance)
         log_data = {
             # 'state_dict': (self._create_state_dict()),
             'epoch': epoch,
             'accum_iter': accum_iter,
             'num_train_instance': num_instance,
+            'train_instance_per_sec': num_instance / max(time.time() - epoch_start_time, 1e-6),
+            'num_graph_refresh': self.graph_refresh.num_refresh - num_refresh,
         }
         log_data.update(average_meter_set.averages())
         log_data.update(kwargs)
@@ -544,12 +784,22 @@ class GraphTrainer(AbstractTrainer):
         self.logger_service.log_train(log_data)
         return accum_iter
 
-    def validate(self, epoch, accum_iter, mode, doLog=True, **kwargs):
+    def _batch_item_rows(self, batch):
+        """
+        item ids used by the batch, the rows that receive gradients when graph_refresh_touched is set;
+        """
+        if not self.graph_refresh.touched_grad:
+            return None
+        return torch.cat([batch[k].flatten() for k in ['tokens', 'labels', 'negative_labels', 'candidates'] if k in batch]).long()
+
+    def validate(self, epoch, accum_iter, mode, doLog=True, subsample=False, **kwargs):
         """
             根据model来预测, 测试时不需要图模型的forward步骤;
+            subsample: 设置了val_subsample时只在固定的验证子集上验证, 并记录best_metric的置信区间半径(best_metric + '_ci');
         """
+        subsample = subsample and mode == 'val' and self.val_loader_subsample is not None
         if mode == 'val':
-            loader = self.val_loader
+            loader = self.val_loader_subsample if subsample else self.val_loader
         elif mode == 'test':
             loader = self.test_loader
         else:
@@ -562,6 +812,7 @@ class GraphTrainer(AbstractTrainer):
 
         average_meter_set = AverageMeterSet()
         num_instance = 0
+        batch_metrics = [] #每个batch的best_metric, 用于计算置信区间;
 
         train_type = ''
         if self.args.finetune_flag != True:
@@ -579,7 +830,7 @@ class GraphTrainer(AbstractTrainer):
 
 
         with torch.no_grad():
-            tqdm_dataloader = tqdm(loader) if not self.pilot else loader
+            tqdm_dataloader = tqdm(loader, disable=not is_main_process()) if not self.pilot else loader
             # pdb.set_trace()
             for batch_idx, batch in enumerate(tqdm_dataloader):
                 # pdb.set_trace()
@@ -595,6 +846,7 @@ class GraphTrainer(AbstractTrainer):
 
                 for k, v in metrics.items():
                     average_meter_set.update(k, v)
+                batch_metrics.append(metrics[self.best_metric])
                 if not self.pilot:
                     description_metrics = ['NDCG@%d' % k for k in self.metric_ks[:3]] +\
                                           ['Recall@%d' % k for k in self.metric_ks[:3]]
@@ -603,21 +855,25 @@ class GraphTrainer(AbstractTrainer):
                     description = description.format(*(average_meter_set[k].avg for k in description_metrics))
                     tqdm_dataloader.set_description(description)
 
+            all_reduce_meters(average_meter_set) #各进程验证集分片上的指标合并;
             log_data = {
-                'state_dict': (self._create_state_dict(epoch, accum_iter)),
+                'state_dict': (self._create_state_dict(epoch, accum_iter)) if doLog and mode == 'val' and self._saves_model() else None, #只有保存模型的logger会用到;
                 'epoch': epoch,
                 'accum_iter': accum_iter,
-                'num_eval_instance': num_instance,
+                'num_eval_instance': all_reduce_sum(num_instance),
                 'train_type': train_type
             }
             log_data.update(average_meter_set.averages())
+            if subsample:
+                log_data[self.best_metric + '_ci'] = self.val_scheduler.half_width(all_gather_values(batch_metrics))
             log_data.update(kwargs)
             if doLog:
                 if mode == 'val':
                     self.logger_service.log_val(log_data) #保存模型, 不仅保存当前模型, 同时保存最有模型; 索引是-1;
                 elif mode == 'test':
                     self.logger_service.log_test(log_data) #保存最优模型;
-                    self.saveGraphOutputTensor()
+                    if is_main_process():
+                        self.saveGraphOutputTensor()
                 else:
                     raise ValueError
         return log_data
@@ -683,15 +939,15 @@ class GraphTrainer(AbstractTrainer):
              ['Recall@%d' % k for k in self.metric_ks]),
         ]
 
-        train_loggers = [TableLoggersManager(args=self.args, export_root=self.local_export_root, table_definitions=train_table_definitions)]
+        train_loggers = [TableLoggersManager(args=self.args, export_root=self.local_export_root, table_definitions=train_table_definitions, buffered=True)]
         val_loggers = [TableLoggersManager(args=self.args, export_root=self.local_export_root, table_definitions=val_table_definitions)]
         test_loggers = [TableLoggersManager(args=self.args, export_root=self.local_export_root, table_definitions=test_table_definitions)]
 
         if self.local_export_root is not None:
             root = Path(self.local_export_root)
             model_checkpoint = root.joinpath('models')
-            val_loggers.append(RecentModelLogger(model_checkpoint))
-            val_loggers.append(BestModelLogger(model_checkpoint, metric_key=self.best_metric))
+            val_loggers.append(RecentModelLogger(model_checkpoint, writer=self.checkpoint_writer))
+            val_loggers.append(BestModelLogger(model_checkpoint, metric_key=self.best_metric, writer=self.checkpoint_writer))
 
         if USE_WANDB:
             train_loggers.append(WandbLogger(table_definitions=train_table_definitions))
@@ -700,6 +956,23 @@ class GraphTrainer(AbstractTrainer):
 
         return train_loggers, val_loggers, test_loggers
 
+    def _validation_snapshot(self):
+        #LightGCN参与finetune, 与SAS模型一起保存;
+        snapshot = super()._validation_snapshot()
+        snapshot['graph_model'] = {k: v.detach().to('cpu', copy=True) for k, v in self.graph_model.state_dict().items()}
+        return snapshot
+
+    def _load_validation_snapshot(self, snapshot):
+        super()._load_validation_snapshot(snapshot)
+        self.graph_model.load_state_dict(snapshot['graph_model'])
+
+    def _saves_model(self):
+        return any(isinstance(logger, (RecentModelLogger, BestModelLogger)) for logger in (self.val_loggers or []))
+
+    def _flush_checkpoints(self):
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.flush()
+
     def _create_state_dict(self, epoch, accum_iter):
         return {
             STATE_DICT_KEY: self.model.module.state_dict() if self.use_parallel else self.model.state_dict(),
@@ -710,18 +983,82 @@ class GraphTrainer(AbstractTrainer):
             STEPS_DICT_KEY: (epoch, accum_iter),
         }
 
+    def _create_checkpoint(self, epoch=None, accum_iter=None, best_epoch=None, best_metric=None):
+        """
+        everything needed to continue exactly where training stopped; epoch is None during graph pretraining.
+        """
+        models = [self.graph_model, self.graph_model_kgat]
+        state = {
+            'graph_model': self.graph_model.state_dict(),
+            'graph_model_kgat': self.graph_model_kgat.state_dict(),
+            'kgat_graph': _to_device(self.graph_model_kgat.Graph, 'cpu'),
+            'graph_opt': self.graph_opt.state_dict(),
+            'graph_opt_attribute': self.graph_opt_attribute.state_dict(),
+            'graph_epochs_done': (self.graph_epoch_start, self.graph_attribute_epoch_start),
+            'subgraph_rng': [m.subgraph_sampler.rng.bit_generator.state if m.subgraph_sampler is not None else None for m in models],
+            'rng': rng_state(),
+            'finetune': None,
+        }
+        if epoch is not None:
+            state['finetune'] = {
+                'state_dict': self._create_state_dict(epoch, accum_iter),
+                'best': (best_epoch, best_metric),
+                'graph_refresh': self.graph_refresh.state_dict(),
+                'graph_refresh_kgat': self.graph_refresh_kgat.state_dict(),
+            }
+        return state
+
+    def _restore_checkpoint_graph(self, state):
+        self.graph_model.load_state_dict(state['graph_model'])
+        self.graph_model_kgat.load_state_dict(state['graph_model_kgat'])
+        self.graph_model_kgat.Graph = _to_device(state['kgat_graph'], self.device)
+        self.graph_opt.load_state_dict(state['graph_opt'])
+        self.graph_opt_attribute.load_state_dict(state['graph_opt_attribute'])
+        self.graph_epoch_start, self.graph_attribute_epoch_start = state['graph_epochs_done']
+        for m, rng in zip([self.graph_model, self.graph_model_kgat], state['subgraph_rng']):
+            if m.subgraph_sampler is not None and rng is not None:
+                m.subgraph_sampler.rng.bit_generator.state = rng
+        if self.graph_model_kgat.subgraph_sampler is not None:
+            self.graph_model_kgat.subgraph_sampler.set_graph(self.graph_model_kgat.Graph)
+        set_rng_state(state['rng'])
+
+    def _restore_checkpoint_finetune(self, state):
+        chk_dict = state['finetune']['state_dict']
+        epoch, accum_iter = chk_dict[STEPS_DICT_KEY]
+        self.epoch_start = epoch + 1
+        self.accum_iter_start = accum_iter
+        self.best_epoch, self.best_metric_at_best_epoch = state['finetune']['best']
+
+        d = chk_dict[STATE_DICT_KEY]
+        model_state_dict = {(k[6:] if k.startswith('model.') else k): v for k, v in d.items()}
+        if self.use_parallel:
+            self.model.module.load_state_dict(model_state_dict)
+        else:
+            self.model.load_state_dict(model_state_dict)
+        self.optimizer.load_state_dict(chk_dict[OPTIMIZER_STATE_DICT_KEY])
+        self.lr_scheduler.load_state_dict(chk_dict[SCHEDULER_STATE_DICT_KEY])
+        self.train_loader.dataset.set_rng_state(chk_dict[TRAIN_LOADER_DATASET_RNG_STATE_DICT_KEY])
+        self.train_loader.sampler.set_rng_state(chk_dict[TRAIN_LOADER_SAMPLER_RNG_STATE_DICT_KEY])
+        self.graph_refresh.load_state_dict(state['finetune']['graph_refresh'], self.device)
+        self.graph_refresh_kgat.load_state_dict(state['finetune']['graph_refresh_kgat'], self.device)
+
+        #BestModelLogger只在指标超过已有最优值时覆盖best模型;
+        for logger in (self.val_loggers or []):
+            if isinstance(logger, BestModelLogger):
+                logger.best_metric = max(self.best_metric_at_best_epoch, 0.)
+                logger.train_type = 'finetune' if self.args.finetune_flag else 'pretrain'
+
     def _restore_best_state(self):
         ### restore best epoch
-        df_path = os.path.join(self.local_export_root, 'tables', 'val_log.csv')
-        df = pd.read_csv(df_path)
-        sat, reached_end = find_saturation_point(df, self.saturation_wait_epochs, display=False)
+        df_path = table_path(self.local_export_root, 'val_log')
+        sat, reached_end = find_saturation_point_streaming(df_path, self.saturation_wait_epochs, display=False)
         e = sat['epoch'].iloc[0]
         self.best_epoch = e
         print('Restored best epoch:', self.best_epoch)
 
         ###
         state_dict_path = os.path.join(self.local_export_root, 'models', BEST_STATE_DICT_FILENAME)
-        chk_dict = torch.load(os.path.abspath(state_dict_path))
+        chk_dict = load_state_dict(state_dict_path)
 
         ### sanity check
         _e, _ = chk_dict[STEPS_DICT_KEY]
@@ -763,7 +1100,7 @@ class GraphTrainer(AbstractTrainer):
             state_dict_path = os.path.join(self.local_export_root, 'models', BEST_STATE_DICT_FILENAME + '_' + train_type)
         else:
             state_dict_path = os.path.join(self.local_export_root, 'models', RECENT_STATE_DICT_FILENAME + '_' + train_type + '.final')
-        chk_dict = torch.load(os.path.abspath(state_dict_path))
+        chk_dict = load_state_dict(state_dict_path)
         
         ### sanity check
         # _e, _ = chk_dict[STEPS_DICT_KEY]
@@ -796,7 +1133,7 @@ class GraphTrainer(AbstractTrainer):
 
         ###
         state_dict_path = os.path.join(self.local_export_root, 'models', RECENT_STATE_DICT_FILENAME)
-        chk_dict = torch.load(os.path.abspath(state_dict_path))
+        chk_dict = load_state_dict(state_dict_path)
 
         ### restore epoch, accum_iter
         epoch, accum_iter = chk_dict[STEPS_DICT_KEY]
@@ -0,0 +1,249 @@
+import os
+import queue
+import shutil
+import tempfile
+import torch
+import torch.multiprocessing as mp
+from time import time
+
+from meantime.trainers.graph_sampler import GraphSampleProducer
+
+
+class ConcurrentPretrainer():
+    """
+    Runs independent graph pretraining jobs (e.g. LightGCN and KGAT, which share no parameters) in forked
+    processes with their own torch thread budgets, then loads every job's final state back into the model
+    of the parent, in place, so optimizers holding its parameters stay valid:
+
+        pretrainer = ConcurrentPretrainer(work_dir)
+        pretrainer.add('lightgcn', self.graph_model, self.pretrainLightGCN, num_threads=4)
+        pretrainer.add('kgat', self.graph_model_kgat, self.pretrainKGAT, num_threads=4, attributes=['Graph'])
+        pretrainer.run()
+
+    attributes are non-parameter states the job changes and the parent needs afterwards (KGAT's attention
+    adjacency). The jobs run sequentially in the parent when forking is not safe (CUDA already initialized).
+    """
+
+    def __init__(self, work_dir=None):
+        self.work_dir = work_dir
+        self.jobs = []
+
+    def add(self, name, model, fn, num_threads=None, attributes=()):
+        self.jobs.append({'name': name, 'model': model, 'fn': fn, 'num_threads': num_threads, 'attributes': list(attributes)})
+
+    def can_fork(self):
+        return 'fork' in mp.get_all_start_methods() and not torch.cuda.is_initialized()
+
+    def default_threads(self):
+        return max(1, torch.get_num_threads() // max(len(self.jobs), 1))
+
+    def run(self):
+        """
+        :return: dict of job name -> wall time in seconds
+        """
+        if len(self.jobs) < 2 or not self.can_fork():
+            if len(self.jobs) >= 2:
+                print("CUDA is initialized, graph pretraining jobs run sequentially")
+            elapsed = {}
+            for job in self.jobs:
+                s = time()
+                job['fn']()
+                elapsed[job['name']] = time() - s
+            return elapsed
+
+        if self.work_dir is not None:
+            os.makedirs(self.work_dir, exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix='graph_pretrain_', dir=self.work_dir)
+        # fork: 子进程直接继承模型与loader, 不需要pickle; 不能是daemon, 因为job内部还可能启动采样进程;
+        ctx = mp.get_context('fork')
+        processes = []
+        try:
+            for job in self.jobs:
+                path = os.path.join(work_dir, job['name'] + '.pth')
+                num_threads = job['num_threads'] or self.default_threads()
+                process = ctx.Process(target=self._work, args=(job, num_threads, path), daemon=False)
+                process.start()
+                processes.append((job, process, path))
+            for job, process, _ in processes:
+                process.join()
+                if process.exitcode != 0:
+                    raise RuntimeError('Graph pretraining job {} exited with code {}'.format(job['name'], process.exitcode))
+            elapsed = {}
+            for job, _, path in processes:
+                elapsed[job['name']] = self._load(job, path)
+            return elapsed
+        finally:
+            for _, process, _ in processes:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    @staticmethod
+    def _work(job, num_threads, path):
+        torch.set_num_threads(num_threads)
+        s = time()
+        job['fn']()
+        model = job['model']
+        result = {
+            'state_dict': {k: v.detach().cpu() for k, v in model.state_dict().items()},
+            'attributes': {a: _to_device(getattr(model, a), 'cpu') for a in job['attributes']},
+            'elapsed': time() - s,
+        }
+        torch.save(result, path + '.tmp')
+        os.replace(path + '.tmp', path) #写完再改名, 父进程不会读到半个文件;
+
+    @staticmethod
+    def _load(job, path):
+        model = job['model']
+        result = torch.load(path)
+        device = next(model.parameters()).device
+        model.load_state_dict(result['state_dict'])
+        for a, value in result['attributes'].items():
+            setattr(model, a, _to_device(value, device))
+        return result['elapsed']
+
+
+def _to_device(value, device):
+    if isinstance(value, (list, tuple)):
+        return [_to_device(v, device) for v in value]
+    if torch.is_tensor(value):
+        return value.detach().to(device)
+    return value
+
+
+class HogwildPretrainer():
+    """
+    Lock-free asynchronous pretraining of one graph model (Hogwild): its parameters are moved to shared memory
+    and num_workers forked processes update them at the same time, each with its own optimizer state and its
+    own shard of every epoch's triples, without any locking:
+
+        hogwild = HogwildPretrainer(num_workers=4)
+        hogwild.run(self.graph_model, self._pretrainLightGCNHogwild, on_epoch=log_epoch)
+
+    fn(worker, num_workers, barrier, report) runs in every worker. barrier() waits for all the workers (KGAT
+    recomputes its attention adjacency from the embeddings between epochs, see HogwildAttention) and report(epoch, losses) sends a
+    tuple of epoch losses to the parent, which calls on_epoch(epoch, mean losses over the workers, seconds)
+    once every worker finished the epoch. The parameters are updated in place, so the parent's model (and
+    optimizers holding its parameters) see the result. CPU only: fn runs alone in the parent when forking is
+    not safe (CUDA already initialized).
+    """
+
+    def __init__(self, num_workers, num_threads=None):
+        self.num_workers = num_workers
+        self.num_threads = num_threads or max(1, torch.get_num_threads() // num_workers)
+
+    def can_fork(self):
+        return 'fork' in mp.get_all_start_methods() and not torch.cuda.is_initialized()
+
+    def run(self, model, fn, on_epoch=None):
+        """
+        :return: wall time in seconds
+        """
+        s = time()
+        epochs = {}
+        last = [s]
+
+        def collect(epoch, losses, num_workers):
+            epochs.setdefault(epoch, []).append(losses)
+            if len(epochs[epoch]) == num_workers:
+                reported = epochs.pop(epoch)
+                mean = tuple(sum(l[i] for l in reported) / num_workers for i in range(len(losses)))
+                now = time()
+                if on_epoch is not None:
+                    on_epoch(epoch, mean, now - last[0])
+                last[0] = now
+
+        if self.num_workers < 2 or not self.can_fork():
+            if self.num_workers >= 2:
+                print("CUDA is initialized, hogwild graph pretraining runs in a single process")
+            fn(0, 1, lambda: None, lambda epoch, losses: collect(epoch, losses, 1))
+            return time() - s
+
+        model.share_memory() #参数放入共享内存, worker中的更新直接写在同一块内存上;
+        ctx = mp.get_context('fork')
+        barrier = ctx.Barrier(self.num_workers)
+        report_queue = ctx.Queue()
+        processes = [ctx.Process(target=self._work, args=(fn, worker, self.num_workers, self.num_threads, barrier, report_queue), daemon=False)
+                     for worker in range(self.num_workers)]
+        try:
+            for process in processes:
+                process.start()
+            done = 0
+            while done < self.num_workers:
+                try:
+                    epoch, losses = report_queue.get(timeout=1)
+                except queue.Empty:
+                    for process in processes:
+                        if process.exitcode not in (None, 0):
+                            raise RuntimeError('Hogwild graph pretraining worker exited with code {}'.format(process.exitcode))
+                    continue
+                if epoch is None:
+                    done += 1 #该worker已完成所有epoch;
+                else:
+                    collect(epoch, losses, self.num_workers)
+            for process in processes:
+                process.join()
+                if process.exitcode != 0:
+                    raise RuntimeError('Hogwild graph pretraining worker exited with code {}'.format(process.exitcode))
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+        return time() - s
+
+    @staticmethod
+    def _work(fn, worker, num_workers, num_threads, barrier, report_queue):
+        torch.set_num_threads(num_threads)
+        fn(worker, num_workers, barrier.wait, lambda epoch, losses: report_queue.put((epoch, tuple(losses))))
+        report_queue.put((None, None))
+
+
+class HogwildAttention():
+    """
+    KGAT's attention adjacency during hogwild pretraining, computed once per round instead of once per worker:
+    worker 0 writes the values into shared memory between two barriers and every worker wraps them in a sparse
+    tensor. The sparsity pattern (the kg edges, KGAT.attention_index, already in coalesced order) never changes,
+    so only the values are shared. Create it in the parent before forking.
+    """
+
+    def __init__(self, indices, size):
+        self.indices = indices.detach().cpu().share_memory_()
+        self.values = torch.zeros(indices.size(1)).share_memory_()
+        self.size = tuple(size)
+
+    def update(self, worker, barrier, compute):
+        """
+        :param compute: returns the new coalesced attention adjacency, only called in worker 0
+        :return: the new adjacency, its values stay shared until the next update
+        """
+        barrier() #所有worker的更新结束后再计算attention;
+        if worker == 0:
+            self.values.copy_(compute()._values())
+        barrier() #worker 0写完之后其他worker才读取;
+        return self.graph()
+
+    def graph(self, copy=False):
+        values = self.values.clone() if copy else self.values
+        return torch.sparse_coo_tensor(self.indices, values, self.size)._coalesced_(True)
+
+
+class HogwildShard():
+    """
+    The triples a hogwild worker trains on: every worker only samples the users (heads for KGE) of its own
+    slice, range(worker, n, num_workers), from a RandomState seeded by (seed, draw, worker), so the shards of
+    the workers together make up one pass without any worker drawing the whole pass. draw counts the passes,
+    KGAT samples twice per epoch.
+    """
+
+    def __init__(self, worker, num_workers, seed, draw=0):
+        self.worker = worker
+        self.num_workers = num_workers
+        self.seed = seed
+        self.draw = draw
+
+    def sample(self, sample_fn, dataset):
+        S = GraphSampleProducer._sample(sample_fn, dataset, self.seed, self.draw, (self.worker, self.num_workers))
+        self.draw += 1
+        return tuple(torch.from_numpy(x) for x in S)
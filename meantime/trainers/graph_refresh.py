@@ -0,0 +1,93 @@
+import torch
+
+
+class GraphRefreshPolicy():
+    """
+    Staleness-bounded cache of graph_model.getUserItemEmb() for joint finetuning.
+
+    The full-graph propagation is recomputed when refresh_steps batches have passed since the last refresh,
+    or when the relative drift ||theta - theta_ref|| / ||theta_ref|| of the graph model parameters exceeds
+    drift_threshold. refresh_steps=1 is the original per-batch behavior.
+
+    Gradients:
+        touched_grad=False: refresh steps back-propagate through the whole propagation, the other steps use the
+                            detached cache (the graph model only receives gradients at refresh steps);
+        touched_grad=True:  propagation always runs without autograd, every step adds a straight-through term
+                            (E[rows] - E[rows].detach()) * ego_weight to the cached rows touched by the batch,
+                            i.e. the exact gradient of the layer-0 term of the output, only for those rows.
+        trainable=False:    the graph model is not optimized during finetuning (KGAT in the main graph trainer),
+                            representations are always computed without autograd and never drift.
+
+    ego_weight is the weight of the embedding table in getUserItemEmb(): 1 / (n_layers + 1) (default) for the
+    layer mean of LightGCN/KGAT, 1 when the model outputs the raw embeddings (kgat_output == 'emb').
+    """
+
+    def __init__(self, graph_model, refresh_steps=1, drift_threshold=None, touched_grad=False, trainable=True, ego_weight=None):
+        self.graph_model = graph_model
+        self.refresh_steps = max(refresh_steps or 1, 1)
+        self.trainable = trainable
+        self.drift_threshold = drift_threshold if trainable else None
+        self.touched_grad = bool(touched_grad) and trainable
+        self.ego_weight = ego_weight if ego_weight is not None else 1. / (graph_model.n_layers + 1)
+        self.cache = None
+        self.reference = None
+        self.steps_since_refresh = 0
+        self.num_refresh = 0
+
+    def drift(self):
+        num, den = 0., 0.
+        for p, r in zip(self.graph_model.parameters(), self.reference):
+            num += (p.detach() - r).pow(2).sum().item()
+            den += r.pow(2).sum().item()
+        return (num / max(den, 1e-12)) ** 0.5
+
+    def needs_refresh(self):
+        if self.cache is None or self.steps_since_refresh >= self.refresh_steps:
+            return True
+        return self.drift_threshold is not None and self.drift() > self.drift_threshold
+
+    def refresh(self, requires_grad):
+        with torch.set_grad_enabled(requires_grad):
+            users, items = self.graph_model.getUserItemEmb()
+        self.cache = (users.detach(), items.detach())
+        if self.drift_threshold is not None:
+            self.reference = [p.detach().clone() for p in self.graph_model.parameters()]
+        self.steps_since_refresh = 0
+        self.num_refresh += 1
+        return users, items
+
+    def get(self, rows=None):
+        """
+        :param rows: LongTensor, item ids used by the current batch, only needed for touched_grad
+        :return: (user representations, item representations) for setUserItemRepFromGraph
+        """
+        fresh = None
+        if self.needs_refresh():
+            fresh = self.refresh(requires_grad=self.trainable and not self.touched_grad)
+        self.steps_since_refresh += 1
+        if self.touched_grad and rows is not None:
+            users_ego, items_ego = self.graph_model.getUserItemEmbOri()
+            return self._straight_through(self.cache[0], users_ego, rows), self._straight_through(self.cache[1], items_ego, rows)
+        if fresh is not None:
+            return fresh
+        return self.cache
+
+    def state_dict(self):
+        return {
+            'cache': self.cache,
+            'reference': self.reference,
+            'steps_since_refresh': self.steps_since_refresh,
+            'num_refresh': self.num_refresh,
+        }
+
+    def load_state_dict(self, state, device=None):
+        to = (lambda x: x.to(device)) if device is not None else (lambda x: x)
+        self.cache = tuple(to(x) for x in state['cache']) if state['cache'] is not None else None
+        self.reference = [to(x) for x in state['reference']] if state['reference'] is not None else None
+        self.steps_since_refresh = state['steps_since_refresh']
+        self.num_refresh = state['num_refresh']
+
+    def _straight_through(self, cached, ego, rows):
+        rows = torch.unique(rows[(rows >= 0) & (rows < cached.size(0))])
+        delta = (ego[rows] - ego[rows].detach()) * self.ego_weight
+        return cached.index_add(0, rows, delta)
@@ -0,0 +1,102 @@
+import torch
+import torch.multiprocessing as mp
+import numpy as np
+import queue
+
+
+class GraphSampleProducer():
+    """
+    Background process that samples the graph training triples of epoch k+1 while epoch k trains.
+
+    sample_fn is one of the vectorized samplers in ./utils.py, e.g. UniformSample_vectorized or
+    UniformSample_vectorized_KGE; every epoch's output is shuffled and written into a shared-memory
+    buffer, so the trainer only has to pick up the ready buffer:
+
+        producer = GraphSampleProducer(UniformSample_vectorized, graph_loader, num_epochs, seed)
+        for epoch in range(num_epochs):
+            users, posItems, negItems = producer.next()
+        producer.close()
+
+    start_epoch > 0 resumes a producer after epochs that were already trained, with the same samples.
+    """
+
+    def __init__(self, sample_fn, dataset, num_epochs, seed, num_buffers=2, start_epoch=0):
+        self.num_epochs = num_epochs
+        self.seed = seed
+        self.epoch = start_epoch
+        self.start_epoch = start_epoch
+
+        #第一个epoch在主进程中采样, 同时确定字段数与buffer大小;
+        first = self._sample(sample_fn, dataset, seed, start_epoch)
+        self.num_fields = len(first)
+        capacity = max(dataset.trainDataSize, len(getattr(dataset, 'all_head_list', [])), len(first[0]))
+        self.buffers = torch.zeros(num_buffers, self.num_fields, capacity, dtype=torch.long).share_memory_()
+        self.first = first
+
+        # fork: 子进程直接继承dataset(包括已缓存的CSR数组), 不需要pickle;
+        ctx = mp.get_context('fork')
+        self.free_queue = ctx.Queue()
+        self.ready_queue = ctx.Queue()
+        for slot in range(num_buffers):
+            self.free_queue.put(slot)
+        self.process = ctx.Process(target=self._produce,
+                                   args=(sample_fn, dataset, seed, start_epoch, num_epochs, self.buffers, self.free_queue, self.ready_queue),
+                                   daemon=True)
+        self.process.start()
+
+    @staticmethod
+    def _sample(sample_fn, dataset, seed, epoch, shard=None):
+        """
+        Deterministic per-epoch sample: the result only depends on (seed, epoch). The sampler draws from its own
+        RandomState, the global numpy RNG of the calling process is left untouched.
+        :param shard: (worker, num_workers), only sample the worker's slice, from a RandomState of its own
+        """
+        if shard is None:
+            rng = np.random.RandomState((seed * 1000003 + epoch) % (2 ** 32))
+            S = [np.asarray(x, dtype=np.int64) for x in sample_fn(dataset, rng=rng)]
+        else:
+            rng = np.random.RandomState([seed % (2 ** 32), epoch, shard[0]])
+            S = [np.asarray(x, dtype=np.int64) for x in sample_fn(dataset, rng=rng, shard=shard)]
+        perm = rng.permutation(len(S[0]))
+        return [x[perm] for x in S]
+
+    @staticmethod
+    def _produce(sample_fn, dataset, seed, start_epoch, num_epochs, buffers, free_queue, ready_queue):
+        torch.set_num_threads(1)
+        for epoch in range(start_epoch + 1, num_epochs):
+            slot = free_queue.get()
+            S = GraphSampleProducer._sample(sample_fn, dataset, seed, epoch)
+            n = len(S[0])
+            buffers[slot, :, :n] = torch.from_numpy(np.stack(S))
+            ready_queue.put((epoch, slot, n))
+
+    def next(self):
+        """
+        :return:
+            tuple of LongTensor (n), the shuffled fields of the next epoch
+        """
+        if self.epoch >= self.num_epochs:
+            raise StopIteration
+        if self.epoch == self.start_epoch:
+            S = tuple(torch.from_numpy(x) for x in self.first)
+            self.first = None
+        else:
+            epoch, slot, n = self._get_ready()
+            assert epoch == self.epoch
+            S = tuple(self.buffers[slot, :, :n].clone())
+            self.free_queue.put(slot)
+        self.epoch += 1
+        return S
+
+    def _get_ready(self):
+        while True:
+            try:
+                return self.ready_queue.get(timeout=1)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError('Graph sample producer exited with code {}'.format(self.process.exitcode))
+
+    def close(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
@@ -219,6 +219,250 @@ def UniformSample_original(dataset, rel_type=None):
     print("sample time:", total)
     return np.array(S)
 
+def build_bpr_csr(dataset, name='allPos'):
+    """
+    Flatten a per-user item list of the dataset (allPos / allNeg) into CSR arrays, cached on the dataset.
+    :return:
+        indptr: (n_users + 1), offsets of each user's items in indices
+        indices: (nnz), items, user by user
+        keys: (nnz), sorted user * m_items + item, for membership lookups
+    """
+    if not hasattr(dataset, '_bpr_csr'):
+        dataset._bpr_csr = {}
+    if name in dataset._bpr_csr:
+        return dataset._bpr_csr[name]
+    lists = getattr(dataset, name)
+    degree = np.array([len(items) for items in lists], dtype=np.int64)
+    indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum(degree, out=indptr[1:])
+    if indptr[-1] > 0:
+        indices = np.concatenate([np.asarray(items, dtype=np.int64) for items in lists])
+    else:
+        indices = np.zeros(0, dtype=np.int64)
+    rows = np.repeat(np.arange(len(lists), dtype=np.int64), degree)
+    keys = np.sort(rows * dataset.m_items + indices)
+    dataset._bpr_csr[name] = (indptr, indices, keys)
+    return dataset._bpr_csr[name]
+
+
+def is_member(keys, query):
+    """
+    Vectorized membership test of query in the sorted int64 array keys.
+    """
+    if len(keys) == 0:
+        return np.zeros(len(query), dtype=bool)
+    pos = np.searchsorted(keys, query)
+    pos[pos == len(keys)] = len(keys) - 1
+    return keys[pos] == query
+
+
+def sample_from_csr(indptr, indices, rows, rng=np.random):
+    """
+    Draw one entry uniformly from each given row of a CSR (every row must be non-empty).
+    """
+    degree = indptr[rows + 1] - indptr[rows]
+    offset = (rng.random(len(rows)) * degree).astype(np.int64)
+    return indices[indptr[rows] + offset]
+
+
+def draw_indices(n, size, rng=np.random, shard=None):
+    """
+    Draw size indices uniformly from range(n).
+    :param shard: (worker, num_workers), only draw from the worker's slice range(worker, n, num_workers), with
+        its proportional share of size; the draws of all workers together follow the distribution of one full draw
+    """
+    if shard is None:
+        return rng.randint(0, n, size, dtype=np.int64)
+    worker, num_workers = shard
+    part = np.arange(worker, n, num_workers, dtype=np.int64)
+    share = int(round(size * len(part) / n))
+    return part[rng.randint(0, len(part), share, dtype=np.int64)]
+
+
+def sample_users_with_pos(dataset, indptr, rng=np.random, shard=None):
+    """
+    Draw trainDataSize users uniformly and drop those without positives, as UniformSample_original does.
+    """
+    degree = indptr[1:] - indptr[:-1]
+    users = draw_indices(dataset.n_users, dataset.trainDataSize, rng, shard)
+    return users[degree[users] > 0]
+
+
+def UniformSample_vectorized(dataset, rel_type=None, rng=np.random, shard=None):
+    """
+    Vectorized version of UniformSample_original, the whole epoch is drawn in bulk.
+    :param shard: (worker, num_workers), only sample the users of this worker's slice, see draw_indices
+    :return:
+        users, posItems, negItems: LongTensor (n), each triple is <user, positem, negitem>
+    The parameter 'dataset' is from ./dataloaders/graph.py, class Loader;
+    """
+    indptr, indices, keys = build_bpr_csr(dataset)
+    users = sample_users_with_pos(dataset, indptr, rng, shard)
+    posItems = sample_from_csr(indptr, indices, users, rng)
+
+    #碰撞(负样本落在正样本中)的位置整体重采样, 直到没有碰撞;
+    negItems = rng.randint(0, dataset.m_items, len(users), dtype=np.int64)
+    collide = np.flatnonzero(is_member(keys, users * dataset.m_items + negItems))
+    while len(collide) > 0:
+        negItems[collide] = rng.randint(0, dataset.m_items, len(collide), dtype=np.int64)
+        hit = is_member(keys, users[collide] * dataset.m_items + negItems[collide])
+        collide = collide[hit]
+
+    return torch.from_numpy(users), torch.from_numpy(posItems), torch.from_numpy(negItems)
+
+
+def UniformSample_vectorized_v2(dataset, rel_type=None, rng=np.random):
+    """
+    Vectorized version of UniformSample_original_v2, negatives are drawn from dataset.allNeg.
+    :return:
+        users, posItems, negItems: LongTensor (n), each triple is <user, positem, negitem>
+    """
+    indptr, indices, _ = build_bpr_csr(dataset)
+    neg_indptr, neg_indices, _ = build_bpr_csr(dataset, 'allNeg')
+    users = sample_users_with_pos(dataset, indptr, rng)
+    posItems = sample_from_csr(indptr, indices, users, rng)
+    negItems = sample_from_csr(neg_indptr, neg_indices, users, rng)
+
+    return torch.from_numpy(users), torch.from_numpy(posItems), torch.from_numpy(negItems)
+
+
+def build_kg_csr(dataset):
+    """
+    Group the <head, rel, tail> triples of the dataset by head into CSR arrays, cached on the dataset.
+    :return:
+        heads: (n_heads), distinct heads
+        indptr: (n_heads + 1), offsets of each head's (rel, tail) pairs
+        rels, tails: (n_triples), ordered by head
+        keys: (n_triples), sorted (head * n_rel + rel) * n_tail + tail, for membership lookups
+        n_rel, n_tail: the strides used in keys
+    """
+    csr = getattr(dataset, '_kg_csr', None)
+    if csr is not None:
+        return csr
+    all_head = np.asarray(dataset.all_head_list, dtype=np.int64)
+    all_rel = np.asarray(dataset.all_rel_list, dtype=np.int64)
+    all_tail = np.asarray(dataset.all_tail_list, dtype=np.int64)
+
+    order = np.argsort(all_head, kind='stable')
+    heads, counts = np.unique(all_head[order], return_counts=True)
+    indptr = np.zeros(len(heads) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    n_rel = int(all_rel.max()) + 1
+    n_tail = int(all_tail.max()) + 1
+    keys = np.sort((all_head * n_rel + all_rel) * n_tail + all_tail)
+
+    csr = (heads, indptr, all_rel[order], all_tail[order], keys, n_rel, n_tail)
+    dataset._kg_csr = csr
+    return csr
+
+
+def is_kg_member(dataset, heads, rels, tails):
+    """
+    Vectorized test of whether <head, rel, tail> is a triple of the dataset.
+    """
+    _, _, _, _, keys, n_rel, n_tail = build_kg_csr(dataset)
+    inside = tails < n_tail
+    member = np.zeros(len(tails), dtype=bool)
+    member[inside] = is_member(keys, (heads[inside] * n_rel + rels[inside]) * n_tail + tails[inside])
+    return member
+
+
+def sample_kg_triples(dataset, attribute_voc, rng=np.random, shard=None):
+    """
+    Vectorized version of sample_pos_triples_for_h / sample_neg_triples_for_h over a whole epoch:
+    len(all_head_list) heads are drawn uniformly, each with one positive (rel, tail) and one corrupted tail.
+    :param shard: (worker, num_workers), only sample the heads of this worker's slice, see draw_indices
+    :return:
+        np.array (trainNumber) each: heads, rels, pos_tails, neg_tails
+    """
+    heads, indptr, rels, tails, _, _, _ = build_kg_csr(dataset)
+
+    head_index = draw_indices(len(heads), len(dataset.all_head_list), rng, shard)
+    trainNumber = len(head_index)
+    degree = indptr[head_index + 1] - indptr[head_index]
+    triple_index = indptr[head_index] + (rng.random(trainNumber) * degree).astype(np.int64)
+    sample_heads = heads[head_index]
+    sample_rels = rels[triple_index]
+    sample_pos_tails = tails[triple_index]
+
+    #(head, rel, neg_tail)落在已有三元组中的位置整体重采样;
+    sample_neg_tails = rng.randint(0, attribute_voc, trainNumber, dtype=np.int64)
+    collide = np.flatnonzero(is_kg_member(dataset, sample_heads, sample_rels, sample_neg_tails))
+    while len(collide) > 0:
+        sample_neg_tails[collide] = rng.randint(0, attribute_voc, len(collide), dtype=np.int64)
+        hit = is_kg_member(dataset, sample_heads[collide], sample_rels[collide], sample_neg_tails[collide])
+        collide = collide[hit]
+    return sample_heads, sample_rels, sample_pos_tails, sample_neg_tails
+
+
+def UniformSample_vectorized_KGE(dataset, rel_type=None, rng=np.random, shard=None):
+    """
+    Vectorized version of UniformSample_original_KGE.
+    :param shard: (worker, num_workers), only sample the heads of this worker's slice, see draw_indices
+    :return:
+        heads, rels, posTails, negTails: LongTensor (trainNumber)
+    """
+    attribute_voc = max([item[1] for item in dataset.attribute2id.items()]) + 1
+    S = sample_kg_triples(dataset, attribute_voc, rng, shard)
+    return tuple(torch.from_numpy(x) for x in S)
+
+
+def UniformSample_vectorized_kgat_item2item(dataset, rel_type=None, rng=np.random):
+    """
+    Vectorized version of UniformSample_original_kgat_item2item.
+    :return:
+        heads, rels, posTails, negTails, posUsers, negUsers, relUsers: LongTensor (n)
+    """
+    heads, rels, pos_tails, neg_tails = sample_kg_triples(dataset, len(dataset.attribute2id), rng)
+
+    #allPos[head]是(item, rel)对的列表, 展平为CSR;
+    i2i = getattr(dataset, '_i2i_csr', None)
+    if i2i is None:
+        allPos = dataset.allPos
+        degree = np.array([len(pos) for pos in allPos], dtype=np.int64)
+        indptr = np.zeros(len(allPos) + 1, dtype=np.int64)
+        np.cumsum(degree, out=indptr[1:])
+        pairs = np.array([pair for pos in allPos for pair in pos], dtype=np.int64).reshape(-1, 2)
+        rows = np.repeat(np.arange(len(allPos), dtype=np.int64), degree)
+        keys = np.sort(rows * dataset.n_users + pairs[:, 0])
+        i2i = (indptr, pairs[:, 0].copy(), pairs[:, 1].copy(), keys)
+        dataset._i2i_csr = i2i
+    indptr, items, item_rels, keys = i2i
+
+    #原实现中没有item2item正样本的head无法采样, 此处直接丢弃;
+    valid = indptr[heads + 1] > indptr[heads]
+    heads, rels, pos_tails, neg_tails = heads[valid], rels[valid], pos_tails[valid], neg_tails[valid]
+    degree = indptr[heads + 1] - indptr[heads]
+    pos_index = indptr[heads] + (rng.random(len(heads)) * degree).astype(np.int64)
+    pos_users = items[pos_index]
+    rel_users = item_rels[pos_index]
+
+    neg_users = rng.randint(0, dataset.n_users, len(heads), dtype=np.int64) #都是从user维度采样得到;
+    collide = np.flatnonzero(is_member(keys, heads * dataset.n_users + neg_users))
+    while len(collide) > 0:
+        neg_users[collide] = rng.randint(0, dataset.n_users, len(collide), dtype=np.int64)
+        hit = is_member(keys, heads[collide] * dataset.n_users + neg_users[collide])
+        collide = collide[hit]
+
+    S = (heads, rels, pos_tails, neg_tails, pos_users, neg_users, rel_users)
+    return tuple(torch.from_numpy(x) for x in S)
+
+
+def UniformSample_vectorized_DisMulti(dataset, rel_type=None, rng=np.random):
+    """
+    Vectorized version of UniformSample_original_DisMulti.
+    :return:
+        heads, relTypes, relValues, posTails, negTails: LongTensor (trainNumber)
+    """
+    heads, rels, pos_tails, neg_tails = sample_kg_triples(dataset, len(dataset.item2id), rng)
+    relvalue2type = dataset.relvalue2reltype
+    rel_type_lookup = np.zeros(max(relvalue2type.keys()) + 1, dtype=np.int64)
+    rel_type_lookup[list(relvalue2type.keys())] = list(relvalue2type.values())
+
+    S = (heads, rel_type_lookup[rels], rels, pos_tails, neg_tails)
+    return tuple(torch.from_numpy(x) for x in S)
+
+
 def sample_pos_triples_for_h(kg_dict, head, n_sample_pos_triples):
         pos_triples = kg_dict[head]
         n_pos_triples = len(pos_triples)
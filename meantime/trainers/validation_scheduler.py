@@ -0,0 +1,100 @@
+from meantime.distributed import get_rank, get_world_size
+from meantime.dataloaders.base import ShardSampler
+
+import math
+import numpy as np
+import torch.utils.data as data_utils
+
+
+class ValidationScheduler():
+    """
+    Decides at which epochs a trainer validates, and on which part of the validation set.
+
+    subsample: fraction (<= 1) or number (> 1) of validation instances, drawn once with seed, so that every epoch
+    is scored on the same users and the scores stay comparable. half_width() is the normal confidence interval
+    of the mean from the per-batch values (the trainers average batch means).
+
+    adaptive: after an epoch whose interval reaches the best score so far, validate again at the next epoch,
+    otherwise double the gap up to max_every epochs. The first and the last epoch are always validated.
+
+    With a subsample, the states of the confirm_top best epochs whose intervals overlap the best one are kept in
+    host memory (see observe), and the trainer re-scores them on the full validation set at the end, so the
+    selected model does not hinge on subsample noise.
+    """
+
+    def __init__(self, num_epochs, subsample=None, adaptive=False, max_every=4, confirm_top=3, z=1.96, seed=0):
+        self.num_epochs = num_epochs
+        self.subsample = subsample
+        self.adaptive = adaptive
+        self.max_every = max(max_every or 1, 1)
+        self.confirm_top = max(confirm_top or 1, 1)
+        self.z = z
+        self.seed = seed
+        self.every = 1
+        self.next_epoch = None
+        self.best = None  # (metric, half width)
+        self.kept = []  # dicts of epoch, metric, half_width, snapshot
+
+    def subsample_loader(self, loader):
+        """
+        :return: a loader over the fixed subsample of loader.dataset, None without subsampling
+        """
+        if not self.subsample:
+            return None
+        size = len(loader.dataset)
+        n = int(round(self.subsample * size)) if self.subsample <= 1 else int(self.subsample)
+        n = min(max(n, 1), size)
+        indices = np.sort(np.random.RandomState(self.seed).permutation(size)[:n])
+        subset = data_utils.Subset(loader.dataset, indices.tolist())
+        sampler = ShardSampler(len(subset), get_rank(), get_world_size()) if get_world_size() > 1 else None #多进程时每个进程验证子集的一个分片;
+        return data_utils.DataLoader(subset,
+                                     batch_size=loader.batch_size,
+                                     shuffle=False,
+                                     sampler=sampler,
+                                     pin_memory=loader.pin_memory,
+                                     num_workers=loader.num_workers,
+                                     collate_fn=loader.collate_fn)
+
+    def should_validate(self, epoch):
+        if not self.adaptive or self.next_epoch is None:
+            return True
+        return epoch >= self.next_epoch or epoch == self.num_epochs - 1
+
+    def half_width(self, values, weights=None):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) < 2:
+            return 0.
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=np.float64)
+        mean = np.average(values, weights=weights)
+        var = np.average((values - mean) ** 2, weights=weights) * len(values) / (len(values) - 1)
+        return self.z * math.sqrt(var / len(values))
+
+    def observe(self, epoch, metric, half_width=0., snapshot=None):
+        """
+        :param snapshot: function returning the state to keep for the final confirmation, only called when the
+                         epoch is one of the confirm_top best candidates
+        """
+        near = self.best is None or metric + half_width >= self.best[0]
+        if self.best is None or metric > self.best[0]:
+            self.best = (metric, half_width)
+        self.every = 1 if near else min(self.every * 2, self.max_every)
+        self.next_epoch = epoch + self.every
+
+        if not self.subsample or snapshot is None:
+            return
+        self.kept = [c for c in self.kept if self._overlaps(c['metric'], c['half_width'])]
+        if self._overlaps(metric, half_width):
+            worst = min(self.kept, key=lambda c: c['metric']) if len(self.kept) >= self.confirm_top else None
+            if worst is None or metric > worst['metric']:
+                if worst is not None:
+                    self.kept.remove(worst)
+                self.kept.append({'epoch': epoch, 'metric': metric, 'half_width': half_width, 'snapshot': snapshot()})
+
+    def _overlaps(self, metric, half_width):
+        return metric + half_width >= self.best[0] - self.best[1]
+
+    def candidates(self):
+        """
+        :return: the kept candidates, best subsample score first
+        """
+        return sorted(self.kept, key=lambda c: -c['metric'])
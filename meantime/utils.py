@@ -9,6 +9,8 @@ from torch import optim as optim
 
 import json
 import os
+import io
+import gzip
 import shutil
 import random
 import pkgutil
@@ -17,6 +19,8 @@ import inspect
 import sys
 import argparse
 import filecmp
+import fcntl
+import pickle
 
 
 def all_subclasses(cls):
@@ -144,8 +148,55 @@ def fix_random_seed_as(random_seed):
     cudnn.benchmark = False
 
 
+class FileLock(object):
+    """
+    Exclusive advisory lock (fcntl.flock) on path, held inside a with block. Runs that build the same cached artifact
+    serialize on it: the ones that waited check again and load the artifact instead of building it a second time.
+    The lock file is left in place, removing it would let a third process lock a different inode.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.f = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.f = open(self.path, 'a')
+        fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        self.f.close()
+        self.f = None
+
+
+def pickle_dump_atomic(obj, path):
+    """
+    pickle.dump through a temporary file, so that readers that do not take the lock never see a half-written file
+    """
+    path = str(path)
+    tmp = '{}.tmp{}'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def load_state_dict(path, map_location=None):
+    """
+    torch.load that also reads the gzipped files of AsyncCheckpointWriter(compress=True)
+    """
+    path = os.path.abspath(path)
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    if compressed:
+        with gzip.open(path, 'rb') as f:
+            return torch.load(io.BytesIO(f.read()), map_location=map_location)
+    return torch.load(path, map_location=map_location)
+
+
 def load_pretrained_weights(model, path):
-    chk_dict = torch.load(os.path.abspath(path))
+    chk_dict = load_state_dict(path)
     model_state_dict = chk_dict[STATE_DICT_KEY] if STATE_DICT_KEY in chk_dict else chk_dict['state_dict']
     d = {}
     # this is for stupid reason
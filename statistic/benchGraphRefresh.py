@@ -0,0 +1,113 @@
+"""
+比较finetune时图表征的刷新策略 (GraphRefreshPolicy) 与每个batch都刷新的吞吐与效果:
+
+    python statistic/benchGraphRefresh.py --items 50000 --steps 200 --refresh_steps 1 10 50
+
+在随机item图上训练LightGCN + 一个next-item打分任务 (batch内的 <item, next item> 对, 采样负样本, BPR loss),
+输出 steps/s、最后100步的平均loss、与完整刷新相比表征的最大偏差, 以及训练后在留出的 <item, next item> 对上
+(正样本与 --eval_negatives 个随机负样本排序) 的 Recall@k / NDCG@k.
+"""
+import argparse
+import time
+import numpy as np
+import scipy.sparse as sp
+import torch
+from types import SimpleNamespace
+from dotmap import DotMap
+from meantime.models.transformer_models.lightGCN import LightGCN
+from meantime.trainers.graph_refresh import GraphRefreshPolicy
+from meantime.trainers.utils import recalls_and_ndcgs_for_ks
+
+
+def random_graph(items, degree, seed):
+    rng = np.random.default_rng(seed)
+    heads = np.repeat(np.arange(1, items + 1), degree)
+    tails = np.clip(heads + rng.integers(-200, 200, len(heads)), 1, items)
+    R = sp.csr_matrix((np.ones(len(heads), dtype=np.float32), (heads, tails)), shape=(items + 1, items + 1))
+    adj = sp.bmat([[None, R], [R.T, None]]).tocsr()
+    rowsum = np.asarray(adj.sum(axis=1)).flatten()
+    d_inv = np.power(rowsum, -0.5, where=rowsum > 0, out=np.zeros_like(rowsum))
+    norm_adj = (sp.diags(d_inv).dot(adj).dot(sp.diags(d_inv))).tocoo()
+    graph = torch.sparse_coo_tensor(np.vstack([norm_adj.row, norm_adj.col]), norm_adj.data.astype(np.float32), norm_adj.shape)
+    return graph.coalesce()
+
+
+def build_model(graph, items, dim, seed):
+    config = DotMap({'latent_dim_rec': dim, 'lightGCN_n_layers': 3, 'keep_prob': 0.6, 'A_split': False,
+                     'graph_pretrain': False, 'graph_dropout': False, 'model_init_seed': seed,
+                     'model_init_range': 0.02, 'pooling_type': None}, _dynamic=False)
+    dataset = SimpleNamespace(n_users=items + 1, m_items=items + 1, getSparseGraph=lambda: graph)
+    torch.manual_seed(seed)
+    return LightGCN(config, dataset)
+
+
+def sample_pairs(rng, items, size):
+    anchor = torch.from_numpy(rng.integers(1, items + 1, size))
+    pos = torch.clamp(anchor + torch.from_numpy(rng.integers(-50, 50, size)), 1, items)
+    return anchor, pos
+
+
+def evaluate(model, args, ks):
+    """
+    Recall@k / NDCG@k of the fresh representations on held-out pairs (same seed for every configuration);
+    """
+    rng = np.random.default_rng(12345)
+    anchor, pos = sample_pairs(rng, args.items, args.eval_pairs)
+    candidates = torch.cat([pos[:, None], torch.from_numpy(rng.integers(1, args.items + 1, (args.eval_pairs, args.eval_negatives)))], 1)
+    labels = torch.zeros_like(candidates)
+    labels[:, 0] = 1
+    with torch.no_grad():
+        items = model.getUserItemEmb()[1]
+        scores = (items[anchor][:, None, :] * items[candidates]).sum(-1)
+    return recalls_and_ndcgs_for_ks(scores, labels, ks)
+
+
+def run(graph, rng_seed, args, refresh_steps, drift, touched):
+    model = build_model(graph, args.items, args.dim, 0)
+    policy = GraphRefreshPolicy(model, refresh_steps, drift, touched)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    rng = np.random.default_rng(rng_seed)
+    losses = []
+    start = time.time()
+    for step in range(args.steps):
+        anchor, pos = sample_pairs(rng, args.items, args.batch_size)
+        neg = torch.from_numpy(rng.integers(1, args.items + 1, args.batch_size))
+        _, items = policy.get(torch.cat([anchor, pos, neg]))
+        optimizer.zero_grad()
+        score = (items[anchor] * (items[pos] - items[neg])).sum(-1)
+        loss = torch.nn.functional.softplus(-score).mean()
+        if loss.requires_grad: #两次刷新之间图模型不接收梯度;
+            loss.backward()
+            optimizer.step()
+        losses.append(loss.item())
+    elapsed = time.time() - start
+    with torch.no_grad():
+        fresh = model.getUserItemEmb()[1]
+        stale = policy.cache[1]
+        deviation = (fresh - stale).abs().max().item()
+    metrics = evaluate(model, args, [args.metric_k])
+    return args.steps / elapsed, np.mean(losses[-100:]), policy.num_refresh, deviation, metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=50000)
+    parser.add_argument('--degree', type=int, default=10)
+    parser.add_argument('--dim', type=int, default=64)
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--refresh_steps', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--drift', type=float, default=None)
+    parser.add_argument('--eval_pairs', type=int, default=2000, help='held-out <item, next item> pairs ranked after training')
+    parser.add_argument('--eval_negatives', type=int, default=100, help='random negatives ranked against each held-out pair')
+    parser.add_argument('--metric_k', type=int, default=10)
+    args = parser.parse_args()
+
+    graph = random_graph(args.items, args.degree, 0)
+    recall, ndcg = 'Recall@%d' % args.metric_k, 'NDCG@%d' % args.metric_k
+    print("{:>8} {:>8} {:>10} {:>10} {:>10} {:>12} {:>10} {:>10}".format('refresh', 'touched', 'steps/s', 'loss', '#refresh', 'max stale', recall, ndcg))
+    for refresh_steps in args.refresh_steps:
+        for touched in [False, True]:
+            speed, loss, num_refresh, deviation, metrics = run(graph, 1, args, refresh_steps, args.drift, touched)
+            print("{:>8} {:>8} {:>10.2f} {:>10.4f} {:>10} {:>12.2e} {:>10.4f} {:>10.4f}".format(
+                refresh_steps, str(touched), speed, loss, num_refresh, deviation, metrics[recall], metrics[ndcg]))
@@ -0,0 +1,147 @@
+"""
+比较图预训练的顺序执行与Hogwild (--graph_hogwild_workers) 的吞吐与效果:
+
+    python statistic/benchHogwild.py --users 5000 --items 8000 --interactions 100000 --workers 2 4
+
+在随机user-item图 (item按zipf分布) 与随机kg三元组上, 用graph_sasrec_improve_lightgcn_kgat的预训练代码训练LightGCN与KGAT,
+输出每个模型的 samples/s (每个epoch的训练三元组数 / 时间, KGAT每个epoch采样两次)、合计吞吐相对顺序执行的加速比, 以及训练后在每个user留出的一个正样本上的
+Recall@k 与BPR loss. 顺序执行即 --workers 1; Hogwild的加速取决于可用的CPU核数 (每个worker分到 torch线程数/workers 个线程).
+"""
+import argparse
+import time
+import numpy as np
+import scipy.sparse as sp
+import torch
+import torch.nn as nn
+from types import SimpleNamespace
+from dotmap import DotMap
+from meantime.options.training_parser import TrainingParser
+from meantime.trainers.graph_improve_lightgcn_kgat import GraphTrainer
+from meantime.trainers.utils import UniformSample_vectorized
+
+
+def normalized_graph(R):
+    adj = sp.bmat([[None, R], [R.T, None]]).tocsr()
+    rowsum = np.asarray(adj.sum(axis=1)).flatten()
+    d_inv = np.power(rowsum, -0.5, where=rowsum > 0, out=np.zeros_like(rowsum))
+    norm_adj = (sp.diags(d_inv).dot(adj).dot(sp.diags(d_inv))).tocoo()
+    return torch.sparse_coo_tensor(np.vstack([norm_adj.row, norm_adj.col]), norm_adj.data.astype(np.float32), norm_adj.shape).coalesce()
+
+
+def random_data(args, seed=0):
+    """
+    :return: graph loader, kg loader and the held-out item of each user (users with at least two items)
+    """
+    rng = np.random.default_rng(seed)
+    users = rng.integers(0, args.users, args.interactions)
+    items = (rng.zipf(1.3, args.interactions) + users) % args.items
+    R = sp.csr_matrix((np.ones(args.interactions, dtype=np.float32), (users, items)), shape=(args.users, args.items))
+    R.data[:] = 1
+    R = R.tolil()
+    test = {}
+    for u in range(args.users):
+        if len(R.rows[u]) >= 2:
+            test[u] = R.rows[u][rng.integers(len(R.rows[u]))]
+            R[u, test[u]] = 0
+    R = R.tocsr()
+    R.eliminate_zeros()
+    num_triples = args.interactions // 2
+    heads, rels, tails = rng.integers(0, args.users, num_triples), rng.integers(0, 2, num_triples), rng.integers(0, args.items, num_triples)
+    K = sp.csr_matrix((np.ones(num_triples, dtype=np.float32), (heads, tails)), shape=(args.users, args.items))
+    K.data[:] = 1
+    graph_loader = SimpleNamespace(n_users=args.users, m_items=args.items, trainDataSize=R.nnz, allPos=[list(R[u].indices) for u in range(args.users)],
+                                   getSparseGraph=lambda: normalized_graph(R))
+    kgat_loader = SimpleNamespace(n_users=args.users, m_items=args.items, attribute2id={str(i): i for i in range(args.items)}, rel2id={0: 0, 1: 1},
+                                  all_head_list=list(heads), all_rel_list=list(rels), all_tail_list=list(tails), getSparseGraph=lambda: normalized_graph(K))
+    return graph_loader, kgat_loader, test
+
+
+def build_trainer(graph_loader, kgat_loader, args, workers):
+    """
+    the graph pretraining part of GraphTrainer, without datasets and the sequential model;
+    """
+    config = TrainingParser([]).parse()
+    config.update({'device': 'cpu', 'latent_dim_rec': args.dim, 'lightGCN_n_layers': 2, 'keep_prob': 0.6, 'A_split': False,
+                   'graph_pretrain': False, 'graph_dropout': False, 'model_init_seed': 0, 'model_init_range': 0.02,
+                   'pooling_type': None, 'kgat_merge': 'bilinear', 'kg_l2loss_lambda': 1e-5, 'kgat_output': 'hidden',
+                   'weight_decay': 1e-4, 'bpr_batch_size': args.batch_size, 'lr': args.lr, 'graph_sample_async': False,
+                   'graph_hogwild_workers': workers, 'graph_pretrain_threads': None, 'checkpoint_every': None,
+                   'graph_epochs': args.lightgcn_epochs, 'graph_attribute_epochs': args.kgat_epochs, 'num_epochs': 1,
+                   'optimizer': 'Adam', 'adam_beta1': 0.9, 'adam_beta2': 0.999, 'decay_step': 1, 'gamma': 1.0,
+                   'resume_training': False, 'pilot': True})
+    config = DotMap(config, _dynamic=False)
+    torch.manual_seed(0)
+    np.random.seed(0)
+    #序列模型与数据加载器不参与预训练, 以占位对象代替;
+    t = GraphTrainer(config, nn.Linear(1, 1), [], [], [], None, graph_loader=graph_loader, graph_loader_kgat=kgat_loader)
+    t.lr, t.weight_decay = config.lr, config.weight_decay
+    t.graph_opt = torch.optim.Adam(t.graph_model.parameters(), lr=t.lr)
+    t.graph_opt_attribute = torch.optim.Adam(t.graph_model_kgat.parameters(), lr=t.lr)
+    return t
+
+
+def recall(model, loader, test, k):
+    model.eval()
+    with torch.no_grad():
+        users = torch.tensor(sorted(test))
+        scores = model.getUsersRating(users)
+        for j, u in enumerate(users.tolist()):
+            scores[j, loader.allPos[u]] = -np.inf
+        top = scores.topk(k, 1).indices
+    return np.mean([test[u] in set(top[j].tolist()) for j, u in enumerate(users.tolist())])
+
+
+def bpr(trainer):
+    np.random.seed(123)
+    users, pos, neg = UniformSample_vectorized(trainer.graph_loader)
+    with torch.no_grad():
+        trainer.graph_model.eval()
+        trainer.graph_model_kgat.eval()
+        lightgcn = trainer.graph_model.bpr_loss(users, pos, neg)[0].item()
+        kgat = trainer.graph_model_kgat.bpr_loss(users, pos, neg, torch.zeros_like(users))[0].item()
+    return lightgcn, kgat
+
+
+def run(data, args, workers):
+    graph_loader, kgat_loader, test = data
+    trainer = build_trainer(graph_loader, kgat_loader, args, workers)
+    if workers > 1:
+        elapsed = trainer.pretrainHogwild()
+    else:
+        elapsed = {}
+        s = time.time()
+        trainer.pretrainLightGCN()
+        elapsed['lightgcn'] = time.time() - s
+        s = time.time()
+        trainer.pretrainKGAT()
+        elapsed['kgat'] = time.time() - s
+    samples = (graph_loader.trainDataSize * args.lightgcn_epochs, 2 * len(kgat_loader.all_head_list) * args.kgat_epochs)
+    speed = (samples[0] / elapsed['lightgcn'], samples[1] / elapsed['kgat'], sum(samples) / (elapsed['lightgcn'] + elapsed['kgat']))
+    recalls = (recall(trainer.graph_model, graph_loader, test, args.metric_k), recall(trainer.graph_model_kgat, graph_loader, test, args.metric_k))
+    return speed, bpr(trainer), recalls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--items', type=int, default=8000)
+    parser.add_argument('--interactions', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=32)
+    parser.add_argument('--batch_size', type=int, default=512)
+    parser.add_argument('--lr', type=float, default=0.005)
+    parser.add_argument('--lightgcn_epochs', type=int, default=3)
+    parser.add_argument('--kgat_epochs', type=int, default=2)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4], help='hogwild worker counts compared with the sequential run')
+    parser.add_argument('--metric_k', type=int, default=20)
+    args = parser.parse_args()
+
+    data = random_data(args)
+    results = [(workers, run(data, args, workers)) for workers in [1] + [w for w in args.workers if w > 1]]
+    recall_k = 'Recall@%d' % args.metric_k
+    print("torch threads: {}".format(torch.get_num_threads()))
+    print("{:>8} {:>14} {:>14} {:>8} {:>10} {:>10} {:>12} {:>12}".format(
+        'workers', 'LightGCN/s', 'KGAT/s', 'speedup', 'BPR lgcn', 'BPR kgat', recall_k + ' lgcn', recall_k + ' kgat'))
+    sequential = results[0][1][0]
+    for workers, (speed, losses, recalls) in results:
+        speedup = speed[2] / sequential[2] #两个模型合计的samples/s;
+        print("{:>8} {:>14.0f} {:>14.0f} {:>7.2f}x {:>10.4f} {:>10.4f} {:>12.4f} {:>12.4f}".format(workers, speed[0], speed[1], speedup, losses[0], losses[1], recalls[0], recalls[1]))
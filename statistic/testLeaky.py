@@ -1,62 +1,163 @@
+"""
+检查图文件是否泄露了留一法的答案(test/valid item):
+
+对每个用户, 答案item a与其历史item h之间若存在图边 (a, h), 且 (a, h) 从未在任何用户的训练序列中共同出现,
+则这条边只可能来自被留出的交互, 视为泄露;
+
+    python statistic/testLeaky.py --dataset_path .../dataset.pkl --graph_file .../new_cocurrence_correct.txt
+
+全部使用CSR与向量化查找, 不构建 item x item 的稠密矩阵.
+"""
+import argparse
+import pickle
 import numpy as np
-import pdb
-
-train_f = open('train_data.txt')
-graph_f = open('new_cocurrence_correct.txt')
-
-train_line = train_f.readline()
-train_dict = {}
-train_list_data = []
-vocabulary_items = []
-item2id = {}
-while train_line:
-    train_item = train_line.strip().split(" ")
-    for item in train_item:
-        if item not in item2id:
-            item2id[item] = len(item2id)
-        if item not in vocabulary_items:
-            vocabulary_items.append(item)
-    
-    train_dict[item2id[train_item[0]]] = [item2id[item] for item in train_item[1:]] #第一个元素是test item
-    train_list_data.append(set([item2id[item] for item in train_item[1:]])) #存放训练数据
-    train_line = train_f.readline()
-
-print("Finish Load train_data.")
-
-
-graph_line = graph_f.readline()
-graph_dict = {}
-graph_array = np.zeros((len(vocabulary_items), len(vocabulary_items)))
-while graph_line:
-    graph_item = graph_line.strip().split(" ")
-    # graph_dict[graph_item[0]] = graph_item[1:]
-    output_token = graph_item[0]
-    for token_s in graph_item[1:]:
-        graph_array[item2id[output_token]][item2id[token_s]] = 1.0
-        graph_array[item2id[token_s]][item2id[output_token]] = 1.0
-    graph_line = graph_f.readline()
-
-assert (graph_array == graph_array.transpose()).all()
-
-
-print("Finish Load graph data.")
-#train_dict: {test_item_id: train_items_list}
-for test_item, train_ids in train_dict.items():
-    graph_co_items = np.where(graph_array[test_item] > 0.0)[0]
-    graph_co_items_column = np.where(graph_array[:][test_item] > 0.0)[0]
-    assert set(graph_co_items) == set(graph_co_items_column)
-
-    item_valid  = list(set(train_ids) & set(graph_co_items))
-    #是否出现在训练集中
-    valid_number = 0
-    for item_s in item_valid:
-        for train_list_items in train_list_data:
-            if set([test_item, item_s]).issubset(train_list_items):
-                valid_number += 1
-                break
-    
-    if len(item_valid) != valid_number:
-        print("信息泄露了!!!!!")
-        pdb.set_trace()
+import scipy.sparse as sp
+from time import time
+from meantime.trainers.utils import is_member
+
+
+def load_graph(graph_file, smap, item_count):
+    """
+    graph_filename格式: 每行 head neighbor_1 ... neighbor_k (原始item id), 返回对称的csr (item_count + 1, item_count + 1);
+    文件中的id是字符串, smap的键可能是int (ml_1m, ml_20m), 统一按str比较; 没有任何一条边能对应到smap时报错.
+    """
+    lookup = {str(key): value for key, value in smap.items()}
+    heads, tails = [], []
+    tokens, unknown = 0, 0
+    with open(graph_file) as f:
+        for l in f.readlines():
+            l = l.strip('\n').split(' ')
+            if len(l) > 1:
+                tokens += len(l)
+                items = [lookup[i] for i in l[1:] if i in lookup]
+                unknown += len(l) - 1 - len(items)
+                if l[0] not in lookup:
+                    unknown += 1
+                    continue
+                heads.extend([lookup[l[0]]] * len(items))
+                tails.extend(items)
+    if len(heads) == 0:
+        raise ValueError('None of the {} item ids of {} is in the smap of the dataset (e.g. {}), wrong dataset or graph file?'.format(
+            tokens, graph_file, list(lookup)[:3]))
+    if unknown > 0:
+        print("{} of {} item ids of the graph file are not in the smap, their edges are ignored".format(unknown, tokens))
+    graph = sp.csr_matrix((np.ones(len(heads), dtype=np.float32), (heads, tails)), shape=(item_count + 1, item_count + 1))
+    graph = (graph + graph.T).tocsr()
+    graph.sort_indices()
+    return graph
+
+
+def csr_keys(matrix):
+    """
+    sorted keys row * n_cols + col of all stored entries, used for vectorized membership test;
+    """
+    matrix = matrix.tocsr()
+    matrix.sort_indices()
+    rows = np.repeat(np.arange(matrix.shape[0], dtype=np.int64), np.diff(matrix.indptr))
+    return rows * matrix.shape[1] + matrix.indices.astype(np.int64)
+
+
+def answer_history_pairs(user2dict, train_targets, targets):
+    """
+    :return: users, answers, histories of every (user, answer, history item) pair, history is the training range of the user
+    """
+    train_end = dict(train_targets)
+    users, answers, histories = [], [], []
+    for user, position in targets:
+        items = user2dict[user]['items']
+        history = np.unique(np.asarray(items[:train_end.get(user, position)], dtype=np.int64))
+        history = history[history != items[position]]
+        users.append(np.full(len(history), user, dtype=np.int64))
+        answers.append(np.full(len(history), items[position], dtype=np.int64))
+        histories.append(history)
+    return np.concatenate(users), np.concatenate(answers), np.concatenate(histories)
+
+
+def train_matrix(user2dict, train_targets, user_count, item_count):
+    rows, cols = [], []
+    for user, end in train_targets:
+        items = np.asarray(user2dict[user]['items'][:end], dtype=np.int64)
+        rows.append(np.full(len(items), user, dtype=np.int64))
+        cols.append(items)
+    X = sp.csr_matrix((np.ones(sum(len(c) for c in cols), dtype=np.float32), (np.concatenate(rows), np.concatenate(cols))),
+                      shape=(user_count + 1, item_count + 1))
+    X.data[:] = 1.
+    return X
 
-print("success!!!!")
\ No newline at end of file
+
+def train_cooccurrence(X, answers, histories, items_per_chunk=4096):
+    """
+    (answer, history) 是否在某个训练序列中共同出现: 只对出现过的答案item按块计算 X[:, A]^T X;
+    """
+    X_csc = X.tocsc()
+    supported = np.zeros(len(answers), dtype=bool)
+    unique_answers = np.unique(answers)
+    n = X.shape[1]
+    for start in range(0, len(unique_answers), items_per_chunk):
+        block = unique_answers[start:start + items_per_chunk]
+        co = X_csc[:, block].T.tocsr().dot(X).tocsr()
+        co.sort_indices()
+        keys = csr_keys(co) #行号为block中的位置;
+        mask = np.isin(answers, block)
+        query = np.searchsorted(block, answers[mask]).astype(np.int64) * n + histories[mask]
+        supported[mask] = is_member(keys, query)
+    return supported
+
+
+def check_leakage(dataset, graph, mode='test'):
+    """
+    :return: dict of aggregate statistics, and per-user arrays (user, graph edges to history, leaky edges)
+    """
+    user2dict = dataset['user2dict']
+    targets = dataset['test_targets'] if mode == 'test' else dataset['validation_targets']
+    item_count = len(dataset['smap'])
+    user_count = len(dataset['umap'])
+
+    users, answers, histories = answer_history_pairs(user2dict, dataset['train_targets'], targets)
+    graph_keys = csr_keys(graph)
+    on_graph = is_member(graph_keys, answers * graph.shape[1] + histories)
+
+    X = train_matrix(user2dict, dataset['train_targets'], user_count, item_count)
+    leaky = np.zeros(len(answers), dtype=bool)
+    leaky[on_graph] = ~train_cooccurrence(X, answers[on_graph], histories[on_graph])
+
+    edges_per_user = np.bincount(users, on_graph, minlength=user_count + 1)
+    leaky_per_user = np.bincount(users, leaky, minlength=user_count + 1)
+    target_users = np.asarray([user for user, _ in targets], dtype=np.int64)
+    stats = {
+        'users': len(target_users),
+        'pairs': len(answers),
+        'graph_edges': int(on_graph.sum()),
+        'leaky_edges': int(leaky.sum()),
+        'users_with_graph_edge': int((edges_per_user[target_users] > 0).sum()),
+        'users_with_leak': int((leaky_per_user[target_users] > 0).sum()),
+        'graph_nnz': int(graph.nnz),
+    }
+    stats['leaky_user_ratio'] = stats['users_with_leak'] / max(stats['users'], 1)
+    return stats, (target_users, edges_per_user[target_users], leaky_per_user[target_users])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset_path', type=str, required=True, help='preprocessed dataset.pkl')
+    parser.add_argument('--graph_file', type=str, required=True, help='graph file in the graph_filename format')
+    parser.add_argument('--mode', type=str, default='test', choices=['test', 'val'], help='which leave-one-out answers to check')
+    parser.add_argument('--per_user_output', type=str, help='optional csv: user, graph edges to history, leaky edges')
+    args = parser.parse_args()
+
+    s = time()
+    dataset = pickle.load(open(args.dataset_path, 'rb'))
+    graph = load_graph(args.graph_file, dataset['smap'], len(dataset['smap']))
+    print("Finish Load graph data. {:.1f}s".format(time() - s))
+
+    stats, (users, edges, leaks) = check_leakage(dataset, graph, args.mode)
+    for key, value in stats.items():
+        print("{}: {}".format(key, value))
+    if args.per_user_output:
+        np.savetxt(args.per_user_output, np.stack([users, edges, leaks], axis=1), fmt='%d', delimiter=',',
+                   header='user,graph_edges,leaky_edges', comments='')
+    print("costing {:.1f}s".format(time() - s))
+    if stats['leaky_edges'] > 0:
+        print("信息泄露了!!!!!")
+    else:
+        print("success!!!!")
@@ -0,0 +1,154 @@
+"""
+A GraphTrainer (graph_sasrec_improve_lightgcn_kgat) on a tiny synthetic graph, built without datasets:
+the graph loaders, the sequential model and the data loaders passed to GraphTrainer.__init__ are small stand-ins.
+"""
+import random
+
+import numpy as np
+import scipy.sparse as sp
+import torch
+import torch.nn as nn
+from types import SimpleNamespace
+from dotmap import DotMap
+
+from meantime.options.training_parser import TrainingParser
+from meantime.trainers.graph_improve_lightgcn_kgat import GraphTrainer
+from meantime.trainers.utils import recalls_and_ndcgs_for_ks
+
+NUM_USERS, NUM_ITEMS, NUM_EDGES, NUM_TRIPLES = 30, 40, 200, 150
+BATCH_SIZE, NUM_BATCHES, NUM_CANDIDATES = 16, 4, 6
+
+
+def normalized_graph(R):
+    adj = sp.bmat([[None, R], [R.T, None]]).tocsr()
+    d = np.asarray(adj.sum(1)).flatten()
+    d_inv = np.power(d, -0.5, where=d > 0, out=np.zeros_like(d))
+    norm_adj = (sp.diags(d_inv) @ adj @ sp.diags(d_inv)).tocoo()
+    return torch.sparse_coo_tensor(np.vstack([norm_adj.row, norm_adj.col]), norm_adj.data.astype(np.float32), norm_adj.shape).coalesce()
+
+
+def synthetic_graphs():
+    rng = np.random.default_rng(0)
+    R = sp.csr_matrix((np.ones(NUM_EDGES), (rng.integers(0, NUM_USERS, NUM_EDGES), rng.integers(0, NUM_ITEMS, NUM_EDGES))), shape=(NUM_USERS, NUM_ITEMS))
+    R.data[:] = 1
+    heads, rels, tails = rng.integers(0, NUM_USERS, NUM_TRIPLES), rng.integers(0, 2, NUM_TRIPLES), rng.integers(0, NUM_ITEMS, NUM_TRIPLES)
+    K = sp.csr_matrix((np.ones(NUM_TRIPLES), (heads, tails)), shape=(NUM_USERS, NUM_ITEMS))
+    K.data[:] = 1
+    graph_loader = SimpleNamespace(n_users=NUM_USERS, m_items=NUM_ITEMS, trainDataSize=NUM_EDGES, allPos=[list(R[u].indices) for u in range(NUM_USERS)],
+                                   getSparseGraph=lambda: normalized_graph(R))
+    kgat_loader = SimpleNamespace(n_users=NUM_USERS, m_items=NUM_ITEMS, attribute2id={str(i): i for i in range(NUM_ITEMS)}, rel2id={0: 0, 1: 1},
+                                  all_head_list=list(heads), all_rel_list=list(rels), all_tail_list=list(tails), getSparseGraph=lambda: normalized_graph(K))
+    return graph_loader, kgat_loader
+
+
+class SeededState():
+    def __init__(self):
+        self.rng = random.Random(0)
+
+    def get_rng_state(self):
+        return self.rng.getstate()
+
+    def set_rng_state(self, state):
+        self.rng.setstate(state)
+
+
+class Loader(list):
+    """
+    list of batches with the rng-state interface of the repo's dataloaders;
+    """
+    def __init__(self, batches):
+        super().__init__(batches)
+        self.dataset = SeededState()
+        self.sampler = SeededState()
+
+
+class SequentialStub(nn.Module):
+    """
+    scores items from the two graph representations, like the SAS models do after setUserItemRepFromGraph;
+    """
+    def __init__(self, dim):
+        super().__init__()
+        self.lin = nn.Linear(dim, dim)
+
+    def createMergeParameter(self):
+        self.merge = nn.Linear(self.lin.in_features, self.lin.out_features)
+
+    def setUserItemRepFromGraph(self, users, items, users_kgat, items_kgat):
+        self.items, self.items_kgat = items, items_kgat
+
+    def forward(self, batch):
+        h = self.merge(self.lin(self.items[batch['tokens']] + self.items_kgat[batch['tokens']].detach()))
+        scores = h @ self.items.t()
+        loss = nn.functional.cross_entropy(scores, batch['labels'], reduction='none')
+        return {'loss': loss, 'loss_cnt': torch.ones_like(loss), 'scores': scores.gather(1, batch['candidates'])}
+
+
+class RecordingLoggerService():
+    def __init__(self):
+        self.val = []
+
+    def log_train(self, log_data):
+        pass
+
+    def log_val(self, log_data):
+        self.val.append((log_data['epoch'], round(log_data['NDCG@5'], 6)))
+
+    def log_test(self, log_data):
+        pass
+
+    def complete(self, log_data):
+        pass
+
+
+def make_batches(rank=0, world_size=1):
+    g = torch.Generator().manual_seed(1)
+    batches = []
+    for _ in range(NUM_BATCHES):
+        tokens = torch.randint(0, NUM_ITEMS, (BATCH_SIZE,), generator=g)
+        labels = torch.randint(0, NUM_ITEMS, (BATCH_SIZE,), generator=g)
+        candidates = torch.cat([labels[:, None], torch.randint(0, NUM_ITEMS, (BATCH_SIZE, NUM_CANDIDATES - 1), generator=g)], 1)
+        batch = {'tokens': tokens, 'labels': labels, 'candidates': candidates}
+        batches.append({k: v[rank::world_size] for k, v in batch.items()})
+    return Loader(batches)
+
+
+def make_args(**kwargs):
+    conf = TrainingParser([]).parse()
+    conf.update(device='cpu', latent_dim_rec=8, lightGCN_n_layers=2, keep_prob=0.6, A_split=False, graph_pretrain=False, graph_dropout=False,
+                model_init_seed=0, model_init_range=0.02, kgat_merge='bilinear', kg_l2loss_lambda=1e-5, kgat_output='hidden',
+                weight_decay=1e-4, bpr_batch_size=64, lr=0.01, finetune_flag=True, graph_subgraph_fanout=[3], train_batch_size=BATCH_SIZE,
+                graph_epochs=3, graph_attribute_epochs=2, num_epochs=5, metric_ks=[5], best_metric='NDCG@5', graph_refresh_steps=2,
+                pooling_type=None, optimizer='Adam', adam_beta1=0.9, adam_beta2=0.999, decay_step=1, gamma=1.0,
+                resume_training=False, pilot=True, log_period_as_iter=10 ** 9)
+    conf.update(kwargs)
+    return DotMap(conf, _dynamic=False)
+
+
+def make_trainer(root, rank=0, world_size=1, **kwargs):
+    """
+    :param root: local_export_root, the checkpoint goes to root/models
+    :param rank, world_size: the trainer sees every world_size-th example of each batch, like a DistributedSampler shard
+    """
+    args = make_args(**kwargs)
+    torch.manual_seed(0)
+    np.random.seed(0)
+    random.seed(0)
+    graph_loader, graph_loader_kgat = synthetic_graphs()
+    t = GraphTrainer(args, SequentialStub(args.latent_dim_rec), make_batches(rank, world_size), make_batches(rank, world_size),
+                     make_batches(rank, world_size), root, graph_loader=graph_loader, graph_loader_kgat=graph_loader_kgat)
+    #pilot: 不创建loggers, 不显示进度条; 但仍训练全部epoch与batch;
+    t.num_epochs, t.pilot_batch_cnt = args.num_epochs, NUM_BATCHES
+    t.logger_service = RecordingLoggerService()
+    t.calculate_metrics = lambda batch: calculate_metrics(t, batch)
+    return t
+
+
+def calculate_metrics(trainer, batch):
+    labels = torch.zeros_like(batch['candidates'])
+    labels[:, 0] = 1
+    return recalls_and_ndcgs_for_ks(trainer.model(batch)['scores'], labels, trainer.metric_ks)
+
+
+def parameters(trainer):
+    modules = [trainer.graph_model, trainer.graph_model_kgat, trainer.model]
+    return torch.cat([p.detach().flatten() for m in modules for p in m.parameters()])
@@ -0,0 +1,42 @@
+import pytest
+from dotmap import DotMap
+
+from meantime.dataloaders.graph import GraphLoader
+from meantime.datasets.cooccurrence import build_cooccurrence_graph
+
+
+def make_dataset(keys):
+    # sequences over internal ids 1..4; the last item of each user is held out
+    user2dict = {1: {'items': [1, 2, 3, 4]}, 2: {'items': [2, 3, 1]}}
+    return {
+        'smap': {key: i + 1 for i, key in enumerate(keys)},
+        'user2dict': user2dict,
+        'train_targets': [(1, 3), (2, 2)],
+    }
+
+
+@pytest.mark.parametrize('keys', [[10, 20, 30, 40], ['10', '20', '30', '40']])
+def test_build_cooccurrence_graph(tmp_path, keys):
+    output = tmp_path / 'graph.txt'
+    build_cooccurrence_graph(make_dataset(keys), str(output), window=1, topk=5)
+    lines = [line.split() for line in output.read_text().splitlines()]
+    graph = {line[0]: line[2:] for line in lines}
+    assert all(line[0] == line[1] for line in lines)  # self loop
+    assert graph == {'10': ['20'], '20': ['30', '10'], '30': ['20'], '40': []}
+
+
+@pytest.mark.parametrize('keys', [[10, 20, 30, 40], ['10', '20', '30', '40']])
+def test_graph_loader_reads_cooccurrence_graph(tmp_path, keys):
+    dataset = make_dataset(keys)
+    build_cooccurrence_graph(dataset, str(tmp_path / 'graph.txt'), window=1, topk=5)
+    config = DotMap({'graph_path': str(tmp_path), 'graph_filename': '/graph.txt', 'rm_self_node': False, 'model_code': 'sas',
+                     'experiment_name': 'test', 'item_order': None, 'A_split': False, 'device': 'cpu'}, _dynamic=False)
+    loader = GraphLoader(config, item2id=dataset['smap'])
+
+    #内部id: 10->1, 20->2, 30->3, 40->4, 每个item有自连边;
+    assert loader.n_users == loader.m_items == 5
+    assert loader.allPos[1].tolist() == [1, 2]
+    assert loader.allPos[2].tolist() == [1, 2, 3]
+    assert loader.allPos[3].tolist() == [2, 3]
+    assert loader.allPos[4].tolist() == [4]
+    assert loader.getSparseGraph().shape == (10, 10)
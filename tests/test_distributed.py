@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+import yaml
+from dotmap import DotMap
+
+from graph_harness import make_trainer, parameters
+from meantime.config import RECENT_STATE_DICT_FILENAME, TRAIN_LOADER_SAMPLER_RNG_STATE_DICT_KEY
+from meantime.dataloaders.sas import SasDataloader
+from meantime.datasets.base import AbstractDataset
+from meantime.distributed import get_rank, get_world_size, launch
+from meantime.models import model_factory
+from meantime.options.training_parser import TrainingParser
+from meantime.top.training import main, setup
+from meantime.trainers.sas import SASTrainer
+
+TEMPLATE = os.path.join(os.path.dirname(__file__), '..', 'templates', 'train_sas_dataset_toys.yaml')
+
+
+def train_and_save(conf):
+    """
+    trains the synthetic GraphTrainer on this rank's shard of every batch and saves its parameters;
+    """
+    rank, world_size = get_rank(), get_world_size()
+    trainer = make_trainer(os.path.join(conf.root, str(rank)), rank, world_size,
+                           graph_subgraph_fanout=None, checkpoint_every=None, resume_checkpoint=False)
+    trainer.graph_model.subgraph_sampler = trainer.graph_model_kgat.subgraph_sampler = None
+    trainer.train()
+    torch.save({'parameters': parameters(trainer), 'val': trainer.logger_service.val}, os.path.join(conf.root, 'rank{}_of_{}.pth'.format(rank, world_size)))
+
+
+def test_two_ranks_match_single_process(tmp_path):
+    root = str(tmp_path)
+    train_and_save(DotMap({'root': root}))
+    launch(train_and_save, {'root': root}, 2)
+
+    single = torch.load(os.path.join(root, 'rank0_of_1.pth'))
+    rank0, rank1 = [torch.load(os.path.join(root, 'rank{}_of_2.pth'.format(r))) for r in range(2)]
+    #每个batch后平均梯度, 各进程的参数完全相同;
+    assert torch.equal(rank0['parameters'], rank1['parameters'])
+    #两个分片的平均梯度等于完整batch的梯度, 只有浮点求和顺序不同;
+    assert torch.allclose(rank0['parameters'], single['parameters'], atol=1e-5)
+    #验证集分片上的指标合并后与单进程相同;
+    assert rank0['val'] == single['val']
+
+
+class ToyDataset(AbstractDataset):
+    """
+    11 users with 6 distinct items each, one day apart;
+    """
+    @classmethod
+    def code(cls):
+        return 'toy'
+
+    @classmethod
+    def url(cls):
+        return None
+
+    def load_ratings_df(self):
+        pass
+
+    def load_ratings_df_from_json(self):
+        rng = np.random.RandomState(0)
+        rows = [(u, int(s), 1, 86400 * t) for u in range(11) for t, s in enumerate(rng.choice(40, 6, replace=False))]
+        return pd.DataFrame(rows, columns=['uid', 'sid', 'rating', 'timestamp'])
+
+
+def sas_conf(root, name):
+    conf = TrainingParser([]).parse()
+    conf.update(yaml.safe_load(open(TEMPLATE)))
+    conf.update(local_data_folder=os.path.join(root, 'data'), dataset_code='toy', min_uc=2, min_sc=0, skip_preprocess=True,
+                add_side_info_flag=False, add_behavior_type_neighbor_flag=False, sparsity_ratio=1.0,
+                train_batch_size=4, val_batch_size=3, test_batch_size=3, train_negative_sample_size=10, test_negative_sample_size=10,
+                device='cpu', use_parallel=False, model_code='sas', max_len=8, num_epochs=2, metric_ks=[1, 5, 10],
+                experiment_root=root, experiment_name=name, root=root)
+    return conf
+
+
+def train_sas(conf):
+    """
+    builds the sas dataloaders and SASTrainer like top.training.train and records the batches of the first epoch;
+    """
+    rank, world_size = get_rank(), get_world_size()
+    local_export_root, _, _ = setup(conf)
+    train_loader, val_loader, test_loader = SasDataloader(conf, ToyDataset(conf)).get_pytorch_dataloaders()
+    dataset_rng, sampler_rng = train_loader.dataset.get_rng_state(), train_loader.sampler.get_rng_state()
+    train_batches = [torch.cat([batch['tokens'], batch['labels']], 1) for batch in train_loader]
+    val_batches = [torch.cat([batch['tokens'], batch['candidates'], batch['labels']], 1) for batch in val_loader]
+    train_loader.dataset.set_rng_state(dataset_rng)
+    train_loader.sampler.set_rng_state(sampler_rng)
+
+    trainer = SASTrainer(conf, model_factory(conf), train_loader, val_loader, test_loader, local_export_root)
+    trainer.train()
+    torch.save({'train': train_batches, 'val': val_batches, 'sampler_rng': trainer.train_loader.sampler.get_rng_state(),
+                'parameters': torch.cat([p.detach().view(-1) for p in trainer.model.parameters()])},
+               os.path.join(conf.root, 'sas_rank{}_of_{}.pth'.format(rank, world_size)))
+
+
+def interleave(shards):
+    """
+    rows of the per-rank tensors in the order of the single process: row i of the pass is on rank i % world_size
+    """
+    return torch.stack(shards, 1).view(-1, shards[0].size(1))
+
+
+def test_two_ranks_read_the_single_process_batches(tmp_path):
+    root = str(tmp_path)
+    os.makedirs(os.path.join(root, 'data', 'toy'))
+    train_sas(DotMap(sas_conf(root, 'single'), _dynamic=False))
+    launch(train_sas, sas_conf(root, 'distributed'), 2)
+
+    single = torch.load(os.path.join(root, 'sas_rank0_of_1.pth'))
+    ranks = [torch.load(os.path.join(root, 'sas_rank{}_of_2.pth'.format(r))) for r in range(2)]
+    #每个训练batch由两个进程各取一半; 11个样本, 与单进程一样只有2个完整的batch;
+    assert len(single['train']) == 2
+    assert all(len(rank['train']) == len(single['train']) for rank in ranks)
+    for k, batch in enumerate(single['train']):
+        assert torch.equal(interleave([rank['train'][k] for rank in ranks]), batch)
+    #验证集按顺序分片, 最后一个样本在rank 1上补齐;
+    val = interleave([torch.cat(rank['val']) for rank in ranks])
+    assert torch.equal(val[:len(torch.cat(single['val']))], torch.cat(single['val']))
+
+    #各进程的sampler rng保持一致, 与rank 0保存的checkpoint相同;
+    checkpoint = torch.load(os.path.join(root, 'test', 'distributed', 'models', RECENT_STATE_DICT_FILENAME + '_pretrain'), weights_only=False)
+    assert ranks[0]['sampler_rng'] == ranks[1]['sampler_rng'] == single['sampler_rng']
+    assert checkpoint[TRAIN_LOADER_SAMPLER_RNG_STATE_DICT_KEY] == ranks[1]['sampler_rng']
+    assert torch.equal(ranks[0]['parameters'], ranks[1]['parameters'])
+
+
+def test_unsupported_trainer_is_not_launched():
+    conf = TrainingParser([]).parse()
+    conf.update(mode='train', trainer_code='graph_sasrec', distributed_world_size=2)
+    with pytest.raises(ValueError, match='graph_sasrec'):
+        main(DotMap(conf, _dynamic=False))
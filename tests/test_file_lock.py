@@ -0,0 +1,46 @@
+import multiprocessing
+import time
+
+import pytest
+
+from meantime.dataloaders.negative_samplers.base import AbstractNegativeSampler
+
+NUM_PROCESSES = 4
+
+
+class CountingSampler(AbstractNegativeSampler):
+    """
+    records every generation in a log file next to the samples;
+    """
+    @classmethod
+    def code(cls):
+        return 'counting'
+
+    def generate_negative_samples(self):
+        with open(self.save_folder + '/generated.log', 'a') as f:
+            f.write('generated\n')
+        time.sleep(0.5) #其余进程在此期间到达锁;
+        return {u: [u + 1, u + 2] for u in range(self.user_count)}
+
+
+def get_samples(folder, barrier, queue):
+    sampler = CountingSampler(None, 5, 10, 2, 0, folder)
+    barrier.wait()
+    queue.put(sampler.get_negative_samples())
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='the runs are forked')
+def test_concurrent_runs_build_once(tmp_path):
+    ctx = multiprocessing.get_context('fork')
+    barrier, queue = ctx.Barrier(NUM_PROCESSES), ctx.Queue()
+    processes = [ctx.Process(target=get_samples, args=(str(tmp_path), barrier, queue)) for _ in range(NUM_PROCESSES)]
+    for p in processes:
+        p.start()
+    results = [queue.get(timeout=60) for _ in processes]
+    for p in processes:
+        p.join()
+    #只有一个进程生成, 其余等待锁释放后加载同一文件;
+    assert (tmp_path / 'generated.log').read_text().count('generated') == 1
+    assert all(result == results[0] for result in results)
+    assert results[0] == CountingSampler(None, 5, 10, 2, 0, str(tmp_path)).get_negative_samples()
+    assert not list(tmp_path.glob('*.tmp*'))
@@ -0,0 +1,14 @@
+import torch
+from dotmap import DotMap
+
+from meantime.trainers.graph_cache import graph_cache_key
+
+
+def test_init_args_change_the_key():
+    inputs = {'adj': torch.arange(6).view(2, 3)}
+    args = DotMap({'model_init_seed': 0, 'model_init_range': 0.02, 'merge_type': 'sum'}, _dynamic=False)
+    key = graph_cache_key('graph', args, inputs)
+    assert graph_cache_key('graph', DotMap(args.toDict(), model_init_range=0.1), inputs) != key
+    assert graph_cache_key('graph', DotMap(args.toDict(), model_init_seed=1), inputs) != key
+    #SAS侧参数不影响key;
+    assert graph_cache_key('graph', DotMap(args.toDict(), merge_type='concat'), inputs) == key
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import torch
+
+from graph_harness import make_trainer, parameters
+
+
+class Interrupt(Exception):
+    pass
+
+
+def interrupt_after(trainer, method, calls):
+    """
+    raises Interrupt at the (calls + 1)-th call of trainer.method, like a job killed in the middle of that step;
+    """
+    original = getattr(trainer, method)
+    count = [0]
+
+    def wrapper(*args, **kwargs):
+        if count[0] == calls:
+            raise Interrupt
+        count[0] += 1
+        return original(*args, **kwargs)
+    setattr(trainer, method, wrapper)
+
+
+def run(root, interrupt=None):
+    trainer = make_trainer(str(root), checkpoint_every=1, resume_checkpoint=True)
+    if interrupt is not None:
+        interrupt_after(trainer, *interrupt)
+    trainer.train()
+    return trainer
+
+
+def assert_same_rng(a, b):
+    assert a['python'] == b['python']
+    assert all(np.array_equal(np.asarray(x), np.asarray(y)) for x, y in zip(a['numpy'], b['numpy']))
+    assert torch.equal(a['torch'], b['torch'])
+
+
+@pytest.mark.parametrize('interrupt', [
+    ('trainGraphModelOneEpoch', 2),       #LightGCN预训练中;
+    ('trainGraphModelOneEpochKGAT', 1),   #KGAT预训练中;
+    ('train_one_epoch', 0),               #预训练结束后, 第一个finetune checkpoint之前;
+    ('train_one_epoch', 2),               #finetune中;
+])
+def test_resume_matches_uninterrupted_run(tmp_path, interrupt):
+    reference = run(tmp_path / 'reference')
+
+    with pytest.raises(Interrupt):
+        run(tmp_path / 'resumed', interrupt)
+    resumed = run(tmp_path / 'resumed')
+
+    assert torch.equal(parameters(resumed), parameters(reference))
+    #最后一个epoch的checkpoint记录的RNG状态(全局RNG与子图采样RNG)也相同;
+    expected, actual = reference.checkpointer.load(), resumed.checkpointer.load()
+    assert_same_rng(actual['rng'], expected['rng'])
+    assert actual['subgraph_rng'] == expected['subgraph_rng']
+    assert actual['graph_epochs_done'] == expected['graph_epochs_done']
+    #恢复后只重跑中断的epoch;
+    epochs_done = [epoch for epoch, _ in resumed.logger_service.val]
+    assert epochs_done == list(range(interrupt[1] if interrupt[0] == 'train_one_epoch' else 0, reference.num_epochs))
+    assert resumed.logger_service.val == reference.logger_service.val[-len(epochs_done):]
@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+from functools import partial
+
+import pytest
+import torch
+
+from graph_harness import make_trainer
+from meantime.trainers.graph_checkpoint import rng_state, set_rng_state
+from meantime.trainers.graph_pretrain import ConcurrentPretrainer, HogwildAttention, HogwildPretrainer, HogwildShard
+from meantime.trainers.graph_sampler import GraphSampleProducer
+from meantime.trainers.utils import UniformSample_vectorized, UniformSample_vectorized_KGE, build_kg_csr
+
+
+def test_shared_attention_matches_kgat():
+    trainer = make_trainer(None, checkpoint_every=None, resume_checkpoint=False)
+    kgat = trainer.graph_model_kgat
+    attention = HogwildAttention(kgat.attention_index, (kgat.num_users + kgat.num_items,) * 2)
+    with torch.no_grad():
+        expected = kgat.updateAttentionScore()
+        graph = attention.update(0, lambda: None, kgat.updateAttentionScore)
+    assert graph.is_coalesced()
+    assert torch.equal(graph.to_dense(), expected.to_dense())
+
+
+@pytest.mark.skipif(not HogwildPretrainer(2).can_fork(), reason='hogwild workers are forked')
+def test_hogwild_computes_attention_once_per_epoch():
+    trainer = make_trainer(None, checkpoint_every=None, resume_checkpoint=False, graph_hogwild_workers=2, graph_subgraph_fanout=None)
+    trainer.graph_model.subgraph_sampler = trainer.graph_model_kgat.subgraph_sampler = None
+    trainer.lr = trainer.args.lr
+    kgat = trainer.graph_model_kgat
+    calls = multiprocessing.get_context('fork').Value('i', 0)
+    compute = kgat.updateAttentionScore
+
+    def counted():
+        with calls.get_lock():
+            calls.value += 1
+        return compute()
+    kgat.updateAttentionScore = counted
+    trainer.pretrainHogwild()
+
+    #两个worker, 每个epoch只由worker 0计算一次;
+    assert calls.value == trainer.graph_attribute_epochs
+    with torch.no_grad():
+        expected = compute()
+    assert torch.allclose(kgat.Graph.to_dense(), expected.to_dense())
+    assert trainer.graph_attention is None
+
+
+@pytest.mark.parametrize('sample_fn, dataset', [(UniformSample_vectorized, 'graph_loader'), (UniformSample_vectorized_KGE, 'graph_loader_kgat')])
+def test_hogwild_shards_sample_only_their_slice(sample_fn, dataset):
+    trainer = make_trainer(None, checkpoint_every=None, resume_checkpoint=False)
+    dataset = getattr(trainer, dataset)
+    full = GraphSampleProducer._sample(sample_fn, dataset, 0, 0)
+    heads = build_kg_csr(dataset)[0] if sample_fn is UniformSample_vectorized_KGE else None
+
+    shards = [HogwildShard(worker, 3, seed=0).sample(sample_fn, dataset) for worker in range(3)]
+    for worker, S in enumerate(shards):
+        #每个worker只采样自己的users/heads, 且同一个seed与draw下结果确定;
+        assert all(len(x) == len(S[0]) for x in S)
+        assert set(S[0].tolist()) <= set(heads[worker::3].tolist()) if sample_fn is UniformSample_vectorized_KGE \
+            else (S[0] % 3 == worker).all()
+        again = HogwildShard(worker, 3, seed=0).sample(sample_fn, dataset)
+        assert all(torch.equal(x, y) for x, y in zip(S, again))
+    #各worker的分片合起来约为一个完整的pass;
+    assert abs(sum(len(S[0]) for S in shards) - len(full[0])) <= 0.2 * len(full[0]) + 3
+
+
+def pretraining_trainer():
+    trainer = make_trainer(None, checkpoint_every=None, resume_checkpoint=False)
+    trainer.lr = trainer.args.lr
+    trainer.graph_opt = torch.optim.Adam(trainer.graph_model.parameters(), lr=trainer.lr)
+    trainer.graph_opt_attribute = torch.optim.Adam(trainer.graph_model_kgat.parameters(), lr=trainer.lr)
+    return trainer
+
+
+@pytest.mark.skipif(not ConcurrentPretrainer().can_fork(), reason='pretraining jobs are forked')
+def test_concurrent_pretraining_loads_results_in_place(tmp_path):
+    trainer = pretraining_trainer()
+    kgat = trainer.graph_model_kgat
+    params = [p for m in [trainer.graph_model, kgat] for p in m.parameters()]
+    graph = kgat.Graph
+    state = rng_state()
+    pretrainer = ConcurrentPretrainer(str(tmp_path))
+    pretrainer.add('lightgcn', trainer.graph_model, partial(trainer.pretrainLightGCN, checkpoint=False), 1)
+    pretrainer.add('kgat', kgat, partial(trainer.pretrainKGAT, checkpoint=False), 1, attributes=['Graph'])
+    assert set(pretrainer.run()) == {'lightgcn', 'kgat'}
+
+    #每个job在fork时的状态上单独运行, 与在本进程中从相同状态依次运行的结果相同;
+    expected = {}
+    for name in ['lightgcn', 'kgat']:
+        reference = pretraining_trainer()
+        set_rng_state(state)
+        (reference.pretrainLightGCN if name == 'lightgcn' else reference.pretrainKGAT)(checkpoint=False)
+        expected[name] = reference
+    assert all(torch.equal(a, b) for a, b in zip(trainer.graph_model.state_dict().values(), expected['lightgcn'].graph_model.state_dict().values()))
+    assert all(torch.equal(a, b) for a, b in zip(kgat.state_dict().values(), expected['kgat'].graph_model_kgat.state_dict().values()))
+    assert kgat.Graph is not graph and torch.equal(kgat.Graph.to_dense(), expected['kgat'].graph_model_kgat.Graph.to_dense())
+
+    #参数对象不变, 持有它们的optimizer仍然有效;
+    assert all(a is b for a, b in zip(params, [p for m in [trainer.graph_model, kgat] for p in m.parameters()]))
+    assert all(a is b for a, b in zip(trainer.graph_opt.param_groups[0]['params'], trainer.graph_model.parameters()))
+    assert not any(os.listdir(tmp_path)) #临时文件已删除;
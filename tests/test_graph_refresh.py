@@ -0,0 +1,49 @@
+import torch
+import torch.nn as nn
+
+from meantime.trainers.graph_refresh import GraphRefreshPolicy
+
+
+class EmbeddingOutput(nn.Module):
+    """
+    a graph model whose output is its embedding table, like KGAT with kgat_output == 'emb'
+    """
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.n_layers = 3
+        self.users = nn.Parameter(torch.randn(4, 2))
+        self.items = nn.Parameter(torch.randn(5, 2))
+
+    def getUserItemEmb(self):
+        return self.users * 1., self.items * 1.
+
+    def getUserItemEmbOri(self):
+        return self.users, self.items
+
+
+def item_grad(model, items):
+    model.zero_grad()
+    (items[torch.tensor([1, 3])] ** 2).sum().backward()
+    return model.items.grad.clone()
+
+
+def test_touched_gradient_matches_full_gradient_for_embedding_output():
+    model = EmbeddingOutput()
+    expected = item_grad(model, model.getUserItemEmb()[1])
+    policy = GraphRefreshPolicy(model, refresh_steps=10, touched_grad=True, ego_weight=1.)
+    _, items = policy.get(torch.tensor([1, 3]))
+    assert torch.allclose(item_grad(model, items), expected)
+
+
+def test_default_ego_weight_is_layer_mean():
+    assert GraphRefreshPolicy(EmbeddingOutput()).ego_weight == 0.25
+
+
+def test_frozen_model_gets_no_gradient():
+    model = EmbeddingOutput()
+    policy = GraphRefreshPolicy(model, refresh_steps=1, drift_threshold=0.1, touched_grad=True, trainable=False)
+    users, items = policy.get(torch.tensor([1, 3]))
+    assert not users.requires_grad and not items.requires_grad
+    assert policy.reference is None and policy.num_refresh == 1
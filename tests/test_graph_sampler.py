@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from meantime.trainers.graph_sampler import GraphSampleProducer
+from meantime.trainers.utils import UniformSample_vectorized
+
+
+def make_dataset():
+    allPos = [[0, 1], [2], [], [1, 3, 4]]
+    return SimpleNamespace(n_users=4, m_items=6, trainDataSize=6, allPos=allPos)
+
+
+def test_sample_leaves_global_rng_untouched():
+    dataset = make_dataset()
+    np.random.seed(7)
+    expected = np.random.random(3)
+    np.random.seed(7)
+    GraphSampleProducer._sample(UniformSample_vectorized, dataset, seed=0, epoch=3)
+    assert np.array_equal(np.random.random(3), expected)
+
+
+def test_sample_depends_only_on_seed_and_epoch():
+    dataset = make_dataset()
+    a = GraphSampleProducer._sample(UniformSample_vectorized, dataset, seed=0, epoch=3)
+    np.random.random(10)
+    b = GraphSampleProducer._sample(UniformSample_vectorized, dataset, seed=0, epoch=3)
+    for x, y in zip(a, b):
+        assert np.array_equal(x, y)
+    users, pos, neg = a
+    for u, p, n in zip(users, pos, neg):
+        assert p in dataset.allPos[u] and n not in dataset.allPos[u]
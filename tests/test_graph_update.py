@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from dotmap import DotMap
+
+from meantime.dataloaders.graph import GraphLoader
+from meantime.dataloaders.graph_update import adj_cache_prefix, bipartite_degree, latest_adj_path, load_adj, update_norm_adj
+from meantime.trainers.utils import UniformSample_vectorized
+
+
+def make_loader(folder):
+    config = DotMap(dict(graph_path=str(folder), graph_filename='/graph.txt', experiment_name='test', item_order=None, rm_self_node=False,
+                         model_code='sas', device='cpu'), _dynamic=False)
+    item2id = {str(i): i for i in range(1, 9)}
+    return GraphLoader(config, item2id=item2id)
+
+
+def write_graph(folder):
+    with open(folder / 'graph.txt', 'w') as f:
+        f.write('1 2 3\n2 3\n4 5\n')
+    with open(folder / 'delta.txt', 'w') as f:
+        f.write('1 6\n7 8 2\n')
+
+
+def test_update_keeps_loader_consistent_with_adjacency(tmp_path):
+    write_graph(tmp_path)
+    loader = make_loader(tmp_path)
+    loader.getSparseGraph()
+    UniformSample_vectorized(loader)  # fills the CSR cache of the sampler
+    loader.updateSparseGraph(str(tmp_path / 'delta.txt'))
+
+    full = make_loader(tmp_path)
+    folder = tmp_path / 'expected'
+    folder.mkdir()
+    with open(folder / 'graph.txt', 'w') as f:
+        f.write(open(tmp_path / 'graph.txt').read() + open(tmp_path / 'delta.txt').read())
+    expected = make_loader(folder)
+
+    for updated in [loader, full]:  # in place, and replayed by a new loader
+        assert (updated.UserItemNet != expected.UserItemNet).nnz == 0
+        assert updated.trainDataSize == expected.trainDataSize
+        for a, b in zip(updated.allPos, expected.allPos):
+            assert np.array_equal(np.sort(a), np.sort(b))
+        np.random.seed(0)
+        users, pos, neg = UniformSample_vectorized(updated)
+        for u, p, n in zip(users.tolist(), pos.tolist(), neg.tolist()):
+            assert p in expected.allPos[u] and n not in expected.allPos[u]
+
+    rebuilt = expected._build_norm_adj()
+    cached = load_adj(str(tmp_path / 's_pre_adj_mat_test'))
+    assert abs(cached - rebuilt).max() < 1e-6
+
+
+def test_rebuilt_base_drops_versions(tmp_path):
+    write_graph(tmp_path)
+    prefix = str(tmp_path / 's_pre_adj_mat_test')
+    loader = make_loader(tmp_path)
+    loader.getSparseGraph()
+    loader.updateSparseGraph(str(tmp_path / 'delta.txt'))
+    assert latest_adj_path(prefix)[1] == 1
+
+    os.remove(prefix + '.npz')  # force a rebuild from the graph file
+    assert latest_adj_path(prefix) == (prefix + '.npz', 0)
+    loader = make_loader(tmp_path)
+    assert loader.trainDataSize == 4  # the edges of the dropped version are not replayed
+    loader.getSparseGraph()
+    assert latest_adj_path(prefix) == (prefix + '.npz', 0)
+    assert not os.path.exists(prefix + '_v1.npz')
+
+
+def test_adjacency_cache_is_keyed_by_item_order(tmp_path):
+    config = DotMap(dict(experiment_name='test', item_order=None), _dynamic=False)
+    ordered = DotMap(dict(experiment_name='test', item_order='rcm'), _dynamic=False)
+    assert adj_cache_prefix(str(tmp_path), config) == str(tmp_path) + '/s_pre_adj_mat_test'
+    assert adj_cache_prefix(str(tmp_path), ordered, '_kgat') == str(tmp_path) + '/s_pre_adj_mat_test-orderrcm_kgat'
+
+
+def test_update_writes_only_the_changed_entries(tmp_path):
+    write_graph(tmp_path)
+    prefix = str(tmp_path / 's_pre_adj_mat_test')
+    loader = make_loader(tmp_path)
+    loader.getSparseGraph()
+    base = sp.load_npz(prefix + '.npz')
+    (rows, cols, values), degree = update_norm_adj(base, bipartite_degree(loader.UserItemNet), loader.n_users, [7], [8])
+    #只有节点7与8(user与item两侧)所在的行和列改变: (7, 8+n) 与 (8+n, 7) 两个新元素及 8 所在的原有元素;
+    touched = {7, 8 + loader.n_users}
+    assert all(r in touched or c in touched for r, c in zip(rows.tolist(), cols.tolist()))
+    assert len(values) < base.nnz
+    assert np.array_equal(degree - bipartite_degree(loader.UserItemNet), np.bincount([7, 8 + loader.n_users], minlength=len(degree)))
+
+
+def test_versions_follow_the_base_content_not_its_mtime(tmp_path):
+    write_graph(tmp_path)
+    prefix = str(tmp_path / 's_pre_adj_mat_test')
+    loader = make_loader(tmp_path)
+    loader.getSparseGraph()
+    loader.updateSparseGraph(str(tmp_path / 'delta.txt'))
+    updated = load_adj(prefix)
+
+    #复制或touch的base保留增量版本;
+    future = os.path.getmtime(prefix + '_v1.npz') + 100
+    os.utime(prefix + '.npz', (future, future))
+    assert latest_adj_path(prefix) == (prefix + '_v1.npz', 1)
+    assert abs(load_adj(prefix) - updated).max() == 0
+    assert make_loader(tmp_path).trainDataSize == loader.trainDataSize
+
+    #内容不同的base (例如由另一个图文件重建) 丢弃增量版本;
+    sp.save_npz(prefix + '.npz', 2 * sp.load_npz(prefix + '.npz'))
+    os.utime(prefix + '.npz', (0, 0))
+    assert latest_adj_path(prefix) == (prefix + '.npz', 0)
+    assert make_loader(tmp_path).trainDataSize == 4
@@ -0,0 +1,91 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from dotmap import DotMap
+
+from meantime.datasets.base import AbstractDataset
+from meantime.datasets.utils import adjacency_bandwidth, item_cooccurrence_graph, item_ordering
+
+NUM_ITEMS = 30
+
+
+class ToyDataset(AbstractDataset):
+    @classmethod
+    def code(cls):
+        return 'toy'
+
+    @classmethod
+    def url(cls):
+        return None
+
+    def load_ratings_df(self):
+        pass
+
+    def load_ratings_df_from_json(self):
+        pass
+
+
+def make_dataset(folder, item_order):
+    args = DotMap({'min_rating': 0, 'min_uc': 2, 'min_sc': 0, 'split': 'leave_one_out', 'local_data_folder': str(folder),
+                   'item_order': item_order}, _dynamic=False)
+    return ToyDataset(args)
+
+
+def chain_df():
+    """
+    every user walks a stretch of one item chain; the raw item names follow the chain, the dense ids are scattered;
+    """
+    rng = np.random.default_rng(0)
+    smap = {'item{}'.format(i): int(s) for i, s in enumerate(rng.permutation(NUM_ITEMS) + 1)}
+    umap = {'user{}'.format(u): u + 1 for u in range(10)}
+    rows = []
+    for u in range(10):
+        start = 3 * u
+        for t, i in enumerate(range(start, min(start + 5, NUM_ITEMS))):
+            rows.append({'uid': u + 1, 'sid': smap['item{}'.format(i)], 'raw': 'item{}'.format(i), 'timestamp': t})
+    return pd.DataFrame(rows), umap, smap
+
+
+@pytest.mark.parametrize('item_order', ['rcm', 'degree'])
+def test_reorder_items_relabels_smap_and_df_consistently(tmp_path, item_order):
+    df, _, smap = chain_df()
+    before = adjacency_bandwidth(item_cooccurrence_graph(df, NUM_ITEMS))[0]
+
+    df, new_smap = make_dataset(tmp_path, item_order).reorder_items(df.copy(), smap)
+    assert set(new_smap) == set(smap)
+    assert sorted(new_smap.values()) == list(range(1, NUM_ITEMS + 1))
+    assert (df['sid'].values == df['raw'].map(new_smap).values).all()
+    if item_order == 'rcm':
+        assert adjacency_bandwidth(item_cooccurrence_graph(df, NUM_ITEMS))[0] <= before
+
+
+def test_unknown_item_order():
+    df, _, _ = chain_df()
+    with pytest.raises(ValueError, match='bfs'):
+        item_ordering(item_cooccurrence_graph(df, NUM_ITEMS), 'bfs')
+
+
+def test_remap_negative_samples_keeps_raw_negatives(tmp_path):
+    df, umap, smap = chain_df()
+    base = make_dataset(tmp_path, None)
+    base_folder = base._get_preprocessed_folder_path()
+    base_folder.mkdir(parents=True)
+    with base_folder.joinpath('dataset.pkl').open('wb') as f:
+        pickle.dump({'umap': umap, 'smap': smap}, f)
+    id2item = {i: s for s, i in smap.items()}
+    negatives = {u: [smap['item{}'.format((3 * u + k) % NUM_ITEMS)] for k in range(7, 10)] for u in umap.values()}
+    with base_folder.joinpath('random-sample_size3-seed0.pkl').open('wb') as f:
+        pickle.dump(negatives, f)
+
+    ordered = make_dataset(tmp_path, 'rcm')
+    _, new_smap = ordered.reorder_items(df.copy(), smap)
+    ordered._get_preprocessed_folder_path().mkdir(parents=True)
+    ordered.remap_negative_samples('dataset.pkl', umap, new_smap)
+
+    with ordered._get_preprocessed_folder_path().joinpath('random-sample_size3-seed0.pkl').open('rb') as f:
+        remapped = pickle.load(f)
+    new_id2item = {i: s for s, i in new_smap.items()}
+    assert set(remapped) == set(negatives)
+    assert all([new_id2item[i] for i in remapped[u]] == [id2item[i] for i in negatives[u]] for u in negatives)
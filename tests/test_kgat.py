@@ -0,0 +1,57 @@
+import numpy as np
+import scipy.sparse as sp
+import torch
+
+from graph_harness import make_trainer
+
+
+def make_kgat():
+    return make_trainer(None, checkpoint_every=None, resume_checkpoint=False).graph_model_kgat
+
+
+def scipy_attention(kgat):
+    """
+    the previous updateAttentionScore: W_R[rel] with torch.bmm, the adjacency assembled with scipy on the host;
+    """
+    W_R_param = kgat.W_R[kgat.all_rel_tensor]
+    head = torch.bmm(kgat.embedding_user(kgat.all_head_tensor).unsqueeze(1), W_R_param).squeeze(1)
+    tail = torch.bmm(kgat.embedding_item(kgat.all_tail_tensor).unsqueeze(1), W_R_param).squeeze(1)
+    score = torch.sum(head * torch.tanh(tail + kgat.embedding_rel(kgat.all_rel_tensor)), dim=-1).detach().numpy()
+    R = sp.csr_matrix((score, (kgat.all_head_list, kgat.all_tail_list)), shape=(kgat.num_users, kgat.num_items))
+    adj = sp.bmat([[None, R], [R.T, None]]).tocoo().astype(np.float32)
+    tensor = torch.sparse_coo_tensor(np.vstack([adj.row, adj.col]), adj.data, adj.shape)
+    return torch.sparse.softmax(tensor.coalesce(), dim=1)
+
+
+def test_attention_matches_scipy_path():
+    kgat = make_kgat()
+    #同一(head, tail)上有多个关系的三元组, 其分数合并为一条边;
+    pairs = list(zip(kgat.all_head_list, kgat.all_tail_list))
+    assert len(set(pairs)) < len(pairs)
+    with torch.no_grad():
+        expected = scipy_attention(kgat)
+        actual = kgat.updateAttentionScore()
+    assert actual.is_coalesced()
+    assert torch.equal(actual.indices(), expected.indices())
+    assert torch.allclose(actual.values(), expected.values(), atol=1e-6)
+
+
+def test_project_by_relation_matches_bmm():
+    kgat = make_kgat()
+    g = torch.Generator().manual_seed(0)
+    rel = torch.tensor([1, 0, 1, 1, 0, 1])
+    x, y = [torch.randn(len(rel), kgat.latent_dim, generator=g, requires_grad=True) for _ in range(2)]
+    weight = torch.randn(len(rel), kgat.latent_dim, generator=g)
+
+    def grads(outputs):
+        for p in [kgat.W_R, x, y]:
+            p.grad = None
+        sum((out * weight).sum() for out in outputs).backward()
+        return [p.grad.clone() for p in [kgat.W_R, x, y]]
+
+    W_R_param = kgat.W_R[rel]
+    expected = [torch.bmm(emb.unsqueeze(1), W_R_param).squeeze(1) for emb in (x, y)]
+    expected_grads = grads(expected)
+    actual = kgat.project_by_relation(kgat.W_R, rel, x, y)
+    assert all(torch.allclose(a, e, atol=1e-6) for a, e in zip(actual, expected))
+    assert all(torch.allclose(a, e, atol=1e-6) for a, e in zip(grads(actual), expected_grads))
@@ -0,0 +1,39 @@
+import importlib.util
+import os
+
+import pytest
+
+spec = importlib.util.spec_from_file_location('testLeaky', os.path.join(os.path.dirname(__file__), '..', 'statistic', 'testLeaky.py'))
+testLeaky = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(testLeaky)
+
+
+def make_dataset(keys):
+    # user 1 trains on [1, 2], answer 3; user 2 trains on [3, 4], answer 1
+    return {
+        'smap': {key: i + 1 for i, key in enumerate(keys)},
+        'umap': {'a': 1, 'b': 2},
+        'user2dict': {1: {'items': [1, 2, 3]}, 2: {'items': [3, 4, 1]}},
+        'train_targets': [(1, 2), (2, 2)],
+        'test_targets': [(1, 2), (2, 2)],
+    }
+
+
+@pytest.mark.parametrize('keys', [[10, 20, 30, 40], ['10', '20', '30', '40']])
+def test_leak_found_with_int_and_str_ids(tmp_path, keys):
+    graph_file = tmp_path / 'graph.txt'
+    graph_file.write_text('30 20\n40 30\n')  # (3, 2) is never co-trained, (4, 3) is
+    dataset = make_dataset(keys)
+    graph = testLeaky.load_graph(str(graph_file), dataset['smap'], len(dataset['smap']))
+    assert graph.nnz == 4
+    stats, _ = testLeaky.check_leakage(dataset, graph)
+    assert stats['graph_edges'] == 1
+    assert stats['leaky_edges'] == 1
+    assert stats['users_with_leak'] == 1
+
+
+def test_unmatched_graph_fails(tmp_path):
+    graph_file = tmp_path / 'graph.txt'
+    graph_file.write_text('x y\nz y\n')
+    with pytest.raises(ValueError):
+        testLeaky.load_graph(str(graph_file), make_dataset([10, 20, 30, 40])['smap'], 4)
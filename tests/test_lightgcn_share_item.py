@@ -0,0 +1,63 @@
+import pytest
+import torch
+from dotmap import DotMap
+
+from meantime.dataloaders.graph import GraphLoader
+from meantime.models.transformer_models.lightGCN_share_item import LightGCN
+
+NUM_ITEMS = 12
+
+
+def make_loader(folder):
+    #对称的item共现图: 每个item与前后两个item相连;
+    with open(folder / 'graph.txt', 'w') as f:
+        for i in range(1, NUM_ITEMS + 1):
+            neighbors = [j for j in [i - 2, i - 1, i + 1, i + 2] if 1 <= j <= NUM_ITEMS]
+            f.write(' '.join(str(j) for j in [i] + neighbors) + '\n')
+    config = DotMap({'graph_path': str(folder), 'graph_filename': '/graph.txt', 'rm_self_node': False, 'model_code': 'sas',
+                     'experiment_name': 'test', 'item_order': None, 'device': 'cpu'}, _dynamic=False)
+    return GraphLoader(config, item2id={str(i): i for i in range(1, NUM_ITEMS + 1)})
+
+
+def make_model(loader, item_propagation):
+    config = DotMap({'latent_dim_rec': 8, 'lightGCN_n_layers': 3, 'keep_prob': 0.6, 'A_split': False, 'graph_pretrain': False,
+                     'graph_dropout': False, 'graph_item_propagation': item_propagation, 'pooling_type': None,
+                     'model_init_seed': 0, 'model_init_range': 0.02}, _dynamic=False)
+    torch.manual_seed(0)
+    return LightGCN(config, loader)
+
+
+def test_item_propagation_does_not_load_the_bipartite_graph(tmp_path):
+    loader = make_loader(tmp_path)
+    model = make_model(loader, True)
+    assert model.Graph is None and loader.Graph is None
+    assert model.ItemGraph.shape == (NUM_ITEMS + 1, NUM_ITEMS + 1)
+
+
+@pytest.mark.parametrize('A_split', [False, True])
+def test_item_propagation_matches_bipartite_propagation(tmp_path, A_split):
+    loader = make_loader(tmp_path)
+    bipartite = make_model(loader, False)
+    item = make_model(loader, True)
+    assert torch.equal(bipartite.embedding_item.weight, item.embedding_item.weight)
+    if A_split: #按行切分的二部图;
+        dense = bipartite.Graph.to_dense()
+        bipartite.A_split = True
+        bipartite.Graph = [block.to_sparse() for block in torch.split(dense, 5)]
+
+    bipartite.eval()
+    item.eval()
+    with torch.no_grad():
+        expected_users, expected_items = bipartite.computer()
+        users, items = item.computer()
+    assert torch.allclose(users, expected_users, atol=1e-6)
+    assert torch.allclose(items, expected_items, atol=1e-6)
+
+
+def test_asymmetric_graph_falls_back_to_bipartite_propagation(tmp_path):
+    with open(tmp_path / 'graph.txt', 'w') as f:
+        f.write('1 2\n2 3\n')
+    config = DotMap({'graph_path': str(tmp_path), 'graph_filename': '/graph.txt', 'rm_self_node': False, 'model_code': 'sas',
+                     'experiment_name': 'test', 'item_order': None, 'device': 'cpu'}, _dynamic=False)
+    model = make_model(GraphLoader(config, item2id={'1': 1, '2': 2, '3': 3}), True)
+    assert model.ItemGraph is None and model.Graph is not None
@@ -0,0 +1,137 @@
+import os
+
+import pytest
+import torch
+from dotmap import DotMap
+
+from meantime.analyze_table import read_table, table_path
+from meantime.config import BEST_STATE_DICT_FILENAME, OPTIMIZER_STATE_DICT_KEY, RECENT_STATE_DICT_FILENAME, STATE_DICT_KEY
+from meantime.loggers import AsyncCheckpointWriter, BestModelLogger, RecentModelLogger, TableLogger, TableLoggersManager, WandbLogger
+from meantime.utils import load_state_dict
+
+COLUMNS = ['epoch', 'accum_iter', 'loss', 'NDCG@10']
+
+
+def rows(start, stop):
+    return [{'epoch': i, 'accum_iter': 16 * (i + 1), 'loss': 1. / (i + 1), 'NDCG@10': 0.1 + i / 7.} for i in range(start, stop)]
+
+
+@pytest.fixture
+def wandb_run(tmp_path, monkeypatch):
+    """
+    an offline wandb run; every wandb.log call is recorded and still goes to the run;
+    """
+    wandb = pytest.importorskip('wandb')
+    monkeypatch.setenv('WANDB_MODE', 'offline')
+    monkeypatch.setenv('WANDB_SILENT', 'true')
+    run = wandb.init(project='meantime-test', dir=str(tmp_path))
+    logged = []
+    log = wandb.log
+
+    def record(data, *args, **kwargs):
+        logged.append(data)
+        return log(data, *args, **kwargs)
+    monkeypatch.setattr(wandb, 'log', record)
+    yield logged
+    run.finish()
+
+
+def test_wandb_table_logger_logs_each_row_once(wandb_run):
+    logger = WandbLogger(table_definitions=[('val_log', COLUMNS)], prefix='val_')
+    for row in rows(0, 3):
+        logger.log(**row)
+    logger.complete()
+
+    tables = [data['val_log'] for data in wandb_run if 'val_log' in data]
+    assert [table.data for table in tables] == [[[row[col] for col in COLUMNS]] for row in rows(0, 3)]
+    full = [data['val_log_full'] for data in wandb_run if 'val_log_full' in data]
+    assert len(full) == 1 and full[0].data == [[row[col] for col in COLUMNS] for row in rows(0, 3)]
+
+
+@pytest.mark.parametrize('table_format', ['csv', 'jsonl'])
+def test_table_logger_appends_and_round_trips(tmp_path, table_format):
+    args = DotMap({'resume_training': False, 'table_format': table_format}, _dynamic=False)
+    manager = TableLoggersManager(args=args, export_root=str(tmp_path), table_definitions=[('val_log', COLUMNS)])
+    logger = manager.table_loggers[0]
+    logger.flush_rows, logger.flush_secs = 2, float('inf')
+    for row in rows(0, 3):
+        manager.log(**row)
+    #每flush_rows行追加一次, 之后的行留在缓冲区中;
+    assert len(read_table(logger.filepath)) == 2
+    manager.complete()
+
+    #恢复的实验追加到已有文件, 新实验覆盖;
+    resumed = TableLogger(DotMap(args.toDict(), resume_training=True), str(tmp_path), 'val_log', COLUMNS, table_format=table_format)
+    for row in rows(3, 5):
+        resumed.log(**row)
+    resumed.complete()
+
+    df = read_table(table_path(str(tmp_path), 'val_log'))
+    assert df.columns.tolist() == COLUMNS
+    assert df.to_dict('records') == rows(0, 5)
+
+    TableLogger(args, str(tmp_path), 'val_log', COLUMNS, table_format=table_format).complete()
+    assert len(read_table(logger.filepath)) == 0
+
+
+@pytest.mark.parametrize('table_format', ['csv', 'jsonl'])
+def test_val_rows_are_written_at_once(tmp_path, table_format):
+    args = DotMap({'resume_training': False, 'table_format': table_format}, _dynamic=False)
+    val = TableLoggersManager(args=args, export_root=str(tmp_path / 'val'), table_definitions=[('val_log', COLUMNS)])
+    train = TableLoggersManager(args=args, export_root=str(tmp_path / 'train'), table_definitions=[('train_log', COLUMNS)], buffered=True)
+    for i, row in enumerate(rows(0, 3)):
+        val.log(**row)
+        train.log(**row)
+        #进程被杀死时, 已验证的epoch都在文件中;
+        assert read_table(table_path(str(tmp_path / 'val'), 'val_log')).to_dict('records') == rows(0, i + 1)
+    assert table_path(str(tmp_path / 'train'), 'train_log') is None
+    train.complete()
+    assert len(read_table(table_path(str(tmp_path / 'train'), 'train_log'))) == 3
+
+
+def model_state_dict(model, optimizer):
+    return {STATE_DICT_KEY: model.state_dict(), OPTIMIZER_STATE_DICT_KEY: optimizer.state_dict()}
+
+
+@pytest.mark.parametrize('dtype, compress', [(None, False), (torch.float16, False), (None, True), (torch.float16, True)])
+def test_async_checkpoints_snapshot_link_and_load(tmp_path, dtype, compress):
+    torch.manual_seed(0)
+    model = torch.nn.Linear(6, 4)
+    optimizer = torch.optim.Adam(model.parameters())
+    model(torch.randn(3, 6)).sum().backward()
+    optimizer.step()
+    expected = {k: v.clone() for k, v in model.state_dict().items()}
+    exp_avg = optimizer.state_dict()['state'][0]['exp_avg'].clone()
+
+    writer = AsyncCheckpointWriter(dtype=dtype, compress=compress)
+    loggers = [RecentModelLogger(str(tmp_path), writer=writer), BestModelLogger(str(tmp_path), writer=writer)]
+    state_dict = model_state_dict(model, optimizer)
+    for logger in loggers:
+        logger.log(state_dict=state_dict, epoch=0, train_type='graph', **{'NDCG@10': 0.5})
+    #写入前继续更新的参数不影响已排队的快照;
+    with torch.no_grad():
+        for p in model.parameters():
+            p.add_(1.)
+    writer.flush()
+
+    recent = tmp_path / (RECENT_STATE_DICT_FILENAME + '_graph')
+    best = tmp_path / (BEST_STATE_DICT_FILENAME + '_graph_best')
+    assert writer.num_snapshots == 1
+    assert os.path.samefile(recent, best)
+    assert not list(tmp_path.glob('*.tmp'))
+
+    chk = load_state_dict(str(best))
+    assert chk['epoch'] == 0
+    assert all(chk[STATE_DICT_KEY][k].dtype == (dtype or torch.float32) for k in expected)
+    #优化器状态保持全精度;
+    assert torch.equal(chk[OPTIMIZER_STATE_DICT_KEY]['state'][0]['exp_avg'], exp_avg)
+    restored = torch.nn.Linear(6, 4)
+    restored.load_state_dict(chk[STATE_DICT_KEY])
+    atol = 1e-3 if dtype is not None else 0
+    assert all(torch.allclose(restored.state_dict()[k], v, atol=atol) for k, v in expected.items())
+
+    #recent被重写后, best的旧内容保持不变;
+    loggers[0].log(state_dict=model_state_dict(model, optimizer), epoch=1, train_type='graph')
+    writer.flush()
+    assert not os.path.samefile(recent, best)
+    assert load_state_dict(str(recent))['epoch'] == 1 and load_state_dict(str(best))['epoch'] == 0
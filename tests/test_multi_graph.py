@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+import torch
+from dotmap import DotMap
+
+from meantime.models.transformer_models.lightGCNAttention import LightGCNAttention
+
+NUM_USERS, NUM_ITEMS = 12, 9
+
+
+def random_graph(seed):
+    rng = np.random.default_rng(seed)
+    R = sp.random(NUM_USERS, NUM_ITEMS, density=0.3, random_state=seed, data_rvs=lambda n: rng.random(n)).tocsr()
+    adj = sp.bmat([[None, R], [R.T, None]]).tocoo().astype(np.float32)
+    return torch.sparse_coo_tensor(np.vstack([adj.row, adj.col]), adj.data, adj.shape).coalesce()
+
+
+class PerGraph():
+    """
+    the previous propagation: one spmm per graph;
+    """
+    def __init__(self, graphs):
+        self.graphs = graphs
+        self.stacked = self.block = None
+
+    def propagate_shared(self, graph, emb):
+        return [torch.sparse.mm(g, emb) for g in self.graphs]
+
+    def propagate(self, graph, embs):
+        return [torch.sparse.mm(g, emb) for g, emb in zip(self.graphs, embs)]
+
+
+def make_model(A_split):
+    graphs = {name: random_graph(seed) for seed, name in enumerate(['cate3', 'brand', 'price'])}
+    #A_split: 图按行切分为多块;
+    split = lambda g: [block.to_sparse() for block in torch.split(g.to_dense(), 7)] if A_split else g
+    dataset = SimpleNamespace(n_users=NUM_USERS, m_items=NUM_ITEMS, getSparseGraph=lambda name: split(graphs[name]))
+    config = DotMap({'latent_dim_rec': 8, 'lightGCN_n_layers': 3, 'keep_prob': 0.6, 'A_split': A_split, 'graph_pretrain': False,
+                     'graph_dropout': False, 'pooling_type': None, 'model_init_seed': 0, 'model_init_range': 0.02}, _dynamic=False)
+    torch.manual_seed(0)
+    return LightGCNAttention(config, dataset), list(graphs.values())
+
+
+@pytest.mark.parametrize('A_split', [False, True])
+@pytest.mark.parametrize('computer', ['computer_inner', 'computer_outside'])
+def test_fused_propagation_matches_per_graph(A_split, computer):
+    model, graphs = make_model(A_split)
+    model.eval()
+    with torch.no_grad():
+        fused = getattr(model, computer)()
+        model.multi_graph = PerGraph(graphs)
+        expected = getattr(model, computer)()
+    assert all(torch.allclose(a, e, atol=1e-6) for a, e in zip(fused, expected))
@@ -0,0 +1,112 @@
+import importlib
+import json
+import os
+import sys
+import textwrap
+
+import pytest
+
+import meantime.registry as registry
+from meantime.registry import LazyRegistry, UnknownCodeError
+
+
+def write(path, source):
+    with open(path, 'w') as f:
+        f.write(textwrap.dedent(source))
+
+
+@pytest.fixture
+def package(tmp_path, monkeypatch):
+    root = tmp_path / 'src'
+    pkg = root / 'regpkg'
+    pkg.mkdir(parents=True)
+    write(pkg / '__init__.py', '')
+    write(pkg / 'base.py', '''
+        class Base:
+            @classmethod
+            def code(cls):
+                return None
+    ''')
+    write(pkg / 'a.py', '''
+        from regpkg.base import Base
+
+        class A(Base):
+            @classmethod
+            def code(cls):
+                return 'a'
+    ''')
+    monkeypatch.syspath_prepend(str(root))
+    monkeypatch.setattr(registry, 'CACHE_DIR', str(tmp_path / 'cache'))
+    yield pkg
+    forget_modules()
+
+
+def forget_modules():
+    """
+    the next import reads the sources again, as in a new process
+    """
+    for name in [m for m in sys.modules if m == 'regpkg' or m.startswith('regpkg.')]:
+        del sys.modules[name]
+    importlib.invalidate_caches()
+
+
+def make_registry(pkg):
+    forget_modules()
+    from regpkg.base import Base
+    return LazyRegistry(str(pkg / '__init__.py'), 'regpkg', Base, 'thing')
+
+
+def test_tracked_index_survives_source_edits(package):
+    make_registry(package).build(str(package / registry.INDEX_FILENAME))
+    with open(package / registry.INDEX_FILENAME) as f:
+        tracked = f.read()
+
+    write(package / 'a.py', open(package / 'a.py').read() + '\n# edited\n')
+    r = make_registry(package)
+    assert r['a'].__name__ == 'A'
+    assert not r.complete  # resolved from the tracked index without importing everything
+    with open(package / registry.INDEX_FILENAME) as f:
+        assert f.read() == tracked
+    assert not os.path.exists(r.cache_path())
+
+
+def test_new_module_rebuilds_into_cache(package):
+    make_registry(package).build(str(package / registry.INDEX_FILENAME))
+    with open(package / registry.INDEX_FILENAME) as f:
+        tracked = f.read()
+    write(package / 'b.py', '''
+        from regpkg.base import Base
+
+        class B(Base):
+            @classmethod
+            def code(cls):
+                return 'b'
+    ''')
+    r = make_registry(package)
+    assert r['b'].__name__ == 'B'
+    with open(package / registry.INDEX_FILENAME) as f:
+        assert f.read() == tracked
+    with open(r.cache_path()) as f:
+        assert json.load(f)['entries']['b'] == ['regpkg.b', 'B']
+
+
+def test_stale_entry_rebuilds(package):
+    make_registry(package).build(str(package / registry.INDEX_FILENAME))
+    write(package / 'a.py', '''
+        from regpkg.base import Base
+
+        class Renamed(Base):
+            @classmethod
+            def code(cls):
+                return 'a'
+
+        class C(Base):
+            @classmethod
+            def code(cls):
+                return 'c'
+    ''')
+    r = make_registry(package)
+    assert r['a'].__name__ == 'Renamed'
+    assert r['c'].__name__ == 'C'
+    with pytest.raises(UnknownCodeError):
+        r['missing']
@@ -0,0 +1,19 @@
+import pytest
+import torch
+
+from graph_harness import NUM_USERS, make_trainer
+from meantime.models.transformer_models.utils import SubgraphSampler
+
+
+@pytest.mark.parametrize('model', ['graph_model', 'graph_model_kgat'])
+@pytest.mark.parametrize('fanouts', [None, [0], [-1, 0]])
+def test_uncapped_subgraph_equals_full_propagation(model, fanouts):
+    model = getattr(make_trainer(None, checkpoint_every=None, resume_checkpoint=False, graph_subgraph_fanout=None), model)
+    model.subgraph_sampler = SubgraphSampler(model.Graph, fanouts, seed=0)
+    model.eval()
+    #batch中的users与items, 含重复;
+    nodes = torch.tensor([3, 0, 3, NUM_USERS + 5, NUM_USERS, NUM_USERS + 5, 17])
+    with torch.no_grad():
+        expected = torch.cat(model.computer())[nodes]
+        actual = model.computer_subgraph(nodes)
+    assert torch.allclose(actual, expected, atol=1e-6)
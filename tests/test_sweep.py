@@ -0,0 +1,75 @@
+import pytest
+
+from meantime.sweep import MedianPruner, SuccessiveHalvingPruner, SweepSpace, TrialReporter
+
+
+def test_median_pruner():
+    history = {'a': {0: 0.1, 1: 0.3}, 'b': {0: 0.2, 1: 0.4, 2: 0.5}, 'c': {0: 0.05}}
+    pruner = MedianPruner(history, warmup_epochs=1, min_trials=2)
+    assert not pruner.should_prune('d', 0, 0.)  #warmup;
+    #epoch 1: a与b到达epoch 1, 中位数0.35; c未到达, 不计入;
+    assert pruner.should_prune('d', 1, 0.3)
+    assert not pruner.should_prune('d', 1, 0.35)
+    #epoch 2: 只有b到达, 少于min_trials;
+    assert not pruner.should_prune('d', 2, 0.)
+
+
+def test_successive_halving_rungs():
+    pruner = SuccessiveHalvingPruner({}, min_epochs=1, eta=3)
+    assert [n for n in range(1, 30) if pruner.rung(n) is not None] == [1, 3, 9, 27]
+    assert [pruner.rung(n) for n in [1, 3, 9]] == [0, 1, 2]
+    pruner = SuccessiveHalvingPruner({}, min_epochs=2, eta=2)
+    assert [n for n in range(1, 20) if pruner.rung(n) is not None] == [2, 4, 8, 16]
+
+
+def test_successive_halving_keeps_top_1_over_eta():
+    history = {}
+    pruner = SuccessiveHalvingPruner(history, min_epochs=1, eta=3)
+    pruned = []
+    for i, metric in enumerate([0.5, 0.1, 0.6, 0.2, 0.3, 0.9]):
+        reporter = TrialReporter(pruner, history, i)
+        pruned.append(reporter.report(0, metric))
+    #第一个trial总是继续; 之后与已到达rung的trials排序, 保留前 len // eta 个 (至少1个);
+    assert pruned == [False, True, False, True, True, False]
+
+
+def test_successive_halving_counts_validated_epochs():
+    """
+    with --val_adaptive the validated epochs are sparse; the rung at 3 validations is still reached
+    """
+    history = {'done': {0: 0.5, 1: 0.6, 2: 0.7}}
+    pruner = SuccessiveHalvingPruner(history, min_epochs=1, eta=3)
+    reporter = TrialReporter(pruner, history, 'adaptive')
+    assert not reporter.report(0, 0.6)   #rung 0, 比'done'第1次验证的0.5好;
+    assert not reporter.report(4, 0.62)  #第2次验证, 不是rung;
+    #第3次验证 (epoch 9) 是rung 1, 与'done'第3次验证时的0.7比较, 两个trial保留1个;
+    assert reporter.report(9, 0.65)
+
+
+def test_grid_space():
+    space = SweepSpace({'lr': [0.1, 0.01], 'hidden_units': [64, 128], 'dropout': 0.1}, mode='grid')
+    assert space.trials() == [{'dropout': 0.1, 'hidden_units': h, 'lr': lr} for h in [64, 128] for lr in [0.1, 0.01]]
+    assert len(SweepSpace({'lr': [0.1, 0.01], 'hidden_units': [64, 128]}, num_trials=3).trials()) == 3
+
+
+def test_random_space():
+    definition = {'lr': {'type': 'loguniform', 'low': 1e-4, 'high': 1e-2}, 'dropout': {'type': 'uniform', 'low': 0.1, 'high': 0.5},
+                  'num_blocks': {'type': 'int', 'low': 1, 'high': 3}, 'hidden_units': [64, 128]}
+    trials = SweepSpace(dict(definition), mode='random', num_trials=20, seed=1).trials()
+    assert trials == SweepSpace(dict(definition), mode='random', num_trials=20, seed=1).trials()
+    assert len(trials) == 20
+    assert all(1e-4 <= t['lr'] <= 1e-2 and 0.1 <= t['dropout'] <= 0.5 for t in trials)
+    assert {t['num_blocks'] for t in trials} == {1, 2, 3}
+    assert {t['hidden_units'] for t in trials} == {64, 128}
+    assert trials != SweepSpace(dict(definition), mode='random', num_trials=20, seed=2).trials()
+
+
+def test_space_validation():
+    with pytest.raises(ValueError, match='grid'):
+        SweepSpace({'lr': {'type': 'uniform', 'low': 0.1, 'high': 0.2}}, mode='grid')
+    with pytest.raises(ValueError, match='unknown type'):
+        SweepSpace({'lr': {'type': 'normal'}}, mode='random', num_trials=2)
+    with pytest.raises(ValueError, match='sweep_trials'):
+        SweepSpace({'lr': [0.1]}, mode='random').trials()
+    with pytest.raises(ValueError, match='not training args'):
+        SweepSpace({'learning_rate': [0.1]}).check({'lr': 0.1})
@@ -0,0 +1,110 @@
+import os
+import threading
+
+import pytest
+
+from meantime.communicator import ExperimentSync, LocalBackend
+from meantime.communicator.sync import MANIFEST_FILENAME
+
+
+class CountingBackend(LocalBackend):
+    """
+    LocalBackend counting the transfers of all channels; put fails while `failures` is positive;
+    """
+    lock = threading.Lock()
+    puts, gets, failures = [], [], 0
+
+    @classmethod
+    def reset(cls, failures=0):
+        cls.puts, cls.gets, cls.failures = [], [], failures
+
+    def put(self, local_path, remote_path):
+        with self.lock:
+            if CountingBackend.failures > 0:
+                CountingBackend.failures -= 1
+                raise IOError('injected failure')
+            self.puts.append(remote_path)
+        super().put(local_path, remote_path)
+
+    def get(self, remote_path, local_path):
+        with self.lock:
+            self.gets.append(remote_path)
+        super().get(remote_path, local_path)
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+@pytest.fixture
+def experiment(tmp_path):
+    local = str(tmp_path / 'local')
+    write(os.path.join(local, 'tables', 'val_log.csv'), 'epoch,NDCG@10\n0,0.1\n')
+    write(os.path.join(local, 'models', 'best_acc_model.pth'), 'x' * 1000)
+    write(os.path.join(local, 'config.json'), '{}')
+    CountingBackend.reset()
+    with ExperimentSync(CountingBackend, channels=2, retries=3, backoff=0.) as sync:
+        yield sync, local, str(tmp_path / 'remote')
+
+
+def test_second_upload_is_a_no_op(experiment):
+    sync, local, remote = experiment
+    assert sorted(sync.upload_dir(local, remote)) == ['config.json', 'models/best_acc_model.pth', 'tables/val_log.csv']
+    assert read(os.path.join(remote, 'models', 'best_acc_model.pth')) == 'x' * 1000
+
+    CountingBackend.reset()
+    assert sync.upload_dir(local, remote) == []
+    assert CountingBackend.puts == []
+
+
+def test_upload_transfers_only_the_changed_file(experiment):
+    sync, local, remote = experiment
+    sync.upload_dir(local, remote)
+    write(os.path.join(local, 'tables', 'val_log.csv'), 'epoch,NDCG@10\n0,0.1\n1,0.2\n')
+
+    CountingBackend.reset()
+    assert sync.upload_dir(local, remote) == ['tables/val_log.csv']
+    assert CountingBackend.puts == [remote + '/tables/val_log.csv']
+    assert read(os.path.join(remote, 'tables', 'val_log.csv')).endswith('1,0.2\n')
+
+
+def test_failed_transfers_are_retried(experiment):
+    sync, local, remote = experiment
+    CountingBackend.reset(failures=2)
+    sync.upload_dir(local, remote)
+    assert CountingBackend.failures == 0
+    assert sorted(os.path.relpath(p, remote) for p in CountingBackend.puts) == ['config.json', 'models/best_acc_model.pth', 'tables/val_log.csv']
+    assert not [name for _, _, names in os.walk(remote) for name in names if name.endswith('.part')]
+
+    #重试次数用完后抛出异常, 远端manifest保持不变, 下次上传重新传输;
+    write(os.path.join(local, 'config.json'), '{"lr": 0.1}')
+    CountingBackend.reset(failures=sync.retries + 1)
+    with pytest.raises(IOError):
+        sync.upload_dir(local, remote)
+    CountingBackend.reset()
+    assert sync.upload_dir(local, remote) == ['config.json']
+
+
+def test_download_without_remote_manifest(experiment, tmp_path):
+    sync, legacy, _ = experiment #文件逐个上传的旧实验目录, 没有manifest;
+    target = str(tmp_path / 'downloaded')
+    assert not os.path.exists(os.path.join(legacy, MANIFEST_FILENAME))
+
+    assert sorted(sync.download_dir(legacy, target)) == ['config.json', 'models/best_acc_model.pth', 'tables/val_log.csv']
+    assert read(os.path.join(target, 'models', 'best_acc_model.pth')) == 'x' * 1000
+    assert os.path.exists(os.path.join(target, MANIFEST_FILENAME))
+
+    #大小与mtime相同的文件不再下载;
+    CountingBackend.reset()
+    assert sync.download_dir(legacy, target) == []
+    write(os.path.join(legacy, 'tables', 'val_log.csv'), 'epoch,NDCG@10\n0,0.1\n1,0.2\n')
+    assert sync.download_dir(legacy, target) == ['tables/val_log.csv']
+    assert CountingBackend.gets == [legacy + '/tables/val_log.csv']
+    assert read(os.path.join(target, 'tables', 'val_log.csv')).endswith('1,0.2\n')
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from meantime.trainers.utils import UniformSample_vectorized, UniformSample_vectorized_v2, UniformSample_vectorized_KGE, \
+    UniformSample_vectorized_DisMulti
+
+NUM_USERS, NUM_ITEMS, NUM_TRIPLES = 20, 15, 60
+
+
+def bpr_dataset():
+    rng = np.random.default_rng(0)
+    allPos = [sorted(set(rng.integers(0, NUM_ITEMS, rng.integers(0, 6)).tolist())) for _ in range(NUM_USERS)]
+    allNeg = [sorted(set(range(NUM_ITEMS)) - set(pos)) for pos in allPos]
+    return SimpleNamespace(n_users=NUM_USERS, m_items=NUM_ITEMS, trainDataSize=sum(len(pos) for pos in allPos), allPos=allPos, allNeg=allNeg)
+
+
+def kg_dataset():
+    """
+    few tails per (head, rel), so that most corrupted tails collide with a triple at the first draw;
+    """
+    rng = np.random.default_rng(1)
+    triples = sorted(set(zip(rng.integers(0, NUM_USERS, NUM_TRIPLES).tolist(), rng.integers(1, 4, NUM_TRIPLES).tolist(),
+                             rng.integers(1, 6, NUM_TRIPLES).tolist())))
+    heads, rels, tails = [list(x) for x in zip(*triples)]
+    return SimpleNamespace(all_head_list=heads, all_rel_list=rels, all_tail_list=tails, attribute2id={str(i): i for i in range(1, 6)},
+                           item2id={str(i): i for i in range(1, 6)}, relvalue2reltype={1: 0, 2: 0, 3: 1}), set(triples)
+
+
+@pytest.mark.parametrize('sample_fn', [UniformSample_vectorized, UniformSample_vectorized_v2])
+def test_bpr_triples_are_valid(sample_fn):
+    dataset = bpr_dataset()
+    users, pos, neg = [x.numpy() for x in sample_fn(dataset, rng=np.random.RandomState(0))]
+    #没有正样本的user被丢弃, 其余每次抽取得到一个三元组;
+    assert 0 < len(users) <= dataset.trainDataSize and len(pos) == len(neg) == len(users)
+    assert all(len(dataset.allPos[u]) > 0 for u in users)
+    assert all(p in dataset.allPos[u] for u, p in zip(users, pos))
+    assert all(n not in dataset.allPos[u] and 0 <= n < NUM_ITEMS for u, n in zip(users, neg))
+
+
+@pytest.mark.parametrize('sample_fn', [UniformSample_vectorized_KGE, UniformSample_vectorized_DisMulti])
+def test_kg_triples_are_valid(sample_fn):
+    dataset, triples = kg_dataset()
+    S = [x.numpy() for x in sample_fn(dataset, rng=np.random.RandomState(0))]
+    assert all(len(x) == len(dataset.all_head_list) for x in S)
+    if sample_fn is UniformSample_vectorized_DisMulti:
+        heads, rel_types, rels, pos, neg = S
+        assert all(dataset.relvalue2reltype[r] == t for r, t in zip(rels, rel_types))
+    else:
+        heads, rels, pos, neg = S
+    assert all((h, r, t) in triples for h, r, t in zip(heads, rels, pos))
+    assert all((h, r, t) not in triples and 0 <= t < 6 for h, r, t in zip(heads, rels, neg))
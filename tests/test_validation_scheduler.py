@@ -0,0 +1,107 @@
+import os
+
+import pytest
+import torch
+import torch.nn as nn
+import torch.utils.data as data_utils
+from dotmap import DotMap
+
+from graph_harness import Loader
+from meantime.config import BEST_STATE_DICT_FILENAME, RECENT_STATE_DICT_FILENAME, STATE_DICT_KEY, STEPS_DICT_KEY
+from meantime.options.training_parser import TrainingParser
+from meantime.trainers.sas import SASTrainer
+
+NUM_ITEMS, DIM, NUM_VAL, NUM_CANDIDATES = 50, 8, 40, 6
+
+
+class ItemModel(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.emb = nn.Embedding(NUM_ITEMS, DIM)
+
+    def forward(self, batch):
+        h = self.emb(batch['tokens'])
+        if 'target' in batch:
+            loss = nn.functional.cross_entropy(h @ self.emb.weight.t(), batch['target'], reduction='none')
+            return {'loss': loss, 'loss_cnt': torch.ones_like(loss)}
+        return {'scores': (h[:, None, :] * self.emb(batch['candidates'])).sum(-1)}
+
+
+class ValDataset(data_utils.Dataset):
+    def __init__(self):
+        g = torch.Generator().manual_seed(2)
+        self.tokens = torch.randint(0, NUM_ITEMS, (NUM_VAL,), generator=g)
+        self.candidates = torch.randint(0, NUM_ITEMS, (NUM_VAL, NUM_CANDIDATES), generator=g)
+        self.candidates[:, 0] = (self.tokens + 1) % NUM_ITEMS
+        self.labels = torch.zeros(NUM_VAL, NUM_CANDIDATES, dtype=torch.long)
+        self.labels[:, 0] = 1
+
+    def __len__(self):
+        return NUM_VAL
+
+    def __getitem__(self, index):
+        return {'tokens': self.tokens[index], 'candidates': self.candidates[index], 'labels': self.labels[index]}
+
+
+def make_trainer(root, **kwargs):
+    conf = TrainingParser([]).parse()
+    conf.update(device='cpu', use_parallel=False, optimizer='Adam', lr=0.05, weight_decay=0., adam_beta1=0.9, adam_beta2=0.999,
+                decay_step=1, gamma=1., clip_grad_norm=None, num_epochs=6, metric_ks=[5], best_metric='NDCG@5', pilot=False,
+                model_init_seed=0, log_period_as_iter=10 ** 9, resume_training=False, finetune_flag=True, train_batch_size=8,
+                val_confirm_top=3, val_max_every=4)
+    conf.update(kwargs)
+    torch.manual_seed(0)
+    g = torch.Generator().manual_seed(1)
+    train_batches = []
+    for _ in range(5):
+        tokens = torch.randint(0, NUM_ITEMS, (8,), generator=g)
+        train_batches.append({'tokens': tokens, 'target': (tokens + 1) % NUM_ITEMS})
+    val_loader = data_utils.DataLoader(ValDataset(), batch_size=4)
+    trainer = SASTrainer(DotMap(conf, _dynamic=False), ItemModel(), Loader(train_batches), val_loader, val_loader, root)
+
+    trainer.logged_val = []
+    log_val = trainer.logger_service.log_val
+
+    def record(log_data):
+        trainer.logged_val.append({k: v for k, v in log_data.items() if k != 'state_dict'})
+        log_val(log_data)
+    trainer.logger_service.log_val = record
+    return trainer
+
+
+def test_subsample_validation_confirms_best_on_full_set(tmp_path):
+    trainer = make_trainer(str(tmp_path), val_subsample=8)
+    trainer.train()
+
+    assert [log['epoch'] for log in trainer.logged_val] == list(range(6))
+    assert all(log['num_eval_instance'] == 8 and 'NDCG@5_ci' in log for log in trainer.logged_val)
+    subsample_best_epoch = max(trainer.logged_val, key=lambda log: log['NDCG@5'])['epoch']
+
+    #候选epoch在完整验证集上重新打分, 最优者写入best模型;
+    final = trainer._validation_snapshot()
+    full_scores = {}
+    for candidate in trainer.val_scheduler.candidates():
+        trainer._load_validation_snapshot(candidate['snapshot'])
+        full_scores[candidate['epoch']] = trainer.validate(candidate['epoch'], 0, mode='val', doLog=False)['NDCG@5']
+    best = torch.load(os.path.join(str(tmp_path), 'models', BEST_STATE_DICT_FILENAME + '_finetune_best'))
+    best_epoch = max(full_scores, key=full_scores.get)
+    assert best[STEPS_DICT_KEY][0] == best_epoch != subsample_best_epoch #子集上的最优epoch被完整验证集推翻;
+    best_snapshot = next(c['snapshot'] for c in trainer.val_scheduler.candidates() if c['epoch'] == best_epoch)
+    assert torch.equal(best[STATE_DICT_KEY]['emb.weight'], best_snapshot['model']['emb.weight'])
+    #重新打分后模型恢复为最后一个epoch的状态, 保存为.final;
+    last = torch.load(os.path.join(str(tmp_path), 'models', RECENT_STATE_DICT_FILENAME + '_finetune.final'))
+    assert torch.equal(last[STATE_DICT_KEY]['emb.weight'], final['model']['emb.weight'])
+    assert last[STEPS_DICT_KEY][0] == 5
+
+
+@pytest.mark.parametrize('val_subsample', [None, 0.5])
+def test_adaptive_validation_keeps_first_and_last_epoch(tmp_path, val_subsample):
+    trainer = make_trainer(str(tmp_path), num_epochs=12, val_adaptive=True, val_subsample=val_subsample)
+    trainer.train()
+
+    validated = [log['epoch'] for log in trainer.logged_val]
+    assert validated[0] == 0 and validated[-1] == 11
+    #两次验证之间的间隔不超过val_max_every;
+    assert all(0 < b - a <= 4 for a, b in zip(validated, validated[1:]))
+    expected_instances = NUM_VAL // 2 if val_subsample else NUM_VAL
+    assert all(log['num_eval_instance'] == expected_instances for log in trainer.logged_val)